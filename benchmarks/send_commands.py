@@ -0,0 +1,71 @@
+"""
+measure how long send_commands takes to run show commands over a link with a round trip latency,
+compared to detecting the prompt before every command like it used to.
+
+usage - python -m benchmarks.send_commands [--commands 50] [--latency 0.05]
+"""
+import argparse
+import re
+import time
+
+from networkcommander.device_executer import send_commands
+
+
+class LatencyDevice:
+    """
+    a fake netmiko session where every round trip to the device takes latency seconds.
+    send_command without an expect_string detects the prompt first, like netmiko does.
+    """
+    base_prompt = "r1"
+
+    def __init__(self, latency: float):
+        self._latency = latency
+        self.round_trips = 0
+
+    def find_prompt(self) -> str:
+        self._round_trip()
+        return "r1#"
+
+    def send_command(self, command: str, expect_string: str = None) -> str:
+        if expect_string is None:
+            expect_string = re.escape(self.find_prompt())
+        self._round_trip()
+        return f"output of {command}"
+
+    def _round_trip(self):
+        self.round_trips += 1
+        time.sleep(self._latency)
+
+
+def send_commands_detecting_every_prompt(device, commands):
+    output = ""
+    for command in commands:
+        output += device.find_prompt()
+        output += command
+        output += '\n'
+        output += device.send_command(command)
+        output += '\n'
+    return output
+
+
+def measure(send, commands, latency):
+    device = LatencyDevice(latency)
+    started_at = time.perf_counter()
+    send(device, commands)
+    return time.perf_counter() - started_at, device.round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--commands", type=int, default=50, help="the amount of show commands to send")
+    parser.add_argument("--latency", type=float, default=0.05, help="the round trip latency in seconds")
+    arguments = parser.parse_args()
+    commands = [f"show interface {index}" for index in range(arguments.commands)]
+
+    for name, send in (("prompt per command", send_commands_detecting_every_prompt), ("learned prompt", send_commands)):
+        runtime, round_trips = measure(send, commands, arguments.latency)
+        print(f"{name:<20} {runtime:6.2f}s {round_trips:5} round trips")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+measure how long a whole netmiko session (login, session preparation, a show command and logout)
+takes with every tuning profile, against a local ssh server that acts like a cisco_ios router.
+
+usage - python -m benchmarks.session_profiles [--sessions 5] [--latency 0.01]
+"""
+import argparse
+import logging
+import socket
+import threading
+import time
+
+import paramiko
+
+from networkcommander.config import config
+from networkcommander.device import Device
+from networkcommander.device_executer import execute_commands, PermissionLevel
+
+PROMPT = "r1#"
+REPLIES = {
+    "show version": "Cisco IOS Software, Version 15.2(4)M7\r\nr1 uptime is 5 weeks",
+}
+
+
+class RouterServer(paramiko.ServerInterface):
+    """
+    an ssh server that lets everyone in and gives them a shell.
+    """
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        return True
+
+
+def run_shell(channel: paramiko.Channel, latency: float) -> None:
+    """
+    answer every line like a cisco_ios router in enable mode, latency seconds after it arrived.
+    """
+    channel.sendall(f"\r\n{PROMPT}")
+    buffer = ""
+    while True:
+        data = channel.recv(4096)
+        if not data:
+            return
+        buffer += data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            command = line.strip()
+            if command == "exit":
+                channel.close()
+                return
+            time.sleep(latency)
+            reply = REPLIES.get(command, "")
+            channel.sendall(f"{command}\r\n{reply}\r\n{PROMPT}" if reply else f"{command}\r\n{PROMPT}")
+
+
+def serve(server: socket.socket, host_key: paramiko.PKey, latency: float) -> None:
+    while True:
+        try:
+            connection, _ = server.accept()
+        except OSError:
+            return
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(host_key)
+        transport.start_server(server=RouterServer())
+
+        def accept_shell(transport=transport):
+            channel = transport.accept(10)
+            if channel is not None:
+                run_shell(channel, latency)
+
+        threading.Thread(target=accept_shell, daemon=True).start()
+
+
+def measure(device: Device, sessions: int) -> float:
+    """
+    :return: the average amount of seconds a session took.
+    """
+    started_at = time.perf_counter()
+    for _ in range(sessions):
+        execute_commands(device.device_options, ["show version"], PermissionLevel.ENABLE)
+    return (time.perf_counter() - started_at) / sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=5, help="the amount of sessions to run with every profile")
+    parser.add_argument("--latency", type=float, default=0.01, help="the amount of seconds the router takes to answer")
+    arguments = parser.parse_args()
+    # the router drops the connection on exit, paramiko would log every reset.
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    host_key = paramiko.RSAKey.generate(2048)
+    threading.Thread(target=serve, args=(server, host_key, arguments.latency), daemon=True).start()
+    port = str(server.getsockname()[1])
+
+    baseline = None
+    for profile_name in [None, *config["tuning_profiles"]]:
+        optional_parameters = {"port": port}
+        if profile_name is None:
+            # an empty profile name falls back to the profile of the device type, so the defaults are set explicitly.
+            config["device_type_profiles"] = {}
+        else:
+            optional_parameters["tuning_profile"] = profile_name
+        device = Device("r1", "admin", "admin", "127.0.0.1", "cisco_ios", optional_parameters)
+        runtime = measure(device, arguments.sessions)
+        if baseline is None:
+            baseline = runtime
+        name = profile_name or "netmiko defaults"
+        print(f"{name:<20} {runtime:6.2f}s per session {baseline - runtime:+6.2f}s saved")
+    server.close()
+
+
+if __name__ == "__main__":
+    main()
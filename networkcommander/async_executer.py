@@ -0,0 +1,238 @@
+import asyncio
+import re
+from typing import List, Optional, Pattern
+
+import asyncssh
+import netmiko
+
+from networkcommander.device_executer import PermissionLevel, PERMISSION_LEVEL_ORDER, CISCO_LIKE_PROMPT, \
+    CONNECT_TIMEOUT_DEFAULTS, permission_level_from_prompt
+from networkcommander.output_sink import OutputSink
+
+SSH_PORT = 22
+
+# the ssh device types the asyncio engine can drive, they all show a cisco like prompt and accept 'terminal length 0'.
+ASYNC_DEVICE_TYPE = re.compile(r"^(cisco_(ios|xe|xr|nxos)|arista_eos)$")
+
+# the amount of characters read from the session at once.
+READ_SIZE = 65536
+
+# the command that moves the session one permission level up, or down, from the level it is in.
+PERMISSION_LEVEL_UP_COMMANDS = {
+    PermissionLevel.USER: "enable",
+    PermissionLevel.ENABLE: "configure terminal",
+}
+PERMISSION_LEVEL_DOWN_COMMANDS = {
+    PermissionLevel.CONFIGURE_TERMINAL: "end",
+    PermissionLevel.ENABLE: "disable",
+}
+
+# the line a device shows when it asks for the enable secret.
+PASSWORD_PROMPT = re.compile(r"^[Pp]assword:$")
+
+
+def can_run_async(device_options: dict) -> bool:
+    """
+    :param device_options: the netmiko connection arguments of the device.
+    :return: True if an AsyncSession can reach the device, it has to be a cisco like ssh device without a jump host.
+    """
+    return ASYNC_DEVICE_TYPE.match(str(device_options["device_type"])) is not None and \
+        not device_options.get("jump_host")
+
+
+def get_prompt_pattern(prompt: str) -> Pattern:
+    """
+    :param prompt: a cisco like prompt of the device, like 'r1>' or 'r1(config)#'.
+    :return: a pattern that matches the prompt of the device in every mode.
+    """
+    match = CISCO_LIKE_PROMPT.match(prompt)
+    hostname = prompt[:match.start("config") if match.group("config") else match.start("terminator")]
+    return re.compile(rf"^{re.escape(hostname)}(\([^)]*\))?[>#]$")
+
+
+class AsyncSession:
+    """
+    A cli session to a cisco like device over asyncssh, a coroutine waiting on its socket instead of a thread
+    blocked on it, so a single event loop can run thousands of them at once.
+    cancelling the coroutine that uses the session closes it on the way out.
+
+    async with AsyncSession(device.device_options) as session:
+        output = await session.run_commands(["show clock"], PermissionLevel.USER)
+    """
+
+    def __init__(self, device_options: dict, read_timeout: float = 10.0):
+        """
+        :param device_options: the netmiko connection arguments of the device.
+        :param read_timeout: the amount of seconds to wait for new output before giving up.
+        """
+        self.device_options = device_options
+        self.read_timeout = read_timeout
+        # the prompt the session shows right now.
+        self.prompt = ""
+        self._host = device_options["host"]
+        self._prompt_pattern = CISCO_LIKE_PROMPT
+        self._connection: Optional[asyncssh.SSHClientConnection] = None
+        self._process: Optional[asyncssh.SSHClientProcess] = None
+
+    async def __aenter__(self) -> "AsyncSession":
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def open(self) -> None:
+        """
+        log in, open an interactive shell and turn off paging.
+        the whole login is bounded by the netmiko connect timeouts of the device together.
+
+        :raises: ValueError if the device can't run on the asyncio engine, see can_run_async.
+        :raises: netmiko.NetmikoTimeoutException if the device didn't let the session log in in time.
+        :raises: netmiko.NetmikoAuthenticationException if the device rejected the credentials.
+        """
+        if not can_run_async(self.device_options):
+            raise ValueError(
+                f"{self._host} is a {self.device_options['device_type']} device, the asyncio engine only "
+                "runs ssh sessions to cisco like devices without a jump host"
+            )
+        connect_timeout = sum(
+            float(self.device_options.get(argument, default_timeout))
+            for argument, default_timeout in CONNECT_TIMEOUT_DEFAULTS.items()
+        )
+        try:
+            # like netmiko, the host key isn't checked and only the password is used to log in.
+            self._connection = await asyncssh.connect(
+                self._host,
+                port=int(self.device_options.get("port") or SSH_PORT),
+                username=self.device_options["username"],
+                password=self.device_options["password"],
+                known_hosts=None,
+                client_keys=None,
+                agent_path=None,
+                connect_timeout=connect_timeout
+            )
+        except asyncio.TimeoutError:
+            raise netmiko.NetmikoTimeoutException(
+                f"{self._host} didn't let the session log in within {connect_timeout} seconds"
+            ) from None
+        except asyncssh.PermissionDenied as error:
+            raise netmiko.NetmikoAuthenticationException(f"{self._host} rejected the credentials: {error}") from None
+
+        try:
+            self._process = await self._connection.create_process(term_type="vt100")
+            await self._read_until(CISCO_LIKE_PROMPT)
+            # the banner can end with a line that looks like a prompt, the device answers an empty line with its prompt.
+            self._process.stdin.write("\n")
+            self.prompt = (await self._read_until(CISCO_LIKE_PROMPT)).rsplit("\n", 1)[-1].strip()
+            self._prompt_pattern = get_prompt_pattern(self.prompt)
+            await self.send_command("terminal length 0")
+        except BaseException:
+            await self.close()
+            raise
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            connection.close()
+            await connection.wait_closed()
+
+    async def run_commands(
+            self,
+            commands: List[str],
+            permission_level: PermissionLevel,
+            output_sink: Optional[OutputSink] = None
+    ) -> str:
+        """
+        Run commands with a specified permission level, like device_executer.run_commands.
+
+        :param commands: List of commands to execute.
+        :param permission_level: PermissionLevel enum representing the desired permission level.
+        :param output_sink: if given the output of every command is written to it once the command is done.
+        :return: Output generated by executing the commands, an empty string if it went to the output sink.
+        """
+        permission_level = PermissionLevel(permission_level)
+        await self.change_permission(permission_level)
+        output = ""
+        if permission_level == PermissionLevel.CONFIGURE_TERMINAL:
+            output = self.prompt
+        for command in commands:
+            if permission_level == PermissionLevel.CONFIGURE_TERMINAL:
+                # like send_config_set, the echo and the prompt after every command are kept.
+                command_output = await self._send(command, self._prompt_pattern)
+            else:
+                prompt = self.prompt
+                command_output = f"{prompt}{command}\n{await self.send_command(command)}\n"
+            if output_sink is None:
+                output += command_output
+            else:
+                output_sink.write(output + command_output)
+                output = ""
+        return output
+
+    async def change_permission(self, permission_level: PermissionLevel) -> None:
+        """
+        move the session one level at a time to the desired permission level, the prompt tells where it is.
+
+        :raises: ValueError if the device didn't move to the next level.
+        """
+        target_index = PERMISSION_LEVEL_ORDER.index(PermissionLevel(permission_level))
+        while True:
+            current_level = permission_level_from_prompt(self.prompt)
+            if current_level is None:
+                raise ValueError(f"the prompt {self.prompt!r} of {self._host} doesn't tell its permission level")
+            current_index = PERMISSION_LEVEL_ORDER.index(current_level)
+            if current_index == target_index:
+                return
+            if current_index > target_index:
+                await self.send_command(PERMISSION_LEVEL_DOWN_COMMANDS[current_level])
+            elif current_level == PermissionLevel.USER:
+                output = await self._send(
+                    PERMISSION_LEVEL_UP_COMMANDS[current_level], self._prompt_pattern, PASSWORD_PROMPT
+                )
+                if PASSWORD_PROMPT.match(output.rsplit("\n", 1)[-1].strip()):
+                    await self._send(self.device_options.get("secret", ""), self._prompt_pattern)
+            else:
+                await self.send_command(PERMISSION_LEVEL_UP_COMMANDS[current_level])
+            if permission_level_from_prompt(self.prompt) == current_level:
+                raise ValueError(f"{self._host} didn't leave the {current_level.value} permission level")
+
+    async def send_command(self, command: str) -> str:
+        """
+        :param command: the command to send, the device has to show its prompt once it is done.
+        :return: the output of the command, without its echo and the prompt after it.
+        """
+        lines = (await self._send(command, self._prompt_pattern)).split("\n")
+        return "\n".join(lines[1:-1])
+
+    async def _send(self, command: str, *patterns: Pattern) -> str:
+        """
+        :return: everything the device sent after the command, until its last line matched one of the patterns.
+        """
+        self._process.stdin.write(command + "\n")
+        output = await self._read_until(*patterns)
+        last_line = output.rsplit("\n", 1)[-1].strip()
+        if self._prompt_pattern.match(last_line):
+            self.prompt = last_line
+        return output
+
+    async def _read_until(self, *patterns: Pattern) -> str:
+        """
+        :return: the output of the device with its line feeds normalized,
+            until its last line matched one of the patterns.
+        :raises: netmiko.ReadTimeout if the device stops sending output before that.
+        :raises: EOFError if the device closed the session.
+        """
+        output = ""
+        while True:
+            try:
+                data = await asyncio.wait_for(self._process.stdout.read(READ_SIZE), self.read_timeout)
+            except asyncio.TimeoutError:
+                raise netmiko.ReadTimeout(
+                    f"{self._host} didn't show its prompt within {self.read_timeout} seconds"
+                ) from None
+            if not data:
+                raise EOFError(f"{self._host} closed the session")
+            output += data.replace("\r", "")
+            last_line = output.rsplit("\n", 1)[-1].strip()
+            if any(pattern.match(last_line) for pattern in patterns):
+                return output
@@ -0,0 +1,149 @@
+import collections
+from typing import Optional, Dict, FrozenSet, Iterable
+
+from networkcommander.config import config
+
+
+class StaticLimiter:
+    """
+    A concurrency limiter that always allows the same amount of sessions.
+    """
+
+    def __init__(self, limit: int):
+        """
+        :param limit: the amount of sessions that can run at once.
+        """
+        self.limit = limit
+        self.max_limit = limit
+
+    def record(self, started_at: float, latency: float, failed: bool) -> None:
+        """
+        a static limiter ignores the results of the sessions.
+        """
+
+
+class AIMDLimiter:
+    """
+    An additive increase / multiplicative decrease concurrency limiter.
+
+    every session that logs in in time raises the limit by one, and every session that
+    failed to connect or took longer than latency_tolerance times the fastest login seen so far
+    cuts the limit by decrease_factor.
+    sessions that started before the last cut don't cut it again, they were started under the old limit.
+    """
+
+    def __init__(
+            self,
+            initial_limit: int,
+            min_limit: int,
+            max_limit: int,
+            latency_tolerance: float = 2.0,
+            decrease_factor: float = 0.5
+    ):
+        """
+        :param initial_limit: the amount of sessions allowed before any session finished.
+        :param min_limit: the limit will never drop below this value.
+        :param max_limit: the limit will never grow above this value.
+        :param latency_tolerance: how many times slower than the fastest session a session can be before backing off.
+        :param decrease_factor: the limit is multiplied by this value when backing off.
+        """
+        if not 0 < min_limit <= max_limit:
+            raise ValueError(f"the limits must satisfy 0 < {min_limit=} <= {max_limit=}")
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._latency_tolerance = latency_tolerance
+        self._decrease_factor = decrease_factor
+        self._baseline_latency: Optional[float] = None
+        self._last_decrease: Optional[float] = None
+
+    @classmethod
+    def from_config(cls) -> "AIMDLimiter":
+        """
+        create a limiter from the "min_worker" and "max_worker" config values.
+        """
+        return cls(config["min_worker"], config["min_worker"], config["max_worker"])
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def record(self, started_at: float, latency: float, failed: bool) -> None:
+        """
+        adjust the limit according to a finished session.
+
+        :param started_at: the time.monotonic() value of when the session started.
+        :param latency: how many seconds the session took to log in.
+        :param failed: True if the session couldn't connect.
+        """
+        if not failed and (self._baseline_latency is None or latency < self._baseline_latency):
+            self._baseline_latency = latency
+
+        is_slow = self._baseline_latency is not None and latency > self._baseline_latency * self._latency_tolerance
+        if not failed and not is_slow:
+            self._limit = min(self._limit + 1, self.max_limit)
+            return
+
+        if self._last_decrease is not None and started_at < self._last_decrease:
+            return
+        self._limit = max(self._limit * self._decrease_factor, self.min_limit)
+        self._last_decrease = started_at + latency
+
+
+class TagGroupLimiter:
+    """
+    Concurrency and new connection rate limits per device tag.
+
+    every limited tag is a group, for example {"site:ams": {"max_sessions": 10, "connections_per_second": 2}}
+    allows at most 10 sessions to devices tagged with site:ams and opens at most 2 of them every second.
+    a device with several limited tags has to fit in every one of its groups.
+    """
+
+    def __init__(self, groups: Dict[str, Dict[str, float]]):
+        """
+        :param groups: the limits of every tag, both "max_sessions" and "connections_per_second" are optional.
+        """
+        self._max_sessions = {
+            tag: limits["max_sessions"] for tag, limits in groups.items() if limits.get("max_sessions")
+        }
+        self._start_interval = {
+            tag: 1 / limits["connections_per_second"]
+            for tag, limits in groups.items() if limits.get("connections_per_second")
+        }
+        self._running = collections.Counter()
+        self._next_start: Dict[str, float] = {}
+
+    @classmethod
+    def from_config(cls) -> "TagGroupLimiter":
+        return cls(config["concurrency_groups"])
+
+    def limited_tags(self, tags: Iterable[str]) -> FrozenSet[str]:
+        """
+        :param tags: the tags of a device.
+        :return: the tags that have limits.
+        """
+        return frozenset(tag for tag in tags if tag in self._max_sessions or tag in self._start_interval)
+
+    def start_delay(self, limited_tags: FrozenSet[str], now: float) -> Optional[float]:
+        """
+        :param limited_tags: the limited tags of a device.
+        :param now: the current time.monotonic() value.
+        :return: 0 if the device can start now, the amount of seconds until the rate limit allows it,
+            or None if one of its groups is full and a session has to finish first.
+        """
+        delay = 0.0
+        for tag in limited_tags:
+            if tag in self._max_sessions and self._running[tag] >= self._max_sessions[tag]:
+                return None
+            delay = max(delay, self._next_start.get(tag, now) - now)
+        return delay
+
+    def started(self, limited_tags: FrozenSet[str], now: float) -> None:
+        for tag in limited_tags:
+            self._running[tag] += 1
+            if tag in self._start_interval:
+                self._next_start[tag] = max(self._next_start.get(tag, now), now) + self._start_interval[tag]
+
+    def finished(self, limited_tags: FrozenSet[str]) -> None:
+        for tag in limited_tags:
+            self._running[tag] -= 1
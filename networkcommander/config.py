@@ -4,11 +4,76 @@ HOME_FOLDER = os.path.expanduser("~")
 COMMANDER_FOLDER = os.path.join(HOME_FOLDER, '.commander')
 USER_CONFIG_FILE = os.path.join(COMMANDER_FOLDER, ".commanderconfig")
 DEFAULT_KEEPASS_DB_PATH = os.path.join(COMMANDER_FOLDER, 'db.kdbx')
+DEFAULT_SQLITE_DB_PATH = os.path.join(COMMANDER_FOLDER, 'inventory.sqlite')
+DEFAULT_RESULT_CACHE_FOLDER = os.path.join(COMMANDER_FOLDER, 'cache')
+DEFAULT_JOURNAL_FOLDER = os.path.join(COMMANDER_FOLDER, 'runs')
+DEFAULT_HEALTH_FILE = os.path.join(COMMANDER_FOLDER, 'health.json')
+DEFAULT_SESSION_DAEMON_SOCKET = os.path.join(COMMANDER_FOLDER, 'sessions.sock')
+DEFAULT_KEEPASS_AGENT_SOCKET = os.path.join(COMMANDER_FOLDER, 'keepass-agent.sock')
 config = {
     "commander_directory": COMMANDER_FOLDER,
+    "inventory_backend": "keepass",
     'keepass_db_path': DEFAULT_KEEPASS_DB_PATH,
+    "sqlite_db_path": DEFAULT_SQLITE_DB_PATH,
+    "use_keepass_agent": True,
+    "keepass_agent_socket": DEFAULT_KEEPASS_AGENT_SOCKET,
+    "keepass_agent_lifetime": 900,
     "max_worker": 60,
+    "min_worker": 4,
+    "adaptive_concurrency": False,
+    "concurrency_groups": {},
+    "tcp_probe": False,
+    "tcp_probe_timeout": 3,
+    "tcp_probe_concurrency": 1000,
+    "ping_timeout": 10,
+    "jump_hosts": {},
+    "jump_host_timeout": 10,
+    "jump_host_key_file": "",
+    "jump_host_password": "",
+    "journal_directory": DEFAULT_JOURNAL_FOLDER,
+    "rollout_waves": [],
+    "rollout_error_threshold": "0",
+    "device_time_budget": 0,
+    "run_deadline": 0,
+    "retries": 0,
+    "retry_backoff": 1,
+    "retry_max_backoff": 30,
+    "circuit_breaker": "off",
+    "circuit_breaker_threshold": 3,
+    "circuit_breaker_cooldown": 900,
+    "health_file": DEFAULT_HEALTH_FILE,
+    "pipeline_commands": False,
+    "share_sessions": True,
+    "result_cache": False,
+    "result_cache_directory": DEFAULT_RESULT_CACHE_FOLDER,
+    "result_cache_ttl": 300,
+    "result_cache_max_size": 64 * 1024 * 1024,
+    "engine": "thread",
+    "max_async_sessions": 1000,
+    "max_processes": 0,
+    "use_session_daemon": False,
+    "session_daemon_socket": DEFAULT_SESSION_DAEMON_SOCKET,
+    "session_idle_timeout": 300,
     "default_device_type": "cisco_ios",
+    "tuning_profiles": {
+        "fast": {
+            "fast_cli": True,
+            "global_delay_factor": 0.05
+        },
+        "safe": {
+            "fast_cli": False,
+            "global_delay_factor": 2,
+            "conn_timeout": 30,
+            "banner_timeout": 30,
+            "auth_timeout": 30,
+            "blocking_timeout": 40
+        }
+    },
+    "device_type_profiles": {
+        "cisco_ios_telnet": "safe",
+        "hp_procurve": "safe",
+        "dell_powerconnect": "safe"
+    },
     "optional_parameters": {
         "ssh_strict": True,
         "system_host_keys": True
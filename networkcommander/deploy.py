@@ -1,16 +1,368 @@
+import asyncio
+import collections
 import concurrent.futures
-from typing import List, Iterable
+import dataclasses
+import multiprocessing
+import os
+import pickle
+import queue
+import time
+from enum import Enum
+from typing import List, Iterable, Iterator, Tuple, Optional, Callable, Union, Dict, FrozenSet, Any
 
+from networkcommander.async_executer import AsyncSession
+from networkcommander.concurrency import StaticLimiter, AIMDLimiter, TagGroupLimiter
 from networkcommander.config import config
 from networkcommander.device import Device
-from networkcommander.device_executer import execute_commands, PermissionLevel
+from networkcommander.device_executer import execute_commands, PermissionLevel, session_scope, abort_session, \
+    shared_sessions, get_session_key, CONNECT_TIMEOUT_DEFAULTS
+from networkcommander.health import HealthStore, CircuitBreakerMode, CircuitOpenError, is_transient, backoff_delay
+from networkcommander.output_sink import OutputSink, TeeOutputSink
+from networkcommander.probe import probe_devices
+from networkcommander.result_cache import ResultCache
+from networkcommander.session_daemon import daemon_executer, is_daemon_running
+
+DeployResult = Tuple[str, Device, Optional[BaseException]]
+# the amount of seconds a worker process gets after the run deadline to report its own timeouts.
+PROCESS_DEADLINE_GRACE = 5
+# the shortest connect timeout a session gets, even if its time is already up.
+MIN_CONNECT_TIMEOUT = 0.1
+Executer = Callable[..., str]
+OutputSinkFactory = Callable[[Device], OutputSink]
+# how many seconds a session took to log in (or to fail), and whether it failed with a transient connect error.
+ConnectPhase = Tuple[float, bool]
+
+
+class DeviceTimeoutError(TimeoutError):
+    """
+    reported for a device whose session ran out of its time budget, or that didn't finish before the run deadline.
+    """
+
+
+class ExecutionEngine(str, Enum):
+    """
+    Enum defining the engines deploy_commands can drive the device sessions with.
+    """
+    THREAD = "thread"
+    ASYNCIO = "asyncio"
+    PROCESS = "process"
+
+
+@dataclasses.dataclass(frozen=True, order=True)
+class SharedSession(Device):
+    """
+    inventory entries with the same connection arguments, like two names for the same router.
+    the engines run it as a single device, and the commands of every alias run in order over one session.
+    """
+    aliases: Tuple[Device, ...] = dataclasses.field(default=(), compare=False)
+
+    @classmethod
+    def from_aliases(cls, aliases: List[Device]) -> "SharedSession":
+        first_alias = aliases[0]
+        tags = tuple(sorted({tag for alias in aliases for tag in alias.tags}))
+        return cls(
+            ", ".join(alias.name for alias in aliases),
+            first_alias.username,
+            first_alias.password,
+            first_alias.host,
+            first_alias.device_type,
+            first_alias.optional_parameters,
+            tags,
+            tuple(aliases)
+        )
+
+
+class SharedSessionOutput(list):
+    """
+    the result of a SharedSession, the (output, exception) of every alias in order.
+    """
+
+
+@dataclasses.dataclass(frozen=True)
+class SessionRunner:
+    """
+    Runs the commands on a single device, every engine calls it once per device.
+    it has to stay picklable so the process engine can send it to its workers.
+    """
+    commands: List[str]
+    permission_level: PermissionLevel
+    # a function with the signature of device_executer.execute_commands, None means get_executer().
+    executer: Optional[Executer] = None
+    output_sink_factory: Optional[OutputSinkFactory] = None
+    # the amount of seconds a single session can run, None means no limit.
+    time_budget: Optional[float] = None
+    # the time.time() value the whole run has to finish by, None means no deadline.
+    deadline_at: Optional[float] = None
+    # if True the output that went to the output sink is returned as well, so it can be cached.
+    keep_output: bool = False
+
+    def with_executer(self) -> "SessionRunner":
+        """
+        :return: this runner with its executer resolved by get_executer() if it wasn't given.
+        """
+        if self.executer is not None:
+            return self
+        return dataclasses.replace(self, executer=get_executer())
+
+    def __call__(self, device: Device, connect_phases: Optional[Dict[int, ConnectPhase]] = None) -> str:
+        """
+        run the commands, and try again up to config["retries"] times with a jittered exponential backoff
+        if the device couldn't be reached.
+        only a failure to log in is retried, once a session logged in its commands may have reached the device
+        and sending them again could apply them twice. an aborted session, or one that ran out of time, isn't retried.
+
+        :param device: the device to run the commands on.
+        :param connect_phases: if given, the ConnectPhase of the last attempt is saved in it by the id of the device.
+        :return: the output of the commands, an empty string if it went to an output sink.
+        """
+        attempt = 0
+        started_at = time.monotonic()
+        # the engines abort the session of a device that ran out of time by the id of the device.
+        with session_scope(id(device)) as scope:
+            while True:
+                attempt_started_at = time.monotonic()
+                try:
+                    output = self.run_once(device, started_at)
+                except Exception as exception:
+                    retry = attempt < config["retries"] and is_transient(exception) and \
+                        not scope.is_connected and not scope.is_aborted
+                    delay = backoff_delay(attempt, config["retry_backoff"], config["retry_max_backoff"])
+                    time_left = self.time_left(started_at)
+                    if not retry or (time_left is not None and time_left <= delay):
+                        if connect_phases is not None:
+                            connect_phases[id(device)] = get_connect_phase(
+                                scope.connected_at, attempt_started_at, exception
+                            )
+                        raise
+                else:
+                    if connect_phases is not None:
+                        connect_phases[id(device)] = get_connect_phase(scope.connected_at, attempt_started_at)
+                    return output
+                time.sleep(delay)
+                attempt += 1
+
+    async def run_async(self, device: Device, connect_phases: Optional[Dict[int, ConnectPhase]] = None) -> str:
+        """
+        what __call__ does for the asyncio engine, the sessions are AsyncSessions and the backoff waits on the loop.
+        the engine cancels the coroutine of a device that ran out of time, which closes its session.
+
+        :param device: the device to run the commands on.
+        :param connect_phases: if given, the ConnectPhase of the last attempt is saved in it by the id of the device.
+        :return: the output of the commands, an empty string if it went to an output sink.
+        """
+        attempt = 0
+        started_at = time.monotonic()
+        # the time.monotonic() value of every login, once a session logged in the device isn't tried again.
+        connect_times: List[float] = []
+        while True:
+            attempt_started_at = time.monotonic()
+            try:
+                output = await self.run_once_async(device, connect_times)
+            except Exception as exception:
+                retry = attempt < config["retries"] and is_transient(exception) and not connect_times
+                delay = backoff_delay(attempt, config["retry_backoff"], config["retry_max_backoff"])
+                time_left = self.time_left(started_at)
+                if not retry or (time_left is not None and time_left <= delay):
+                    if connect_phases is not None:
+                        connect_phases[id(device)] = get_connect_phase(
+                            connect_times[0] if connect_times else None, attempt_started_at, exception
+                        )
+                    raise
+            else:
+                if connect_phases is not None:
+                    connect_phases[id(device)] = get_connect_phase(
+                        connect_times[0] if connect_times else None, attempt_started_at
+                    )
+                return output
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def run_once_async(self, device: Device, connect_times: List[float]) -> str:
+        """
+        :param connect_times: the time.monotonic() value of every login is appended to it.
+        """
+        if isinstance(device, SharedSession):
+            return await self.run_shared_session_async(device, connect_times)
+        async with AsyncSession(device.device_options) as session:
+            connect_times.append(time.monotonic())
+            return await self.run_device_async(device, session)
+
+    async def run_shared_session_async(
+            self,
+            shared_session: SharedSession,
+            connect_times: List[float]
+    ) -> SharedSessionOutput:
+        """
+        run the commands of every alias in order over a single AsyncSession, like run_shared_session.
+        the aliases after one that failed get a new session, its session isn't in a known state anymore.
+
+        :return: the (output, exception) of every alias.
+        """
+        outputs = SharedSessionOutput()
+        transient_exception = None
+        session = None
+        try:
+            for alias in shared_session.aliases:
+                if transient_exception is not None:
+                    outputs.append(("", transient_exception))
+                    continue
+                try:
+                    if session is None:
+                        session = AsyncSession(alias.device_options)
+                        await session.open()
+                        connect_times.append(time.monotonic())
+                    outputs.append((await self.run_device_async(alias, session), None))
+                except Exception as exception:
+                    if not outputs:
+                        raise
+                    await session.close()
+                    session = None
+                    if is_transient(exception):
+                        transient_exception = exception
+                    outputs.append(("", exception))
+        finally:
+            if session is not None:
+                await session.close()
+        return outputs
+
+    async def run_device_async(self, device: Device, session: AsyncSession) -> str:
+        if self.output_sink_factory is None:
+            return await session.run_commands(self.commands, self.permission_level)
+        output_sink = self.output_sink_factory(device)
+        if self.keep_output:
+            output_sink = TeeOutputSink(output_sink)
+        try:
+            output = await session.run_commands(self.commands, self.permission_level, output_sink)
+        finally:
+            output_sink.close()
+        return output_sink.getvalue() if self.keep_output else output
+
+    def time_left(self, started_at: Optional[float] = None) -> Optional[float]:
+        """
+        :param started_at: the time.monotonic() value of when the session started, None for the run itself.
+        :return: the amount of seconds until the session (or the run) runs out of time, None if it has no limit.
+        """
+        time_left = None
+        if self.deadline_at is not None:
+            time_left = self.deadline_at - time.time()
+        if started_at is not None and self.time_budget is not None:
+            budget_left = started_at + self.time_budget - time.monotonic()
+            time_left = budget_left if time_left is None else min(time_left, budget_left)
+        return time_left
+
+    def bound_connect_timeouts(self, device_options: dict, started_at: Optional[float] = None) -> dict:
+        """
+        a session that is still connecting can't be aborted, it has no transport to close yet,
+        so its connection, banner and authentication timeouts are cut to the time it has left when that is shorter.
+        that way no session outlives its time budget or the run deadline by more than a read.
+
+        :param device_options: the netmiko connection arguments of the device.
+        :param started_at: the time.monotonic() value of when the session started, None for the run deadline only.
+        :return: the connection arguments with the timeouts bounded, the same dict if there is no limit.
+        """
+        time_left = self.time_left(started_at)
+        if time_left is None:
+            return device_options
+        time_left = max(time_left, MIN_CONNECT_TIMEOUT)
+        bounded_options = dict(device_options)
+        for argument, default_timeout in CONNECT_TIMEOUT_DEFAULTS.items():
+            timeout = float(device_options.get(argument, default_timeout))
+            if time_left < timeout:
+                bounded_options[argument] = time_left
+        return bounded_options
+
+    def timeout_error(self, device: Device, started_at: Optional[float] = None) -> DeviceTimeoutError:
+        """
+        :return: the exception reported for a device that ran out of time.
+        """
+        if started_at is not None and self.time_budget is not None and \
+                time.monotonic() - started_at >= self.time_budget:
+            return DeviceTimeoutError(f"{device.name} didn't finish within its time budget of {self.time_budget} seconds")
+        if started_at is None:
+            return DeviceTimeoutError(f"the run deadline passed before {device.name} got a session")
+        return DeviceTimeoutError(f"the run deadline passed before {device.name} finished")
+
+    def run_once(self, device: Device, started_at: Optional[float] = None) -> str:
+        """
+        :param started_at: the time.monotonic() value of when the session started, it bounds the time to log in.
+        """
+        if isinstance(device, SharedSession):
+            return self.run_shared_session(device, started_at)
+        return self.run_device(device, started_at)
+
+    def run_shared_session(
+            self,
+            shared_session: SharedSession,
+            started_at: Optional[float] = None
+    ) -> SharedSessionOutput:
+        """
+        run the commands of every alias in order, the aliases after the first one reuse its session.
+        if the first alias can't connect the whole shared session fails, so it can be retried,
+        after that a transient error is reported for the alias it happened on and every alias after it.
+
+        :return: the (output, exception) of every alias.
+        """
+        outputs = SharedSessionOutput()
+        transient_exception = None
+        with shared_sessions():
+            for alias in shared_session.aliases:
+                if transient_exception is not None:
+                    outputs.append(("", transient_exception))
+                    continue
+                try:
+                    outputs.append((self.run_device(alias, started_at), None))
+                except Exception as exception:
+                    if not outputs:
+                        raise
+                    if is_transient(exception):
+                        transient_exception = _make_picklable(exception)
+                    outputs.append(("", _make_picklable(exception)))
+        return outputs
+
+    def run_device(self, device: Device, started_at: Optional[float] = None) -> str:
+        device_options = self.bound_connect_timeouts(device.device_options, started_at)
+        if self.output_sink_factory is None:
+            return self.executer(device_options, self.commands, self.permission_level)
+        output_sink = self.output_sink_factory(device)
+        if self.keep_output:
+            output_sink = TeeOutputSink(output_sink)
+        try:
+            output = self.executer(device_options, self.commands, self.permission_level, output_sink)
+        finally:
+            output_sink.close()
+        return output_sink.getvalue() if self.keep_output else output
+
+
+def get_connect_phase(
+        connected_at: Optional[float],
+        attempt_started_at: float,
+        exception: Optional[BaseException] = None
+) -> ConnectPhase:
+    """
+    :param connected_at: the time.monotonic() value of when the session logged in, None if it never did.
+    :param attempt_started_at: the time.monotonic() value of when the attempt started.
+    :param exception: the exception the attempt raised, None if it succeeded.
+    :return: the ConnectPhase of the attempt, an executer that never reports its login is timed as a whole.
+    """
+    if connected_at is not None:
+        return max(connected_at - attempt_started_at, 0), False
+    return time.monotonic() - attempt_started_at, exception is not None and is_transient(exception)
 
 
 def deploy_commands(
         commands: List[str],
         devices: Iterable[Device],
-        permission_level: PermissionLevel
-):
+        permission_level: PermissionLevel,
+        engine: Optional[ExecutionEngine] = None,
+        limiter: Optional[Union[StaticLimiter, AIMDLimiter]] = None,
+        probe: Optional[bool] = None,
+        executer: Optional[Executer] = None,
+        output_sink_factory: Optional[OutputSinkFactory] = None,
+        result_cache: Optional[ResultCache] = None,
+        health_store: Optional[HealthStore] = None,
+        time_budget: Optional[float] = None,
+        deadline: Optional[float] = None
+) -> Iterator[DeployResult]:
     """
     deploy a list of commands to a list of devices
     simultaneously at a designated permission level.
@@ -18,26 +370,681 @@ def deploy_commands(
     :param commands: List of commands to execute.
     :param devices: a collection of devices to push the commands to.
     :param permission_level: PermissionLevel enum representing the desired permission level.
+    :param engine: the ExecutionEngine that runs the sessions, defaults to config["engine"].
+        the asyncio engine runs its own AsyncSessions, so it can't take an executer.
+    :param limiter: decides how many sessions run at once (for example an AIMDLimiter),
+        defaults to the static limit of the engine.
+    :param probe: if True every device is probed with a plain tcp connection first, and only the
+        reachable ones get a session. defaults to config["tcp_probe"].
+    :param executer: the function that runs the commands on a single device (for example a ping),
+        defaults to get_executer(). it must be a module level function to cross into the process engine.
+    :param output_sink_factory: creates an OutputSink for every device, the output of the device is
+        written to it while it arrives and the yielded result is empty. it has to be picklable for the process engine.
+    :param result_cache: if given, devices whose output of every command is cached are served from it without
+        a session, and the output of read only commands is saved to it. the cached results are CachedOutput.
+    :param health_store: if given, the outcome of every session is recorded in it, and the devices whose circuit
+        breaker is open are deferred or skipped according to config["circuit_breaker"].
+    :param time_budget: the amount of seconds a single device can take, defaults to config["device_time_budget"].
+    :param deadline: the amount of seconds the whole run can take, defaults to config["run_deadline"].
+        a device that runs out of time has its session aborted and is reported with a DeviceTimeoutError,
+        once the deadline passes every device that is left is reported that way. 0 means no limit.
     :return: a generator that yields each result and device as they finish.
     """
-    with concurrent.futures.ThreadPoolExecutor(max_workers=config["max_worker"]) as execute_pool:
-        future_to_device = {}
+    if engine is None:
+        engine = config["engine"]
+    engine = ExecutionEngine(engine)
+    if engine == ExecutionEngine.PROCESS and limiter is not None:
+        raise ValueError("the process engine can't share a limiter between its workers")
+    if engine == ExecutionEngine.ASYNCIO and executer is not None:
+        raise ValueError("the asyncio engine opens its own ssh sessions, it can't run a custom executer")
+
+    if time_budget is None:
+        time_budget = config["device_time_budget"]
+    if deadline is None:
+        deadline = config["run_deadline"]
+    session_runner = SessionRunner(
+        commands,
+        permission_level,
+        executer,
+        output_sink_factory,
+        time_budget or None,
+        time.time() + deadline if deadline else None
+    )
+    if probe is None:
+        probe = config["tcp_probe"]
+    if result_cache is not None and ResultCache.is_cacheable(commands, permission_level):
+        return deploy_with_result_cache(devices, session_runner, engine, limiter, probe, result_cache, health_store)
+    return run_sessions(devices, session_runner, engine, limiter, probe, health_store)
+
+
+def run_sessions(
+        devices: Iterable[Device],
+        session_runner: SessionRunner,
+        engine: ExecutionEngine,
+        limiter: Optional[Union[StaticLimiter, AIMDLimiter]],
+        probe: bool,
+        health_store: Optional[HealthStore] = None
+) -> Iterator[DeployResult]:
+    """
+    run a session on every device, after probing them if probe is True. see deploy_commands.
+    """
+    if health_store is not None:
+        return deploy_with_circuit_breaker(devices, session_runner, engine, limiter, probe, health_store)
+    if probe:
+        return deploy_to_reachable_devices(devices, session_runner, engine, limiter)
+    return run_engine(devices, session_runner, engine, limiter)
+
+
+def deploy_with_circuit_breaker(
+        devices: Iterable[Device],
+        session_runner: SessionRunner,
+        engine: ExecutionEngine,
+        limiter: Optional[Union[StaticLimiter, AIMDLimiter]],
+        probe: bool,
+        health_store: HealthStore
+) -> Iterator[DeployResult]:
+    """
+    record the outcome of every session in the health store, and save it once the run is done.
+    the devices whose circuit breaker is open are skipped with a CircuitOpenError,
+    or get a session once all the other devices are done.
+    """
+    circuit_breaker_mode = CircuitBreakerMode(config["circuit_breaker"])
+    closed_devices, open_devices = health_store.partition(devices)
+    try:
+        if circuit_breaker_mode == CircuitBreakerMode.SKIP:
+            for device in open_devices:
+                health = health_store.get(device)
+                yield "", device, CircuitOpenError(device, health.consecutive_failures, health.open_until)
+            open_devices = []
+
+        for device_group in (closed_devices, open_devices):
+            for output, device, exception in run_sessions(device_group, session_runner, engine, limiter, probe):
+                health_store.record(device, exception)
+                yield output, device, exception
+    finally:
+        health_store.save()
+
+
+def deploy_with_result_cache(
+        devices: Iterable[Device],
+        session_runner: SessionRunner,
+        engine: ExecutionEngine,
+        limiter: Optional[Union[StaticLimiter, AIMDLimiter]],
+        probe: bool,
+        result_cache: ResultCache,
+        health_store: Optional[HealthStore] = None
+) -> Iterator[DeployResult]:
+    """
+    yield the devices whose output is cached right away, and run a session only on the rest.
+    the sessions still stream their output to the output sinks, and return a copy of it so it can be cached.
+    """
+    commands = session_runner.commands
+    permission_level = session_runner.permission_level
+    uncached_devices = []
+    for device in devices:
+        output = result_cache.get_output(device, commands, permission_level)
+        if output is None:
+            uncached_devices.append(device)
+            continue
+        yield write_to_output_sink(session_runner, device, output), device, None
+
+    caching_session_runner = dataclasses.replace(session_runner, keep_output=True)
+    try:
+        for output, device, exception in run_sessions(
+                uncached_devices, caching_session_runner, engine, limiter, probe, health_store
+        ):
+            if exception is None:
+                result_cache.set_output(device, commands, permission_level, output)
+                if session_runner.output_sink_factory is not None:
+                    # the output already went to the output sink of the device.
+                    output = type(output)()
+            yield output, device, exception
+    finally:
+        result_cache.evict()
+
+
+def write_to_output_sink(session_runner: SessionRunner, device: Device, output: str) -> str:
+    """
+    :return: the output if the session runner has no output sink factory, otherwise an empty string
+        of the same type, after the output was written to the output sink of the device.
+    """
+    if session_runner.output_sink_factory is None:
+        return output
+    output_sink = session_runner.output_sink_factory(device)
+    try:
+        output_sink.write(output)
+    finally:
+        output_sink.close()
+    return type(output)()
+
+
+def run_engine(
+        devices: Iterable[Device],
+        session_runner: SessionRunner,
+        engine: ExecutionEngine,
+        limiter: Optional[Union[StaticLimiter, AIMDLimiter]]
+) -> Iterator[DeployResult]:
+    """
+    run a session on every device with the chosen engine, see deploy_commands.
+    if config["share_sessions"] is set, devices with the same connection arguments share a single session.
+    """
+    if not config["share_sessions"]:
+        return start_engine(devices, session_runner, engine, limiter)
+    return expand_shared_sessions(start_engine(share_sessions(devices), session_runner, engine, limiter))
+
+
+def start_engine(
+        devices: Iterable[Device],
+        session_runner: SessionRunner,
+        engine: ExecutionEngine,
+        limiter: Optional[Union[StaticLimiter, AIMDLimiter]]
+) -> Iterator[DeployResult]:
+    if engine == ExecutionEngine.ASYNCIO:
+        return deploy_with_asyncio(devices, session_runner, limiter)
+    if engine == ExecutionEngine.PROCESS:
+        return deploy_with_processes(devices, session_runner)
+    return deploy_with_threads(devices, session_runner, limiter)
+
+
+def share_sessions(devices: Iterable[Device]) -> List[Device]:
+    """
+    :return: the devices, where every set of devices with the same connection arguments
+        is replaced by a single SharedSession in the place of its first device.
+    """
+    devices_by_key: Dict[Any, List[Device]] = collections.OrderedDict()
+    for device in devices:
+        devices_by_key.setdefault(get_session_key(device.device_options), []).append(device)
+    return [
+        aliases[0] if len(aliases) == 1 else SharedSession.from_aliases(aliases)
+        for aliases in devices_by_key.values()
+    ]
+
+
+def expand_shared_sessions(results: Iterable[DeployResult]) -> Iterator[DeployResult]:
+    """
+    report the result of every alias of a SharedSession under its own name.
+    """
+    for result, device, exception in results:
+        if not isinstance(device, SharedSession):
+            yield result, device, exception
+        elif exception is not None:
+            for alias in device.aliases:
+                yield "", alias, exception
+        else:
+            for alias, (alias_result, alias_exception) in zip(device.aliases, result):
+                yield alias_result, alias, alias_exception
+
+
+def deploy_to_reachable_devices(
+        devices: Iterable[Device],
+        session_runner: SessionRunner,
+        engine: ExecutionEngine,
+        limiter: Optional[Union[StaticLimiter, AIMDLimiter]]
+) -> Iterator[DeployResult]:
+    """
+    sweep every device with a tcp connection before logging in.
+    the unreachable devices are yielded right away, so they don't hold a session slot
+    for the whole netmiko connection timeout, and the reachable ones are deployed with the engine.
+    """
+    reachable_devices, unreachable_devices = probe_devices(
+        devices,
+        config["tcp_probe_timeout"],
+        config["tcp_probe_concurrency"]
+    )
+    for device, exception in unreachable_devices:
+        yield "", device, exception
+    yield from run_engine(reachable_devices, session_runner, engine, limiter)
+
+
+def get_executer() -> Executer:
+    """
+    choose the function that runs the commands on a single device.
+    if config["use_session_daemon"] is set and the daemon is up the commands go through its warm sessions,
+    otherwise every device gets a new connection.
+
+    :return: a function with the signature of execute_commands.
+    """
+    socket_path = config["session_daemon_socket"]
+    if config["use_session_daemon"] and is_daemon_running(socket_path):
+        return daemon_executer(socket_path)
+    return execute_commands
+
+
+class DeployScheduler:
+    """
+    Decides which devices can start a session and reports every finished session to the concurrency limiter.
 
-        # start the threads
+    the devices are split into queues by their limited tags (see TagGroupLimiter), when one group is full
+    or rate limited the scheduler keeps the pool busy with the devices of the other groups.
+    """
+
+    def __init__(
+            self,
+            devices: Iterable[Device],
+            limiter: Union[StaticLimiter, AIMDLimiter],
+            group_limiter: Optional[TagGroupLimiter] = None
+    ):
+        """
+        :param devices: the devices that need a session.
+        :param limiter: decides how many sessions can run at once.
+        :param group_limiter: the per tag limits, defaults to config["concurrency_groups"].
+        """
+        if group_limiter is None:
+            group_limiter = TagGroupLimiter.from_config()
+        self._limiter = limiter
+        self._group_limiter = group_limiter
+        self._queues: Dict[FrozenSet[str], collections.deque] = collections.OrderedDict()
         for device in devices:
-            device_options = device.device_options
-            function_arguments = (device_options, commands, permission_level)
-            future = execute_pool.submit(execute_commands, *function_arguments)
-            future_to_device[future] = device
+            limited_tags = group_limiter.limited_tags(device.tags)
+            self._queues.setdefault(limited_tags, collections.deque()).append(device)
+        self._pending = sum(len(device_queue) for device_queue in self._queues.values())
+        self.running = 0
+        # the ConnectPhase every session reports by the id of its device, see SessionRunner.__call__.
+        self.connect_phases: Dict[int, ConnectPhase] = {}
+        # how long to wait before a rate limited group can start its next session, None if no group is waiting.
+        self.wait_timeout: Optional[float] = None
 
-        # wait for the threads to finish one by one.
-        for future in concurrent.futures.as_completed(future_to_device.keys()):
-            device = future_to_device[future]
+    def has_work(self) -> bool:
+        return self._pending > 0 or self.running > 0
 
-            try:
-                result = future.result()
-                yield result, device, None
-            except Exception as exception:
+    def drain(self) -> List[Device]:
+        """
+        :return: every device that didn't start a session yet, they won't be returned by ready_devices anymore.
+        """
+        devices = [device for device_queue in self._queues.values() for device in device_queue]
+        for device_queue in self._queues.values():
+            device_queue.clear()
+        self._pending = 0
+        return devices
+
+    def ready_devices(self) -> List[Device]:
+        """
+        :return: the devices that can start a session right now.
+        """
+        ready = []
+        self.wait_timeout = None
+        while self._pending and self.running < self._limiter.limit:
+            device = self._next_device(time.monotonic())
+            if device is None:
+                break
+            ready.append(device)
+            self._pending -= 1
+            self.running += 1
+        return ready
+
+    def finished(self, device: Device, started_at: float, exception: Optional[BaseException]) -> None:
+        """
+        :param device: the device whose session finished.
+        :param started_at: the time.monotonic() value of when the session started.
+        :param exception: the exception the session raised, None if it succeeded.
+        """
+        self.running -= 1
+        self._group_limiter.finished(self._group_limiter.limited_tags(device.tags))
+        # the limiter learns from the login only, the commands take as long as they take.
+        # a session that didn't report its login (like one that ran out of time) is timed as a whole.
+        latency, failed = self.connect_phases.pop(
+            id(device),
+            (time.monotonic() - started_at, exception is not None and is_transient(exception))
+        )
+        self._limiter.record(started_at, latency, failed)
+
+    def _next_device(self, now: float) -> Optional[Device]:
+        """
+        take a device from the first queue whose groups can start a session, and move that queue
+        to the back so the groups take turns.
+        """
+        for limited_tags, device_queue in self._queues.items():
+            if not device_queue:
+                continue
+            delay = self._group_limiter.start_delay(limited_tags, now)
+            if delay is None:
+                continue
+            if delay > 0:
+                self.wait_timeout = delay if self.wait_timeout is None else min(self.wait_timeout, delay)
+                continue
+            self._group_limiter.started(limited_tags, now)
+            self._queues.move_to_end(limited_tags)
+            self.wait_timeout = None
+            return device_queue.popleft()
+        return None
+
+
+def deploy_with_threads(
+        devices: Iterable[Device],
+        session_runner: SessionRunner,
+        limiter: Optional[Union[StaticLimiter, AIMDLimiter]] = None
+) -> Iterator[DeployResult]:
+    """
+    run the sessions with one blocking session per thread, at most config["max_worker"] at a time.
+
+    :param devices: a collection of devices to push the commands to.
+    :param session_runner: runs the commands on a single device.
+    :param limiter: decides how many sessions run at once, defaults to a static config["max_worker"].
+    :return: a generator that yields each result and device as they finish.
+    """
+    if limiter is None:
+        limiter = StaticLimiter(config["max_worker"])
+    session_runner = session_runner.with_executer()
+    scheduler = DeployScheduler(devices, limiter)
+    execute_pool = concurrent.futures.ThreadPoolExecutor(max_workers=limiter.max_limit)
+    future_to_device = {}
+    has_expired_sessions = False
+    try:
+        while scheduler.has_work():
+            yield from expire_pending_devices(session_runner, scheduler)
+
+            # start as many threads as the limiter allows
+            for device in scheduler.ready_devices():
+                future = execute_pool.submit(session_runner, device, scheduler.connect_phases)
+                future_to_device[future] = (device, time.monotonic())
+
+            # the only devices left are waiting for a rate limited group.
+            if not future_to_device:
+                if scheduler.has_work():
+                    time.sleep(get_wait_timeout(session_runner, scheduler, future_to_device))
+                continue
+
+            # wait for at least one of the threads to finish, for a rate limited group to be able to start,
+            # or for a session to run out of time.
+            done, _ = concurrent.futures.wait(
+                future_to_device.keys(),
+                timeout=get_wait_timeout(session_runner, scheduler, future_to_device),
+                return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                device, started_at = future_to_device.pop(future)
                 # We return the exception instead of raising it because it would cause the whole program to crash
                 # instead of the specific thread.
-                yield "", device, exception
+                exception = future.exception()
+                scheduler.finished(device, started_at, exception)
+                if exception:
+                    yield "", device, exception
+                else:
+                    yield future.result(), device, None
+
+            for result in expire_sessions(session_runner, scheduler, future_to_device):
+                has_expired_sessions = True
+                yield result
+    except BaseException:
+        # the run was interrupted (Ctrl-C, or the results were closed early).
+        has_expired_sessions = True
+        abort_running_sessions(future_to_device)
+        raise
+    finally:
+        # the expired sessions were aborted, their threads end on their own once they notice.
+        # a session that is still connecting gives up by itself, its connect timeouts are bounded by its time left.
+        execute_pool.shutdown(wait=not has_expired_sessions, cancel_futures=True)
+
+
+def deploy_with_asyncio(
+        devices: Iterable[Device],
+        session_runner: SessionRunner,
+        limiter: Optional[Union[StaticLimiter, AIMDLimiter]] = None
+) -> Iterator[DeployResult]:
+    """
+    run the sessions as AsyncSessions on a single event loop, at most config["max_async_sessions"] at a time.
+    a session waiting on the device is a suspended coroutine and not a blocked thread, so thousands of them fit
+    in one process. the session daemon isn't used, the loop opens its own sessions.
+
+    :param devices: a collection of devices to push the commands to.
+    :param session_runner: runs the commands on a single device with its run_async.
+    :param limiter: decides how many sessions run at once, defaults to a static config["max_async_sessions"].
+    :return: a generator that yields each result and device as they finish.
+    """
+    if limiter is None:
+        limiter = StaticLimiter(config["max_async_sessions"])
+    scheduler = DeployScheduler(devices, limiter)
+    loop = asyncio.new_event_loop()
+    task_to_device = {}
+    try:
+        while scheduler.has_work():
+            yield from expire_pending_devices(session_runner, scheduler)
+
+            for device in scheduler.ready_devices():
+                task = loop.create_task(session_runner.run_async(device, scheduler.connect_phases))
+                task_to_device[task] = (device, time.monotonic())
+
+            # the only devices left are waiting for a rate limited group.
+            if not task_to_device:
+                if scheduler.has_work():
+                    wait_timeout = get_wait_timeout(session_runner, scheduler, task_to_device)
+                    loop.run_until_complete(asyncio.sleep(wait_timeout))
+                continue
+
+            done, _ = loop.run_until_complete(asyncio.wait(
+                set(task_to_device),
+                timeout=get_wait_timeout(session_runner, scheduler, task_to_device),
+                return_when=asyncio.FIRST_COMPLETED
+            ))
+            for task in done:
+                device, started_at = task_to_device.pop(task)
+                exception = task.exception()
+                scheduler.finished(device, started_at, exception)
+                if exception:
+                    yield "", device, exception
+                else:
+                    yield task.result(), device, None
+
+            # the tasks of the expired sessions are cancelled, which closes their sessions.
+            yield from expire_sessions(session_runner, scheduler, task_to_device)
+    except BaseException:
+        abort_running_sessions(task_to_device)
+        raise
+    finally:
+        # let the cancelled tasks close their sessions before the loop goes away.
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+
+
+def get_wait_timeout(
+        session_runner: SessionRunner,
+        scheduler: DeployScheduler,
+        running_sessions: Dict[Any, Tuple[Device, float]]
+) -> Optional[float]:
+    """
+    :param session_runner: knows the time budget of the sessions and the deadline of the run.
+    :param scheduler: knows when a rate limited group can start its next session.
+    :param running_sessions: the device and start time of every running session.
+    :return: the amount of seconds the engine can wait for a session to finish before it has something else to do,
+        None if it can wait for as long as it takes.
+    """
+    timeouts = [scheduler.wait_timeout, session_runner.time_left()]
+    if session_runner.time_budget is not None:
+        timeouts.extend(session_runner.time_left(started_at) for _, started_at in running_sessions.values())
+    timeouts = [max(timeout, 0) for timeout in timeouts if timeout is not None]
+    return min(timeouts) if timeouts else None
+
+
+def expire_sessions(
+        session_runner: SessionRunner,
+        scheduler: DeployScheduler,
+        running_sessions: Dict[Any, Tuple[Device, float]]
+) -> Iterator[DeployResult]:
+    """
+    abort the sessions that ran out of time, remove them from running_sessions and report them as timed out.
+    """
+    for future, (device, started_at) in tuple(running_sessions.items()):
+        time_left = session_runner.time_left(started_at)
+        if time_left is None or time_left > 0:
+            continue
+        del running_sessions[future]
+        future.cancel()
+        abort_session(id(device))
+        exception = session_runner.timeout_error(device, started_at)
+        scheduler.finished(device, started_at, exception)
+        yield "", device, exception
+
+
+def abort_running_sessions(running_sessions: Dict[Any, Tuple[Device, float]]) -> None:
+    """
+    cancel the sessions that didn't start yet, and close the transports of the live ones
+    so their threads fail on their next read instead of finishing the commands.
+    """
+    for future, (device, _) in running_sessions.items():
+        future.cancel()
+        abort_session(id(device))
+
+
+def expire_pending_devices(session_runner: SessionRunner, scheduler: DeployScheduler) -> Iterator[DeployResult]:
+    """
+    once the run deadline passed, report every device that didn't start a session as timed out.
+    """
+    time_left = session_runner.time_left()
+    if time_left is None or time_left > 0:
+        return
+    for device in scheduler.drain():
+        yield "", device, session_runner.timeout_error(device)
+
+
+def deploy_with_processes(devices: Iterable[Device], session_runner: SessionRunner) -> Iterator[DeployResult]:
+    """
+    split the devices across config["max_processes"] worker processes (0 means one per core).
+    every worker runs its shard with the thread engine and streams the results
+    back through a queue, so the ssh crypto and prompt matching are spread over every core.
+
+    :param devices: a collection of devices to push the commands to.
+    :param session_runner: runs the commands on a single device, its executer is resolved inside every worker.
+    :return: a generator that yields each result and device as they finish.
+    """
+    devices = list(devices)
+    if not devices:
+        return
+
+    max_processes = config["max_processes"] or os.cpu_count() or 1
+    number_of_shards = min(max_processes, len(devices))
+    shards = shard_devices(devices, number_of_shards, TagGroupLimiter.from_config())
+
+    # spawn instead of fork, forking a process that already runs threads (like rich's progress bar) isn't safe.
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    shard_config = {key: value for key, value in config.items() if key != "keepass_password"}
+    workers = [
+        context.Process(
+            target=_deploy_shard,
+            args=(shard_index, shard, session_runner, shard_config, result_queue),
+            daemon=True
+        )
+        for shard_index, shard in enumerate(shards)
+    ]
+    for worker in workers:
+        worker.start()
+
+    unreported_devices = [set(range(len(shard))) for shard in shards]
+    running_shards = set(range(len(shards)))
+    try:
+        while running_shards:
+            try:
+                shard_index, device_index, result, exception = result_queue.get(timeout=1)
+            except queue.Empty:
+                yield from _collect_dead_shards(workers, shards, unreported_devices, running_shards)
+                yield from _expire_shards(session_runner, workers, shards, unreported_devices, running_shards)
+                continue
+
+            if device_index is None:
+                running_shards.discard(shard_index)
+                continue
+            unreported_devices[shard_index].discard(device_index)
+            yield result, shards[shard_index][device_index], exception
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+
+
+def shard_devices(devices: List[Device], number_of_shards: int, group_limiter: TagGroupLimiter) -> List[List[Device]]:
+    """
+    split the devices into shards for the worker processes.
+    devices that share a limited tag always land in the same shard, so a single worker enforces that group's limits.
+
+    :param devices: the devices to split.
+    :param number_of_shards: the amount of shards.
+    :param group_limiter: the per tag limits.
+    :return: the shards, every shard has at least one device.
+    """
+    # union find over the limited tags, every connected set of tags is a single unit of work.
+    tag_parents: Dict[str, str] = {}
+
+    def find_root(tag: str) -> str:
+        while tag_parents.setdefault(tag, tag) != tag:
+            tag_parents[tag] = tag_parents[tag_parents[tag]]
+            tag = tag_parents[tag]
+        return tag
+
+    device_tags = [sorted(group_limiter.limited_tags(device.tags)) for device in devices]
+    for tags in device_tags:
+        for tag in tags[1:]:
+            tag_parents[find_root(tag)] = find_root(tags[0])
+
+    units: Dict[object, List[Device]] = collections.OrderedDict()
+    for device_index, (device, tags) in enumerate(zip(devices, device_tags)):
+        unit_key = find_root(tags[0]) if tags else device_index
+        units.setdefault(unit_key, []).append(device)
+
+    shards: List[List[Device]] = [[] for _ in range(number_of_shards)]
+    for unit in sorted(units.values(), key=len, reverse=True):
+        min(shards, key=len).extend(unit)
+    return [shard for shard in shards if shard]
+
+
+def _collect_dead_shards(workers, shards, unreported_devices, running_shards) -> Iterator[DeployResult]:
+    """
+    report every device of a worker that died without finishing its shard as failed.
+    """
+    for shard_index in tuple(running_shards):
+        worker = workers[shard_index]
+        if worker.is_alive():
+            continue
+        running_shards.discard(shard_index)
+        for device_index in sorted(unreported_devices[shard_index]):
+            exception = ChildProcessError(f"worker process exited with code {worker.exitcode}")
+            yield "", shards[shard_index][device_index], exception
+
+
+def _expire_shards(session_runner, workers, shards, unreported_devices, running_shards) -> Iterator[DeployResult]:
+    """
+    the workers report their own timeouts, a worker that is still running PROCESS_DEADLINE_GRACE seconds
+    after the run deadline is terminated and its devices that are left are reported as timed out.
+    """
+    time_left = session_runner.time_left()
+    if time_left is None or time_left > -PROCESS_DEADLINE_GRACE:
+        return
+    for shard_index in tuple(running_shards):
+        workers[shard_index].terminate()
+        running_shards.discard(shard_index)
+        for device_index in sorted(unreported_devices[shard_index]):
+            device = shards[shard_index][device_index]
+            yield "", device, DeviceTimeoutError(f"the run deadline passed before {device.name} finished")
+
+
+def _deploy_shard(shard_index, shard, session_runner, shard_config, result_queue):
+    """
+    the entry point of a worker process, it deploys a single shard and reports
+    every result as (shard index, device index, result, exception).
+    the shard is done when the device index is None.
+    """
+    config.update(shard_config)
+    device_indexes = {id(device): device_index for device_index, device in enumerate(shard)}
+    # the parent already probed the devices if it had to.
+    # the parent already shared the sessions, and it expands them once the results arrive.
+    results = start_engine(shard, session_runner, ExecutionEngine.THREAD, None)
+    for result, device, exception in results:
+        result_queue.put((shard_index, device_indexes[id(device)], result, _make_picklable(exception)))
+    result_queue.put((shard_index, None, None, None))
+
+
+def _make_picklable(exception: Optional[BaseException]) -> Optional[BaseException]:
+    """
+    some exceptions can't cross a process boundary, those are replaced by a RuntimeError with the same message.
+    """
+    if exception is None:
+        return None
+    try:
+        pickle.loads(pickle.dumps(exception))
+    except Exception:
+        return RuntimeError(f"{type(exception).__name__}: {exception}")
+    return exception
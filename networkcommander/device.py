@@ -17,6 +17,8 @@ class Device:
     host: str
     device_type: str
     optional_parameters: Dict[str, str]
+    # the tags are the device's labels in the inventory, they are not a part of its identity.
+    tags: Tuple[str, ...] = dataclasses.field(default=(), compare=False)
 
     def __str__(self):
         device_string = ''
@@ -60,13 +62,61 @@ class Device:
         example - netmiko.ConnectionHandler(**device.device_options).
         :return: a dictionary containing the arguments netmiko.ConnectionHandler() needs to run
         """
-        return {
+        device_options = {
             "username": self.username,
             "password": self.password,
             "host": self.host,
             "device_type": self.device_type,
+            # the optional parameters of the device win over its tuning profile.
+            **get_tuning_profile(self.device_type, self.optional_parameters.get("tuning_profile")),
             **self.optional_parameters
         }
+        device_options.pop("tuning_profile", None)
+        if "jump_host" not in device_options:
+            # a jump host in the optional parameters wins over the jump hosts of the tags.
+            jump_host = get_tag_jump_host(self.tags)
+            if jump_host:
+                device_options["jump_host"] = jump_host
+        return device_options
+
+
+def get_tuning_profile(device_type: str, profile_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    :param device_type: the netmiko device type, it picks the profile from config["device_type_profiles"].
+    :param profile_name: the name of a profile that is used instead of the profile of the device type.
+    :return: the netmiko arguments of the profile in config["tuning_profiles"], empty if there is no profile.
+    :raises: ValueError if the profile doesn't exist.
+    """
+    if not profile_name:
+        profile_name = config["device_type_profiles"].get(str(device_type))
+    if not profile_name:
+        return {}
+    if profile_name not in config["tuning_profiles"]:
+        raise ValueError(
+            f"there is no tuning profile named '{profile_name}', "
+            f"the profiles are [{', '.join(config['tuning_profiles'])}]"
+        )
+    return dict(config["tuning_profiles"][profile_name])
+
+
+def get_tag_jump_host(tags: Tuple[str, ...]) -> Optional[str]:
+    """
+    :return: the jump host config["jump_hosts"] gives the first of the tags that has one, or None.
+    """
+    jump_hosts = config["jump_hosts"]
+    for tag in tags:
+        if tag in jump_hosts:
+            return jump_hosts[tag]
+    return None
+
+
+def is_enabled(value: Any) -> bool:
+    """
+    the optional parameters that come from keepass are strings, so "False" has to be treated as False.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "yes", "1")
+    return bool(value)
 
 
 def device_from_string(device: str, password: str = "", optional_parameters: Optional[Dict[str, Any]] = None):
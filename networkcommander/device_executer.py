@@ -1,8 +1,43 @@
+import contextlib
+import re
+import threading
+import time
+import uuid
+import weakref
 from enum import Enum
-from typing import List
+from typing import List, Optional, Dict, Hashable, Iterator, Tuple
 
 import netmiko
 
+from networkcommander.config import config
+from networkcommander.jump_host import open_jump_channel
+from networkcommander.output_sink import OutputSink
+
+# the amount of characters (on top of the prompt) held back while streaming, so a prompt split between
+# two reads is still recognized before it is written to the sink.
+STREAM_HOLD_BACK = 64
+
+# commands (and their abbreviations) that only read the state of the device, and are safe to send ahead of the prompt.
+READ_ONLY_COMMAND = re.compile(r"^\s*(sh(ow?)?|display|dir|more)\b", re.IGNORECASE)
+
+# a comment cisco like devices echo and otherwise ignore, it is typed after every pipelined command
+# (with the id of the batch and the index of the command) to mark where the output of the command ends.
+PIPELINE_MARKER = "! commander-pipeline"
+
+# the netmiko device types that echo and ignore a '!' comment at the exec prompt, only they pipeline commands.
+PIPELINE_DEVICE_TYPE = re.compile(r"^(cisco_(ios|xe|xr|nxos)|arista_eos)(_|$)")
+
+# the amount of seconds to wait for the echo of the next pipelined command once the device shows its prompt,
+# before deciding the device dropped the commands that were typed ahead.
+PIPELINE_GRACE = 0.5
+
+# commands (and their abbreviations) that move the session to another mode, and with it change the prompt.
+MODE_CHANGING_COMMAND = re.compile(r"^\s*(en(a(b(le?)?)?)?|disable?|conf(ig(ure)?)?|end|exit|quit)\b", re.IGNORECASE)
+
+# the netmiko arguments that bound how long connecting and logging in can take, and the value a session
+# uses when they aren't set (netmiko leaves auth_timeout to paramiko).
+CONNECT_TIMEOUT_DEFAULTS = {"conn_timeout": 10, "banner_timeout": 15, "auth_timeout": 30}
+
 
 class PermissionLevel(str, Enum):
     """
@@ -13,41 +48,163 @@ class PermissionLevel(str, Enum):
     CONFIGURE_TERMINAL = "configure_terminal"
 
 
+# the order of the permission levels, every level is one transition away from its neighbours.
+PERMISSION_LEVEL_ORDER = (PermissionLevel.USER, PermissionLevel.ENABLE, PermissionLevel.CONFIGURE_TERMINAL)
+
+# a cisco like prompt, it ends with '>' in user mode, with '#' in enable mode and with '(config...)#' in config mode.
+CISCO_LIKE_PROMPT = re.compile(r"^[^<\[].*?(?P<config>\(config[^)]*\))?(?P<terminator>[>#])$")
+
+# the permission level every open session is known to be in, sessions are forgotten once they are garbage collected.
+_known_permission_levels: "weakref.WeakKeyDictionary[netmiko.BaseConnection, PermissionLevel]" = \
+    weakref.WeakKeyDictionary()
+# the prompt every open session is known to show, it is forgotten whenever the mode of the session may have changed.
+_known_prompts: "weakref.WeakKeyDictionary[netmiko.BaseConnection, str]" = weakref.WeakKeyDictionary()
+_known_permission_levels_lock = threading.Lock()
+
+
 def change_permission(device: netmiko.BaseConnection, permission_level: PermissionLevel):
     """
     Change the permission level of the network device.
+    the device is only probed for its current level if it isn't known already,
+    and it moves one level at a time to the desired level.
 
     :param device: Netmiko connection object.
     :param permission_level: PermissionLevel enum representing the desired permission level.
     """
-    is_in_config_mode = device.check_config_mode()
-    is_in_enable_mode = device.check_enable_mode()
-    if permission_level == "enable":
-        if is_in_config_mode:
-            device.exit_config_mode()
-        elif not is_in_enable_mode:
-            device.enable()
-        return
-    if permission_level == 'user':
-        if is_in_enable_mode:
-            device.exit_enable_mode()
-        elif is_in_config_mode:
-            device.exit_config_mode()
-            device.exit_enable_mode()
+    permission_level = PermissionLevel(permission_level)
+    current_level = get_permission_level(device)
+    current_index = PERMISSION_LEVEL_ORDER.index(current_level)
+    target_index = PERMISSION_LEVEL_ORDER.index(permission_level)
+
+    if current_index == target_index:
         return
-    if permission_level == "configure terminal":
-        if is_in_enable_mode:
-            device.config_mode()
-        else:
+    # forget the level while moving, so a failed transition is probed again the next time.
+    forget_permission_level(device)
+    while current_index < target_index:
+        if PERMISSION_LEVEL_ORDER[current_index] == PermissionLevel.USER:
             device.enable()
+        else:
             device.config_mode()
-        return
+        current_index += 1
+    while current_index > target_index:
+        if PERMISSION_LEVEL_ORDER[current_index] == PermissionLevel.CONFIGURE_TERMINAL:
+            device.exit_config_mode()
+        else:
+            device.exit_enable_mode()
+        current_index -= 1
+    remember_permission_level(device, permission_level)
+
+
+def get_permission_level(device: netmiko.BaseConnection) -> PermissionLevel:
+    """
+    :param device: Netmiko connection object.
+    :return: the permission level the session is in. if it isn't known it is read from the prompt,
+        and the device is probed only if the prompt doesn't tell.
+    """
+    with _known_permission_levels_lock:
+        permission_level = _known_permission_levels.get(device)
+    if permission_level is None:
+        permission_level = permission_level_from_prompt(get_prompt(device))
+        if permission_level is None:
+            permission_level = detect_permission_level(device)
+        remember_permission_level(device, permission_level)
+    return permission_level
+
+
+def permission_level_from_prompt(prompt: str) -> Optional[PermissionLevel]:
+    """
+    :param prompt: the prompt the session shows.
+    :return: the permission level of a cisco like prompt, None if the prompt doesn't tell.
+    """
+    match = CISCO_LIKE_PROMPT.match(prompt.strip())
+    if match is None:
+        return None
+    if match.group("terminator") == ">":
+        return PermissionLevel.USER if match.group("config") is None else None
+    if match.group("config") is not None:
+        return PermissionLevel.CONFIGURE_TERMINAL
+    return PermissionLevel.ENABLE
+
+
+def detect_permission_level(device: netmiko.BaseConnection) -> PermissionLevel:
+    """
+    probe the device for the permission level of the session.
+
+    :param device: Netmiko connection object.
+    :return: the permission level the session is in.
+    """
+    if not device.check_enable_mode():
+        return PermissionLevel.USER
+    if device.check_config_mode():
+        return PermissionLevel.CONFIGURE_TERMINAL
+    return PermissionLevel.ENABLE
+
+
+def get_prompt(device: netmiko.BaseConnection) -> str:
+    """
+    :param device: Netmiko connection object.
+    :return: the prompt the session shows, the device is asked only if the prompt isn't known.
+    """
+    with _known_permission_levels_lock:
+        prompt = _known_prompts.get(device)
+    if prompt is None:
+        prompt = device.find_prompt()
+        with _known_permission_levels_lock:
+            _known_prompts[device] = prompt
+    return prompt
+
+
+def forget_prompt(device: netmiko.BaseConnection) -> None:
+    """
+    forget the prompt of the session, after a command that may have changed it without changing the permission level.
+    """
+    with _known_permission_levels_lock:
+        _known_prompts.pop(device, None)
+
+
+def remember_permission_level(device: netmiko.BaseConnection, permission_level: PermissionLevel) -> None:
+    with _known_permission_levels_lock:
+        _known_permission_levels[device] = PermissionLevel(permission_level)
+
+
+def forget_permission_level(device: netmiko.BaseConnection) -> None:
+    """
+    forget the permission level (and the prompt) of the session, after something that may have changed it
+    without being tracked.
+    """
+    with _known_permission_levels_lock:
+        _known_permission_levels.pop(device, None)
+        _known_prompts.pop(device, None)
+
+
+def open_session(device_options: dict) -> netmiko.BaseConnection:
+    """
+    log in to the device. the permission level isn't probed here,
+    it is read from the prompt the first commands need anyway.
+
+    :param device_options: Dictionary containing device connection parameters.
+        a device with a jump_host is reached over a channel of the shared transport to the jump host.
+    :return: Netmiko connection object.
+    """
+    device_options = dict(device_options)
+    jump_host = device_options.pop("jump_host", None)
+    if not jump_host:
+        device = netmiko.ConnectHandler(**device_options)
+    else:
+        channel = open_jump_channel(jump_host, device_options)
+        try:
+            device = netmiko.ConnectHandler(**device_options, sock=channel)
+        except Exception:
+            channel.close()
+            raise
+    return device
 
 
 def execute_commands(
         device_options: dict,
         commands: List[str],
-        permission_level: PermissionLevel
+        permission_level: PermissionLevel,
+        output_sink: Optional[OutputSink] = None
 ) -> str:
     """
     Execute commands on a network device with a specified permission level.
@@ -55,15 +212,46 @@ def execute_commands(
     :param device_options: Dictionary containing device connection parameters.
     :param commands: List of commands to execute.
     :param permission_level: PermissionLevel enum representing the desired permission level.
-    :return: Output generated by executing the commands.
+    :param output_sink: if given the output is written to it while it arrives instead of being returned.
+    :return: Output generated by executing the commands, an empty string if it went to the output sink.
     """
-    output = ""
     with Connection(device_options) as device:
-        change_permission(device, permission_level)
-        if permission_level in ["user", "enable"]:
+        output = run_commands(device, commands, permission_level, output_sink)
+    return output
+
+
+def run_commands(
+        device: netmiko.BaseConnection,
+        commands: List[str],
+        permission_level: PermissionLevel,
+        output_sink: Optional[OutputSink] = None
+) -> str:
+    """
+    Run commands over an already open session with a specified permission level.
+
+    :param device: Netmiko connection object.
+    :param commands: List of commands to execute.
+    :param permission_level: PermissionLevel enum representing the desired permission level.
+    :param output_sink: if given the output is written to it while it arrives instead of being returned.
+    :return: Output generated by executing the commands, an empty string if it went to the output sink.
+    """
+    output = ""
+    change_permission(device, permission_level)
+    if permission_level in ["user", "enable"]:
+        if config["pipeline_commands"] and can_pipeline(commands, device.device_type):
+            output = send_commands_pipelined(device, commands)
+            if output_sink is not None:
+                output_sink.write(output)
+                output = ""
+        elif output_sink is not None:
+            stream_commands(device, commands, output_sink)
+        else:
             output = send_commands(device, commands)
-        elif permission_level in ["configure_terminal"]:
-            output = send_config_commands(device, commands)
+    elif permission_level in ["configure_terminal"]:
+        output = send_config_commands(device, commands)
+        if output_sink is not None:
+            output_sink.write(output)
+            output = ""
     return output
 
 
@@ -71,6 +259,8 @@ def send_commands(device: netmiko.BaseConnection, commands: List[str]) -> str:
     """
     Send a list of commands to a network device.
     the commands will be sent one by one and not togather.
+    the prompt is detected once and used as the expect_string of every command,
+    it is detected again only after a command that changes the mode of the session.
 
     :param device: Netmiko connection object.
     :param commands: List of commands to send.
@@ -78,19 +268,201 @@ def send_commands(device: netmiko.BaseConnection, commands: List[str]) -> str:
     """
 
     output = ""
+    prompt = get_prompt(device)
     for command in commands:
-        output += device.find_prompt()
+        output += prompt
         output += command
         output += '\n'
-        output += device.send_command(command)
+        if is_mode_changing(command):
+            forget_permission_level(device)
+            output += device.send_command(command, expect_string=re.escape(device.base_prompt))
+            prompt = device.find_prompt()
+        else:
+            output += device.send_command(command, expect_string=re.escape(prompt))
         output += '\n'
     return output
 
 
+def is_mode_changing(command: str) -> bool:
+    """
+    :param command: a command that is about to be sent to the device.
+    :return: True if the command may change the mode of the session, and with it the prompt.
+    """
+    return MODE_CHANGING_COMMAND.match(command) is not None
+
+
+def can_pipeline(commands: List[str], device_type: str) -> bool:
+    """
+    :param commands: the commands that are about to be sent to the device.
+    :param device_type: the netmiko device type of the device.
+    :return: True if the commands can be sent together without waiting for the prompt between them.
+    """
+    return PIPELINE_DEVICE_TYPE.match(device_type) is not None and len(commands) > 1 and \
+        all(READ_ONLY_COMMAND.match(command) for command in commands)
+
+
+def send_commands_pipelined(device: netmiko.BaseConnection, commands: List[str], read_timeout: float = 10.0) -> str:
+    """
+    Send a batch of read only commands at once, without waiting for the prompt between them,
+    and split the output back into the output of every command.
+    every command is followed by a unique PIPELINE_MARKER comment,
+    whose echo marks where the output of the command ends.
+    devices that drop the input typed ahead of the prompt get the commands whose marker didn't come back
+    again one by one, they only read the state of the device so running one of them twice is harmless.
+
+    :param device: Netmiko connection object.
+    :param commands: List of read only commands to send.
+    :param read_timeout: the amount of seconds to wait for new output before giving up.
+    :return: the same output send_commands would have returned.
+    :raises: netmiko.ReadTimeout if the device stops sending output before the prompt shows up.
+    """
+    prompt = get_prompt(device)
+    batch_id = uuid.uuid4().hex
+    markers = [f"{PIPELINE_MARKER} {batch_id} {index}" for index in range(len(commands))]
+    device.write_channel("".join(
+        device.normalize_cmd(command) + device.normalize_cmd(marker) for command, marker in zip(commands, markers)
+    ))
+    combined_output = read_pipelined_output(device, markers[-1], prompt, read_timeout)
+
+    output = ""
+    command_outputs = split_pipelined_output(combined_output, markers, prompt)
+    for command, command_output in zip(commands, command_outputs):
+        output += f"{prompt}{command}\n{command_output}\n"
+    if len(command_outputs) < len(commands):
+        output += send_commands(device, commands[len(command_outputs):])
+    return output
+
+
+def read_pipelined_output(device: netmiko.BaseConnection, last_marker: str, prompt: str, read_timeout: float) -> str:
+    """
+    read the output of pipelined commands, until the device echoed the marker of the last command
+    and shows its prompt again, or until it waits at its prompt without echoing the rest of the input.
+
+    :raises: netmiko.ReadTimeout if the device stops sending output before the prompt shows up.
+    """
+    combined_output = ""
+    last_read = time.monotonic()
+    while True:
+        new_data = device.read_channel()
+        if new_data:
+            combined_output += new_data
+            last_read = time.monotonic()
+            # a line feed can be split between two reads, so the output is normalized as a whole.
+            normalized_output = device.normalize_linefeeds(combined_output)
+            marker_index = normalized_output.find(f"{last_marker}\n")
+            if marker_index != -1 and normalized_output[marker_index + len(last_marker):].rstrip().endswith(prompt):
+                return normalized_output
+            continue
+        idle_time = time.monotonic() - last_read
+        if idle_time > PIPELINE_GRACE and combined_output.rstrip().endswith(prompt):
+            return device.normalize_linefeeds(combined_output)
+        if idle_time > read_timeout:
+            raise netmiko.ReadTimeout(f"the prompt {prompt!r} didn't show up after the pipelined commands")
+        time.sleep(0.025)
+
+
+def split_pipelined_output(combined_output: str, markers: List[str], prompt: str) -> List[str]:
+    """
+    split the output of pipelined commands into the output of every command.
+
+    :param combined_output: everything the device sent since the commands were written.
+    :param markers: the marker that was written after every command.
+    :param prompt: the prompt of the device.
+    :return: the output of the commands whose marker was echoed, in order.
+    """
+    command_outputs = []
+    remaining_output = combined_output
+    for marker in markers:
+        marker_index = remaining_output.find(marker)
+        if marker_index == -1:
+            break
+        command_output = remaining_output[:marker_index].lstrip("\n")
+        remaining_output = remaining_output[marker_index + len(marker):]
+        # drop the echo of the command, and the prompt the marker was typed at.
+        command_output = command_output.split("\n", 1)[1] if "\n" in command_output else ""
+        if command_output.endswith(prompt):
+            command_output = command_output[:-len(prompt)]
+        command_outputs.append(command_output.rstrip("\n"))
+    return command_outputs
+
+
+def stream_commands(device: netmiko.BaseConnection, commands: List[str], output_sink: OutputSink) -> None:
+    """
+    Send a list of commands to a network device one by one, and write their output to the sink as it arrives.
+    the sink receives the same text send_commands would have returned.
+
+    :param device: Netmiko connection object.
+    :param commands: List of commands to send.
+    :param output_sink: receives the output chunk by chunk.
+    """
+    prompt = get_prompt(device)
+    for command in commands:
+        output_sink.write(f"{prompt}{command}\n")
+        if is_mode_changing(command):
+            # the prompt that ends this command isn't known yet, mode changes print almost nothing anyway.
+            forget_permission_level(device)
+            output_sink.write(device.send_command(command, expect_string=re.escape(device.base_prompt)))
+            prompt = device.find_prompt()
+        else:
+            stream_command(device, command, prompt, output_sink)
+        output_sink.write("\n")
+
+
+def stream_command(
+        device: netmiko.BaseConnection,
+        command: str,
+        prompt: str,
+        output_sink: OutputSink,
+        read_timeout: float = 10.0
+) -> None:
+    """
+    Send a single command and write its output to the sink until the prompt comes back.
+    only the tail of the output is kept in memory, everything before it is written as soon as it is read.
+    the command echo and the trailing prompt are stripped like send_command does.
+
+    :param device: Netmiko connection object.
+    :param command: the command to send.
+    :param prompt: the prompt the device shows when the command is done.
+    :param output_sink: receives the output chunk by chunk.
+    :param read_timeout: the amount of seconds to wait for new output before giving up.
+    :raises: netmiko.ReadTimeout if the device stops sending output before the prompt shows up.
+    """
+    command_string = device.normalize_cmd(command)
+    device.write_channel(command_string)
+    pending = device.command_echo_read(cmd=command_string.strip(), read_timeout=read_timeout)
+    is_echo_stripped = False
+    hold_back = len(prompt) + STREAM_HOLD_BACK
+    last_read = time.monotonic()
+
+    while True:
+        if not is_echo_stripped and "\n" in pending:
+            pending = pending.split("\n", 1)[1]
+            is_echo_stripped = True
+
+        if is_echo_stripped:
+            stripped_pending = pending.rstrip()
+            if stripped_pending.endswith(prompt):
+                output_sink.write(stripped_pending[:-len(prompt)].rstrip("\n"))
+                return
+            if len(pending) > hold_back:
+                output_sink.write(pending[:-hold_back])
+                pending = pending[-hold_back:]
+
+        new_data = device.read_channel()
+        if new_data:
+            pending += new_data
+            last_read = time.monotonic()
+        elif time.monotonic() - last_read > read_timeout:
+            raise netmiko.ReadTimeout(f"the prompt {prompt!r} didn't show up after {command!r}")
+        else:
+            time.sleep(0.025)
+
+
 def send_config_commands(device: netmiko.BaseConnection, commands: List[str]) -> str:
     """
     Send a list of configuration commands to a network device.
     send the commands as togather in config mode.
+    the session has to be in config mode already, and it stays there.
 
     :param device: Netmiko connection object.
     :param commands: List of configuration commands to send.
@@ -98,24 +470,181 @@ def send_config_commands(device: netmiko.BaseConnection, commands: List[str]) ->
     """
 
     output = ""
-    output += device.find_prompt()
-    output += device.send_config_set(commands)
+    output += get_prompt(device)
+    if any(is_mode_changing(command) for command in commands):
+        forget_permission_level(device)
+    # a command like 'interface vlan 1' changes the prompt but not the permission level.
+    forget_prompt(device)
+    output += device.send_config_set(commands, enter_config_mode=False, exit_config_mode=False)
     return output
 
 
+class SessionAbortedError(Exception):
+    """
+    raised when a session is opened in a session_scope that was already aborted.
+    """
+
+
+class _SessionScope:
+    """
+    the session a thread opened inside session_scope, whether it ever logged in,
+    and whether another thread asked to abort it.
+    """
+
+    def __init__(self):
+        self.device: Optional[netmiko.BaseConnection] = None
+        # set once a session of the scope logged in, from then on commands may have reached the device.
+        self.is_connected = False
+        # the time.monotonic() value of when the first session of the scope logged in.
+        self.connected_at: Optional[float] = None
+        self.is_aborted = False
+
+
+# the scopes that are running right now by their key, and the scope of the current thread.
+_session_scopes: Dict[Hashable, _SessionScope] = {}
+_session_scopes_lock = threading.Lock()
+_current_scope = threading.local()
+
+
+@contextlib.contextmanager
+def session_scope(key: Hashable) -> Iterator[_SessionScope]:
+    """
+    the session a Connection opens inside the scope can be aborted from other threads with abort_session(key).
+
+    :param key: identifies the scope, it has to be unique between the scopes that run at the same time.
+    :return: the scope, its is_connected and is_aborted tell the caller whether it is safe to try again.
+    """
+    scope = _SessionScope()
+    with _session_scopes_lock:
+        _session_scopes[key] = scope
+    _current_scope.scope = scope
+    try:
+        yield scope
+    finally:
+        _current_scope.scope = None
+        with _session_scopes_lock:
+            _session_scopes.pop(key, None)
+
+
+def mark_session_connected() -> None:
+    """
+    record that the session of the current session_scope logged in, for executers that open sessions
+    without a Connection. does nothing outside of a session_scope.
+    """
+    scope = getattr(_current_scope, "scope", None)
+    if scope is not None and not scope.is_connected:
+        scope.is_connected = True
+        scope.connected_at = time.monotonic()
+
+
+def abort_session(key: Hashable) -> None:
+    """
+    close the transport of the session opened in the scope, the thread running it fails on its next read.
+    a session that is still connecting is closed as soon as it connects.
+
+    :param key: the key of the session_scope.
+    """
+    with _session_scopes_lock:
+        scope = _session_scopes.get(key)
+        if scope is None:
+            return
+        scope.is_aborted = True
+        device = scope.device
+    if device is not None:
+        close_transport(device)
+
+
+def close_transport(device: netmiko.BaseConnection) -> None:
+    """
+    close the socket under the session without talking to the device.
+    unlike disconnect it is safe to call while another thread is reading from the session.
+    """
+    for attribute in ("remote_conn", "remote_conn_pre"):
+        connection = getattr(device, attribute, None)
+        if connection is None:
+            continue
+        try:
+            connection.close()
+        except Exception:
+            # the session is thrown away anyway, a broken transport doesn't matter.
+            pass
+
+
+# the sessions shared_sessions keeps open in the current thread by their connection arguments.
+_shared_sessions = threading.local()
+
+
+def get_session_key(device_options: dict) -> Tuple[Tuple[str, str], ...]:
+    """
+    :return: a hashable key that is equal for connection arguments that open the same session.
+        the connect timeouts are left out, they only bound the login and differ between sessions with a time limit.
+    """
+    return tuple(sorted(
+        (str(key), str(value)) for key, value in device_options.items() if key not in CONNECT_TIMEOUT_DEFAULTS
+    ))
+
+
+@contextlib.contextmanager
+def shared_sessions() -> Iterator[None]:
+    """
+    inside the context a Connection reuses the session an earlier Connection of the same thread
+    opened with the same connection arguments, the sessions are disconnected when the context exits.
+    """
+    sessions: Dict[Tuple[Tuple[str, str], ...], netmiko.BaseConnection] = {}
+    _shared_sessions.sessions = sessions
+    try:
+        yield
+    finally:
+        _shared_sessions.sessions = None
+        for device in sessions.values():
+            device.disconnect()
+
+
 class Connection:
     """
     A context manager for establishing and managing connections to network devices using Netmiko.
+    inside a session_scope the connection can be aborted from other threads,
+    and inside shared_sessions it reuses a session that is already open.
 
     usage - Use with a context manager (with Connection(...) as conn).
     """
     def __init__(self, device_options):
         self._device_options = device_options
         self._device = None
+        self._scope: Optional[_SessionScope] = None
+        self._shared_sessions: Optional[dict] = None
 
     def __enter__(self) -> netmiko.BaseConnection:
-        self._device = netmiko.ConnectHandler(**self._device_options)
+        self._shared_sessions = getattr(_shared_sessions, "sessions", None)
+        if self._shared_sessions is not None:
+            device = self._shared_sessions.get(get_session_key(self._device_options))
+            if device is not None and device.is_alive():
+                self._device = device
+                mark_session_connected()
+                return self._device
+
+        self._device = open_session(self._device_options)
+        mark_session_connected()
+        self._scope = getattr(_current_scope, "scope", None)
+        if self._scope is not None:
+            with _session_scopes_lock:
+                is_aborted = self._scope.is_aborted
+                self._scope.device = self._device
+            if is_aborted:
+                close_transport(self._device)
+                raise SessionAbortedError(f"the session to {self._device_options['host']} was aborted")
+        if self._shared_sessions is not None:
+            self._shared_sessions[get_session_key(self._device_options)] = self._device
         return self._device
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._shared_sessions is not None:
+            if exc_type is None:
+                # the session stays open for the next Connection, shared_sessions disconnects it.
+                return
+            # a session that failed mid-run isn't in a known state, it isn't shared anymore.
+            self._shared_sessions.pop(get_session_key(self._device_options), None)
+        if self._scope is not None:
+            with _session_scopes_lock:
+                self._scope.device = None
         self._device.disconnect()
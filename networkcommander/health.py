@@ -0,0 +1,161 @@
+import dataclasses
+import json
+import os
+import random
+import tempfile
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple, Optional
+
+import netmiko
+import paramiko
+
+from networkcommander.config import config
+from networkcommander.device import Device
+
+# errors of the connect phase that say the device couldn't be reached right now,
+# and not that something is wrong with the request. a TimeoutError isn't one of them,
+# on python 3.10 and later socket.timeout is TimeoutError, and so are the time budget and the run deadline.
+TRANSIENT_EXCEPTIONS = (
+    netmiko.NetmikoTimeoutException,
+    paramiko.ssh_exception.NoValidConnectionsError,
+    ConnectionRefusedError,
+    ConnectionResetError,
+    ConnectionAbortedError
+)
+
+
+class CircuitBreakerMode(str, Enum):
+    """
+    Enum defining what happens to devices that failed to connect circuit_breaker_threshold times in a row.
+    OFF - every device gets a session, the health of the devices isn't recorded.
+    DEFER - the failing devices get a session after all the other devices.
+    SKIP - the failing devices don't get a session until circuit_breaker_cooldown seconds passed.
+    """
+    OFF = "off"
+    DEFER = "defer"
+    SKIP = "skip"
+
+
+class CircuitOpenError(Exception):
+    """
+    raised instead of connecting to a device whose circuit breaker is open.
+    """
+
+    def __init__(self, device: Device, consecutive_failures: int, open_until: float):
+        self.consecutive_failures = consecutive_failures
+        self.open_until = open_until
+        super().__init__(
+            f"{device.name} failed to connect {consecutive_failures} times in a row, "
+            f"it is skipped for {max(open_until - time.time(), 0):.0f} more seconds"
+        )
+
+
+def is_transient(exception: BaseException) -> bool:
+    return isinstance(exception, TRANSIENT_EXCEPTIONS)
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    an exponential backoff with full jitter, so devices that failed together don't retry together.
+
+    :param attempt: the amount of attempts that failed so far, minus one.
+    :param base_delay: the longest delay after the first failed attempt.
+    :param max_delay: the longest delay after any attempt.
+    :return: the amount of seconds to wait before the next attempt.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+@dataclasses.dataclass
+class DeviceHealth:
+    """
+    the connection history of a single device.
+    """
+    consecutive_failures: int = 0
+    last_failure: float = 0.0
+    last_success: float = 0.0
+    open_until: float = 0.0
+    last_error: str = ""
+
+
+class HealthStore:
+    """
+    A json file with the health of every device, it outlives the run so the next run knows
+    which devices are dead before it connects to them.
+    a device whose circuit breaker is open failed to connect threshold times in a row,
+    and it stays open for cooldown seconds after the last failure.
+    """
+
+    def __init__(self, path: Path, threshold: int, cooldown: float):
+        """
+        :param path: the json file the health is saved in, it is created on the first save.
+        :param threshold: the amount of failures in a row that open the circuit breaker of a device.
+        :param cooldown: the amount of seconds the circuit breaker stays open.
+        """
+        self._path = Path(path)
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._health: Dict[str, DeviceHealth] = self._load()
+
+    @classmethod
+    def from_config(cls) -> "HealthStore":
+        return cls(config["health_file"], config["circuit_breaker_threshold"], config["circuit_breaker_cooldown"])
+
+    @staticmethod
+    def get_key(device: Device) -> str:
+        return f"{device.name}@{device.host}"
+
+    def get(self, device: Device) -> DeviceHealth:
+        return self._health.get(self.get_key(device), DeviceHealth())
+
+    def is_open(self, device: Device) -> bool:
+        """
+        :return: True if the device failed too many times in a row, and the cooldown didn't expire yet.
+        """
+        return self.get(device).open_until > time.time()
+
+    def partition(self, devices: Iterable[Device]) -> Tuple[List[Device], List[Device]]:
+        """
+        :return: the devices whose circuit breaker is closed, and the devices whose circuit breaker is open.
+        """
+        closed_devices, open_devices = [], []
+        for device in devices:
+            (open_devices if self.is_open(device) else closed_devices).append(device)
+        return closed_devices, open_devices
+
+    def record(self, device: Device, exception: Optional[BaseException] = None) -> None:
+        """
+        record the outcome of a session. only transient errors count as failures,
+        any other outcome means the device is reachable.
+        """
+        health = self.get(device)
+        now = time.time()
+        if exception is not None and is_transient(exception):
+            health.consecutive_failures += 1
+            health.last_failure = now
+            health.last_error = str(exception)
+            if health.consecutive_failures >= self._threshold:
+                health.open_until = now + self._cooldown
+        else:
+            health.consecutive_failures = 0
+            health.last_success = now
+            health.open_until = 0.0
+        self._health[self.get_key(device)] = health
+
+    def save(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        health = {key: dataclasses.asdict(device_health) for key, device_health in self._health.items()}
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self._path.parent, suffix=".tmp")
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as health_file:
+            json.dump(health, health_file, indent=4)
+        os.replace(temporary_path, self._path)
+
+    def _load(self) -> Dict[str, DeviceHealth]:
+        try:
+            with open(self._path, encoding="utf-8") as health_file:
+                health = json.load(health_file)
+        except FileNotFoundError:
+            return {}
+        return {key: DeviceHealth(**device_health) for key, device_health in health.items()}
@@ -4,6 +4,7 @@ import shutil
 
 import rich
 
+from networkcommander.inventory import create_inventory
 from networkcommander.keepass import KeepassDB, DEVICE_GROUP_NAME
 
 
@@ -14,15 +15,15 @@ def delete_project_files(directory):
     shutil.rmtree(directory)
 
 
-def init_program(directory, keepass_db_path, config_file_path, config):
-    if is_initialized(directory, keepass_db_path, config_file_path):
+def init_program(directory, inventory_path, config_file_path, config):
+    if is_initialized(directory, inventory_path, config_file_path):
         return
     os.makedirs(directory, exist_ok=True)
     if not os.path.isfile(config_file_path):
         with open(config_file_path, 'w', encoding="utf-8") as config_file:
             json.dump(config, config_file, indent=2)
-    if not os.path.isfile(keepass_db_path):
-        create_new_keepass_db(keepass_db_path)
+    if not os.path.isfile(inventory_path):
+        create_inventory(inventory_path)
 
 
 def create_new_keepass_db(keepass_db_path, keepass_password=None):
@@ -30,7 +31,7 @@ def create_new_keepass_db(keepass_db_path, keepass_password=None):
         kp.add_group(kp.root_group, DEVICE_GROUP_NAME)
 
 
-def is_initialized(directory, keepass_db_path, config_file_path):
+def is_initialized(directory, inventory_path, config_file_path):
     if os.path.isdir(directory):
-        return os.path.isfile(keepass_db_path) and os.path.isfile(config_file_path)
+        return os.path.isfile(inventory_path) and os.path.isfile(config_file_path)
     return False
@@ -0,0 +1,163 @@
+from typing import Protocol, List, Optional, Set, Iterable
+
+import pykeepass
+
+from networkcommander.config import config
+from networkcommander.device import Device
+from networkcommander.keepass import KeepassDB, get_all_entries, entry_to_device, is_entry_tagged_by_tag_set, \
+    get_device_index, add_device_entries, remove_device, tag_device, untag_device, DEVICE_GROUP_NAME
+from networkcommander.sqlite_inventory import SqliteInventory
+
+
+class Inventory(Protocol):
+    """
+    The devices under your command and their tags.
+    an inventory is used as a context manager, its changes are saved when it exits without an exception.
+    """
+
+    def __enter__(self) -> "Inventory":
+        ...
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        ...
+
+    def get_devices(self, tags: Optional[Set[str]] = None) -> List[Device]:
+        """
+        :param tags: only the devices that are tagged with every one of these tags, every device if empty.
+        """
+        ...
+
+    def get_devices_by_names(self, device_names: Iterable[str]) -> List[Device]:
+        """
+        :return: the devices with these names, the names that aren't in the inventory are skipped.
+        """
+        ...
+
+    def get_device_names(self) -> Set[str]:
+        ...
+
+    def get_tags(self) -> Set[str]:
+        ...
+
+    def add_devices(
+            self,
+            devices: Iterable[Device],
+            tags: List[str] = None,
+            ignore_pre_existing: bool = False
+    ) -> List[Device]:
+        """
+        :return: the devices that were added.
+        :raises: LookupError if devices already exist in the inventory, unless ignore_pre_existing is set.
+        """
+        ...
+
+    def remove_devices(self, device_names: Iterable[str]) -> None:
+        ...
+
+    def tag_devices(self, device_tag: str, device_names: Iterable[str]) -> None:
+        ...
+
+    def untag_devices(self, device_tag: str, device_names: Iterable[str]) -> None:
+        """
+        :raises: ValueError if a device is not tagged with the tag.
+        """
+        ...
+
+
+class KeepassInventory:
+    """
+    An inventory in a keepass database, every device is an entry of the device group.
+    """
+
+    def __init__(self, keepass_db_path: str, keepass_password: Optional[str], read_only: bool = False):
+        self._keepass_db = KeepassDB(keepass_db_path, keepass_password, read_only)
+        self._kp: Optional[pykeepass.PyKeePass] = None
+
+    def __enter__(self) -> "KeepassInventory":
+        self._kp = self._keepass_db.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self._keepass_db.__exit__(exc_type, exc_val, exc_tb)
+
+    def get_devices(self, tags: Optional[Set[str]] = None) -> List[Device]:
+        tagged_entries = filter(is_entry_tagged_by_tag_set(tags), get_all_entries(self._kp))
+        return list(map(entry_to_device, tagged_entries))
+
+    def get_devices_by_names(self, device_names: Iterable[str]) -> List[Device]:
+        index = get_device_index(self._kp)
+        return [
+            entry_to_device(entry)
+            for device_name in device_names
+            for entry in index.get_by_title(device_name)
+        ]
+
+    def get_device_names(self) -> Set[str]:
+        return {entry.title for entry in get_all_entries(self._kp)}
+
+    def get_tags(self) -> Set[str]:
+        tags = set()
+        for entry in get_all_entries(self._kp):
+            if entry.tags:
+                tags.update(entry.tags)
+        return tags
+
+    def add_devices(
+            self,
+            devices: Iterable[Device],
+            tags: List[str] = None,
+            ignore_pre_existing: bool = False
+    ) -> List[Device]:
+        return add_device_entries(self._kp, devices, tags, ignore_pre_existing)
+
+    def remove_devices(self, device_names: Iterable[str]) -> None:
+        for device_name in device_names:
+            remove_device(self._kp, device_name)
+
+    def tag_devices(self, device_tag: str, device_names: Iterable[str]) -> None:
+        for device_name in device_names:
+            tag_device(self._kp, device_tag, device_name)
+
+    def untag_devices(self, device_tag: str, device_names: Iterable[str]) -> None:
+        for device_name in device_names:
+            untag_device(self._kp, device_tag, device_name)
+
+
+INVENTORY_BACKENDS = {
+    "keepass": KeepassInventory,
+    "sqlite": SqliteInventory,
+}
+
+
+def get_inventory_path() -> str:
+    """
+    :return: the path of the inventory database of config["inventory_backend"].
+    :raises: ValueError if the backend isn't one of INVENTORY_BACKENDS.
+    """
+    backend = config["inventory_backend"]
+    if backend == "keepass":
+        return config["keepass_db_path"]
+    if backend == "sqlite":
+        return config["sqlite_db_path"]
+    raise ValueError(f"unknown inventory backend '{backend}', choose one of: {', '.join(INVENTORY_BACKENDS)}")
+
+
+def open_inventory(read_only: bool = False) -> Inventory:
+    """
+    :param read_only: if True the inventory is never saved, and it has to exist.
+    :return: the inventory of config["inventory_backend"], unlocked with config["keepass_password"].
+    """
+    inventory_path = get_inventory_path()
+    return INVENTORY_BACKENDS[config["inventory_backend"]](inventory_path, config.get("keepass_password"), read_only)
+
+
+def create_inventory(inventory_path: str, password: Optional[str] = None) -> None:
+    """
+    create an empty inventory database of config["inventory_backend"].
+    """
+    if config["inventory_backend"] == "keepass":
+        with KeepassDB(inventory_path, password) as kp:
+            kp.add_group(kp.root_group, DEVICE_GROUP_NAME)
+    else:
+        with INVENTORY_BACKENDS[config["inventory_backend"]](inventory_path, password):
+            pass
@@ -0,0 +1,151 @@
+import json
+import secrets
+import time
+from pathlib import Path
+from typing import List, Iterable, Iterator, Set, TextIO, Optional
+
+from networkcommander.config import config
+from networkcommander.deploy import DeployResult
+from networkcommander.device import Device
+from networkcommander.device_executer import PermissionLevel
+
+
+class RunJournal:
+    """
+    An append only journal of a deploy run, one json line per finished device, written as soon as the device is done.
+    an interrupted run can be resumed from its journal, and only the devices that didn't succeed get the commands again.
+
+    the first line describes the run: {"run_id", "started_at", "commands", "permission_level", "devices"},
+    where "devices" are the keys of the devices the run targeted,
+    every other line is a device: {"device", "host", "finished_at", "succeeded", "error"}.
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            run_id: str,
+            commands: List[str],
+            permission_level: PermissionLevel,
+            device_keys: Iterable[str]
+    ):
+        self.path = Path(path)
+        self.run_id = run_id
+        self.commands = list(commands)
+        self.permission_level = PermissionLevel(permission_level)
+        self.device_keys = list(device_keys)
+        self._succeeded_devices: Set[str] = set()
+        self._journal_file: Optional[TextIO] = None
+
+    @staticmethod
+    def get_path(run_id: str) -> Path:
+        return Path(config["journal_directory"]).joinpath(f"{run_id}.jsonl")
+
+    @classmethod
+    def create(cls, commands: List[str], permission_level: PermissionLevel, devices: Iterable[Device]) -> "RunJournal":
+        """
+        start the journal of a new run, its run id is made of the start time and a random suffix.
+
+        :param devices: the devices the run targets, a resumed run only ever deploys to them.
+        """
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+        device_keys = [cls.get_key(device.name, device.host) for device in devices]
+        journal = cls(cls.get_path(run_id), run_id, commands, permission_level, device_keys)
+        journal.path.parent.mkdir(parents=True, exist_ok=True)
+        journal._write({
+            "run_id": run_id,
+            "started_at": time.time(),
+            "commands": journal.commands,
+            "permission_level": journal.permission_level.value,
+            "devices": journal.device_keys
+        })
+        return journal
+
+    @classmethod
+    def resume(cls, run_id: str) -> "RunJournal":
+        """
+        load the journal of an earlier run, new results are appended to it.
+
+        :raises: FileNotFoundError if there is no journal for the run id.
+        """
+        path = cls.get_path(run_id)
+        with open(path, encoding="utf-8") as journal_file:
+            line = journal_file.readline()
+            run = json.loads(line)
+            journal = cls(path, run["run_id"], run["commands"], run["permission_level"], run["devices"])
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line of a run that crashed mid write.
+                    continue
+                key = cls.get_key(entry["device"], entry["host"])
+                if entry["succeeded"]:
+                    journal._succeeded_devices.add(key)
+                else:
+                    journal._succeeded_devices.discard(key)
+            is_last_line_complete = line.endswith("\n")
+        if not is_last_line_complete:
+            # the run crashed mid write, the next entry starts on a line of its own.
+            with open(path, "a", encoding="utf-8") as journal_file:
+                journal_file.write("\n")
+        return journal
+
+    @staticmethod
+    def get_key(device_name: str, host: str) -> str:
+        return f"{device_name}@{host}"
+
+    def has_succeeded(self, device: Device) -> bool:
+        return self.get_key(device.name, device.host) in self._succeeded_devices
+
+    def remaining_devices(self, devices: Iterable[Device]) -> List[Device]:
+        """
+        :param devices: the devices currently selected, the ones the run didn't target are left out.
+        :return: the devices of the run that didn't succeed yet.
+        :raises: LookupError if a device the run targeted isn't in the selection anymore.
+        """
+        device_keys = set(self.device_keys)
+        devices = [device for device in devices if self.get_key(device.name, device.host) in device_keys]
+        missing_device_keys = device_keys - {self.get_key(device.name, device.host) for device in devices}
+        if missing_device_keys:
+            raise LookupError(
+                f"run {self.run_id} targeted {', '.join(sorted(missing_device_keys))} "
+                "which aren't in the selected devices, resume it with the same selection"
+            )
+        return [device for device in devices if not self.has_succeeded(device)]
+
+    def record(self, device: Device, exception: Optional[BaseException]) -> None:
+        """
+        append the outcome of a device to the journal, it is flushed right away so it survives a crash.
+        """
+        self._write({
+            "device": device.name,
+            "host": device.host,
+            "finished_at": time.time(),
+            "succeeded": exception is None,
+            "error": "" if exception is None else f"{type(exception).__name__}: {exception}"
+        })
+        if exception is None:
+            self._succeeded_devices.add(self.get_key(device.name, device.host))
+
+    def journal_results(self, results: Iterable[DeployResult]) -> Iterator[DeployResult]:
+        """
+        record every result as it arrives, and pass it on.
+        """
+        try:
+            for result, device, exception in results:
+                self.record(device, exception)
+                yield result, device, exception
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+    def _write(self, entry: dict) -> None:
+        if self._journal_file is None:
+            self._journal_file = open(self.path, "a", encoding="utf-8")
+        # flushing is enough to survive a crash of the process, the journal doesn't pay for an fsync per device.
+        self._journal_file.write(json.dumps(entry) + "\n")
+        self._journal_file.flush()
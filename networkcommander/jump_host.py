@@ -0,0 +1,137 @@
+import threading
+from typing import Dict, Tuple
+
+import netmiko
+import paramiko
+
+from networkcommander.config import config
+from networkcommander.device import deconstruct_connection_string, is_enabled
+
+SSH_PORT = 22
+
+
+def parse_jump_host(jump_host: str) -> Tuple[str, str, int]:
+    """
+    :param jump_host: an ssh string of the jump host, {username}@{hostname}:{port}. the port is optional.
+    :return: the username, hostname and port of the jump host.
+    :raises: ValueError if the jump host doesn't have a username.
+    """
+    username, hostname, port = deconstruct_connection_string(jump_host.strip())
+    if not username:
+        raise ValueError(f"the jump host '{jump_host}' has to be in the format username@hostname:port")
+    return username, hostname, port or SSH_PORT
+
+
+class JumpHostPool:
+    """
+    A single authenticated ssh transport per jump host, every session to a device behind it
+    is a direct-tcpip channel over that transport instead of an ssh hop of its own.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, paramiko.SSHClient] = {}
+        self._client_locks: Dict[str, threading.Lock] = {}
+        self._pool_lock = threading.Lock()
+
+    def open_channel(self, jump_host: str, host: str, port: int) -> paramiko.Channel:
+        """
+        :param jump_host: the ssh string of the jump host.
+        :param host: the device to open the channel to, as the jump host resolves it.
+        :param port: the port of the device.
+        :return: a channel that netmiko can use as the socket of the session.
+        :raises: netmiko.NetmikoTimeoutException if the jump host or the device behind it can't be reached.
+        """
+        transport = self.get_transport(jump_host)
+        try:
+            return transport.open_channel(
+                "direct-tcpip",
+                (host, port),
+                ("127.0.0.1", 0),
+                timeout=config["jump_host_timeout"]
+            )
+        except (paramiko.SSHException, OSError) as error:
+            raise netmiko.NetmikoTimeoutException(f"{jump_host} wasn't able to reach {host}:{port}: {error}")
+
+    def get_transport(self, jump_host: str) -> paramiko.Transport:
+        """
+        :return: the transport of the jump host, it is connected on the first use and again after it dropped.
+        """
+        with self._pool_lock:
+            client_lock = self._client_locks.setdefault(jump_host, threading.Lock())
+
+        # the threads that wait for the same jump host share its login instead of each logging in.
+        with client_lock:
+            client = self._clients.get(jump_host)
+            if client is not None:
+                transport = client.get_transport()
+                if transport is not None and transport.is_active():
+                    return transport
+                client.close()
+            client = connect_to_jump_host(jump_host)
+            self._clients[jump_host] = client
+            return client.get_transport()
+
+    def close(self) -> None:
+        with self._pool_lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+def connect_to_jump_host(jump_host: str) -> paramiko.SSHClient:
+    """
+    log in to the jump host with config["jump_host_key_file"], the ssh agent, the default keys
+    or config["jump_host_password"]. its host key is checked like the host keys of the devices.
+
+    :raises: netmiko.NetmikoAuthenticationException if the jump host rejected the credentials.
+             netmiko.NetmikoTimeoutException if the jump host couldn't be reached.
+    """
+    username, hostname, port = parse_jump_host(jump_host)
+    ssh_options = config["optional_parameters"]
+    client = paramiko.SSHClient()
+    if is_enabled(ssh_options.get("system_host_keys")):
+        client.load_system_host_keys()
+    if is_enabled(ssh_options.get("ssh_strict")):
+        client.set_missing_host_key_policy(paramiko.RejectPolicy())
+    else:
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    timeout = config["jump_host_timeout"]
+    try:
+        client.connect(
+            hostname,
+            port,
+            username,
+            password=config["jump_host_password"] or None,
+            key_filename=config["jump_host_key_file"] or None,
+            timeout=timeout,
+            banner_timeout=timeout,
+            auth_timeout=timeout
+        )
+    except paramiko.AuthenticationException as error:
+        client.close()
+        raise netmiko.NetmikoAuthenticationException(f"authentication to the jump host {jump_host} failed: {error}")
+    except (paramiko.SSHException, OSError) as error:
+        client.close()
+        raise netmiko.NetmikoTimeoutException(f"wasn't able to connect to the jump host {jump_host}: {error}")
+    # keep the shared transport alive through idle firewalls while no session uses it.
+    client.get_transport().set_keepalive(30)
+    return client
+
+
+# the jump hosts of this process, every worker process of the process engine has its own.
+jump_hosts = JumpHostPool()
+
+
+def open_jump_channel(jump_host: str, device_options: dict) -> paramiko.Channel:
+    """
+    :param jump_host: the ssh string of the jump host the device is behind.
+    :param device_options: the netmiko connection arguments of the device.
+    :return: a channel to the device over the shared transport of the jump host.
+    :raises: ValueError for telnet devices, netmiko can only tunnel ssh sessions.
+    """
+    if str(device_options["device_type"]).endswith("_telnet"):
+        raise ValueError(f"{device_options['host']} is a telnet device, it can't be reached through a jump host")
+    port = int(device_options.get("port") or SSH_PORT)
+    return jump_hosts.open_channel(jump_host, device_options["host"], port)
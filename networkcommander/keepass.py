@@ -1,11 +1,16 @@
+import hashlib
 import os
-from typing import List, Any, Tuple, Set
+from typing import List, Any, Tuple, Set, Optional, Dict, Iterable
 
 import pykeepass
+from lxml import etree
 from pykeepass import pykeepass
+from pykeepass.exceptions import CredentialsError
 from rich.prompt import Prompt
 
+from networkcommander.config import config
 from networkcommander.device import Device, DeviceType
+from networkcommander.keepass_agent import get_database_key, add_database_key
 
 DEVICE_GROUP_NAME = "device"
 
@@ -13,23 +18,31 @@ DEVICE_GROUP_NAME = "device"
 class KeepassDB:
     """
     A class for creating connections to a KeePass database.
+    when the keepass agent is running, the database is unlocked with the key it holds
+    instead of the master password, and a database unlocked with the master password hands its key to the agent.
+    the database is only saved on exit if it changed, and never if it was opened read only.
 
     Usage:
         Use with a context manager (with KeepassDB(...) as kp).
     """
 
-    def __init__(self, keepass_db_path, keepass_password):
+    def __init__(self, keepass_db_path, keepass_password, read_only: bool = False):
         """
         Initialize KeepassDB with the path to the KeePass database and its password.
 
         :param keepass_db_path: Path to the KeePass database.
-        :param keepass_password: Password for the KeePass database.
+        :param keepass_password: Password for the KeePass database,
+            it is prompted for if it is needed and it isn't given.
+        :param read_only: if True the database is never saved, and it has to exist.
         """
         self._keepass_db_path = keepass_db_path
         self._keepass_password = keepass_password
-        if not self._keepass_password:
-            self._keepass_password = KeepassDB.prompt_for_password()
+        self._read_only = read_only
         self._kp = None
+        # the digest of the database when it was opened, it is compared on exit to know if it changed.
+        self._opened_digest: Optional[bytes] = None
+        # the key that unlocks the database file, None for a database this connection created.
+        self._transformed_key: Optional[bytes] = None
 
     def __enter__(self) -> pykeepass.PyKeePass:
         """
@@ -38,27 +51,81 @@ class KeepassDB:
         :return: The connection to the KeePass database object.
         """
         if not os.path.isfile(self._keepass_db_path):
+            if self._read_only:
+                raise FileNotFoundError(f"the keepass database {self._keepass_db_path} doesn't exist")
+            # the transformed key of a new database is the key of the template it was created from,
+            # it isn't handed to the agent or used to save, the database gets its real key once it is opened.
             self._kp = pykeepass.create_database(
                 self._keepass_db_path,
-                password=self._keepass_password
+                password=self._get_password()
             )
         else:
-            self._kp = pykeepass.PyKeePass(
-                self._keepass_db_path,
-                password=self._keepass_password
-            )
+            self._kp = self._open_with_agent()
+            if self._kp is None:
+                self._kp = pykeepass.PyKeePass(
+                    self._keepass_db_path,
+                    password=self._get_password()
+                )
+                self._add_key_to_agent()
+            self._transformed_key = self._kp.transformed_key
+        if not self._read_only:
+            self._opened_digest = self._get_digest()
         return self._kp
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """
-        Saves the KeePass database when exiting the context manager.
+        Saves the KeePass database when exiting the context manager, if it changed.
+        saving derives the key and encrypts the whole database again, so it is skipped when nothing changed.
 
         :param exc_type: Exception type.
         :param exc_val: Exception value.
         :param exc_tb: Exception traceback.
         """
-        if not exc_val:
-            self._kp.save()
+        try:
+            if not exc_val and self.is_dirty():
+                # saving with the key keeps the salt of the key derivation, so the key the agent holds stays valid.
+                self._kp.save(transformed_key=self._transformed_key)
+        finally:
+            drop_device_index(self._kp)
+
+    def is_dirty(self) -> bool:
+        """
+        :return: True if the database changed since it was opened, always False for a read only database.
+        """
+        if self._read_only or self._kp is None:
+            return False
+        return self._get_digest() != self._opened_digest
+
+    def _get_digest(self) -> bytes:
+        return hashlib.sha256(etree.tostring(self._kp.tree)).digest()
+
+    def _open_with_agent(self) -> Optional[pykeepass.PyKeePass]:
+        """
+        :return: the database unlocked with the key of the keepass agent,
+            or None if the agent isn't used, isn't running or its key doesn't unlock the database.
+        """
+        if not config["use_keepass_agent"]:
+            return None
+        key = get_database_key(config["keepass_agent_socket"], self._keepass_db_path)
+        if key is None:
+            return None
+        try:
+            return pykeepass.PyKeePass(self._keepass_db_path, transformed_key=key)
+        except CredentialsError:
+            # the database was saved by another program with a new salt, the master password is needed again.
+            return None
+
+    def _add_key_to_agent(self) -> None:
+        """
+        hand the key of the database to the keepass agent, so the next commands don't need the master password.
+        """
+        if config["use_keepass_agent"]:
+            add_database_key(config["keepass_agent_socket"], self._keepass_db_path, self._kp.transformed_key)
+
+    def _get_password(self) -> str:
+        if not self._keepass_password:
+            self._keepass_password = KeepassDB.prompt_for_password()
+        return self._keepass_password
 
     @staticmethod
     def prompt_for_password():
@@ -71,6 +138,66 @@ class KeepassDB:
         return password
 
 
+class DeviceIndex:
+    """
+    The entries of the device group by their title and by their host, so looking up a device
+    doesn't search the xml tree of the database.
+    the index is built once per database connection, entries have to be added and removed
+    through this module for it to stay in sync.
+    """
+
+    def __init__(self, kp: pykeepass.PyKeePass):
+        self.device_group = kp.find_groups(name=DEVICE_GROUP_NAME, first=True)
+        self._by_title: Dict[str, List[pykeepass.Entry]] = {}
+        self._by_host: Dict[str, List[pykeepass.Entry]] = {}
+        for entry in kp.find_entries(group=self.device_group):
+            self.add(entry)
+
+    def add(self, entry: pykeepass.Entry) -> None:
+        self._by_title.setdefault(entry.title, []).append(entry)
+        host = entry.get_custom_property("host")
+        if host:
+            self._by_host.setdefault(host, []).append(entry)
+
+    def remove(self, entry: pykeepass.Entry) -> None:
+        for entries, key in ((self._by_title, entry.title), (self._by_host, entry.get_custom_property("host"))):
+            key_entries = entries.get(key, [])
+            if entry in key_entries:
+                key_entries.remove(entry)
+            if not key_entries:
+                entries.pop(key, None)
+
+    def get_by_title(self, title: str) -> List[pykeepass.Entry]:
+        return list(self._by_title.get(title, []))
+
+    def get_by_host(self, host: str) -> List[pykeepass.Entry]:
+        return list(self._by_host.get(host, []))
+
+
+# the index of every open database connection. the indexed entries keep their connection alive,
+# so an index has to be dropped with drop_device_index, KeepassDB does it when it exits.
+_device_indexes: Dict[pykeepass.PyKeePass, DeviceIndex] = {}
+
+
+def get_device_index(kp: pykeepass.PyKeePass) -> DeviceIndex:
+    """
+    :param kp: The connection to the KeePass database.
+    :return: the index of the device entries of the connection, it is built on the first lookup.
+    """
+    index = _device_indexes.get(kp)
+    if index is None:
+        index = DeviceIndex(kp)
+        _device_indexes[kp] = index
+    return index
+
+
+def drop_device_index(kp: pykeepass.PyKeePass) -> None:
+    """
+    forget the index of a connection that is closed.
+    """
+    _device_indexes.pop(kp, None)
+
+
 def get_all_entries(kp: pykeepass.PyKeePass) -> Tuple[pykeepass.Entry]:
     primary_group = kp.find_groups(name=DEVICE_GROUP_NAME)[0]
     entries = primary_group.entries
@@ -117,7 +244,8 @@ def entry_to_device(device_entry: pykeepass.Entry) -> Device:
         return key not in required_properties
 
     optional_parameters = dict(filter(key_in_required_properties, custom_properties.items()))
-    device_entry = Device(name, username, password, host, device_type, optional_parameters)
+    tags = tuple(device_entry.tags) if device_entry.tags else ()
+    device_entry = Device(name, username, password, host, device_type, optional_parameters, tags)
     return device_entry
 
 
@@ -195,9 +323,7 @@ def does_device_exist(kp: pykeepass.PyKeePass, device_name: str) -> bool:
     :param device_name: The name of the device to check.
     :Returns: True if the device exists, False otherwise.
     """
-    device_group = kp.find_groups(name=DEVICE_GROUP_NAME)[0]
-    devices = kp.find_entries(group=device_group, title=device_name)
-    return bool(devices)
+    return bool(get_device_index(kp).get_by_title(device_name))
 
 
 def get_device(kp: pykeepass.PyKeePass, device_name: str):
@@ -226,8 +352,10 @@ def remove_device(kp: pykeepass.PyKeePass, device_name: str) -> None:
     """
     if not does_device_exist(kp, device_name):
         raise LookupError(f"{device_name} doesn't exist in db")
+    index = get_device_index(kp)
     device_entries = get_device_entries(kp, device_name)
     for device_entry in device_entries:
+        index.remove(device_entry)
         kp.delete_entry(device_entry)
 
 
@@ -240,13 +368,23 @@ def get_device_entries(kp: pykeepass.PyKeePass, device_name: str):
     :Returns: A list of pykeepass.Entry objects representing the retrieved device entries.
     :Raises: LookupError if the device does not exist in the database.
     """
-    if not does_device_exist(kp, device_name):
+    device_entries = get_device_index(kp).get_by_title(device_name)
+    if not device_entries:
         raise LookupError(f"{device_name} doesn't exist in db")
-    device_group = kp.find_groups(name=DEVICE_GROUP_NAME)[0]
-    device_entries = kp.find_entries(group=device_group, title=device_name)
     return device_entries
 
 
+def get_devices_by_host(kp: pykeepass.PyKeePass, host: str) -> List[Device]:
+    """
+    Retrieve the devices that are reached through the given host.
+
+    :param kp: The connection to the KeePass database.
+    :param host: The host of the devices.
+    :Returns: A list of Device objects, empty if no device has this host.
+    """
+    return list(map(entry_to_device, get_device_index(kp).get_by_host(host)))
+
+
 def add_device_entry(kp: pykeepass.PyKeePass, device: Device, tags: List[str] = None) -> None:
     """
     Add a device entry to the KeePass database.
@@ -260,11 +398,54 @@ def add_device_entry(kp: pykeepass.PyKeePass, device: Device, tags: List[str] =
     if not entry_title:
         raise ValueError("device doesn't have a name...")
 
-    if does_device_exist(kp, entry_title):
+    index = get_device_index(kp)
+    if index.get_by_title(entry_title):
         raise LookupError(f"{entry_title} already exist in db")
 
-    device_group = kp.find_groups(name=DEVICE_GROUP_NAME)[0]
+    _add_entry(kp, index, device, tags)
+
 
+def add_device_entries(
+        kp: pykeepass.PyKeePass,
+        devices: Iterable[Device],
+        tags: List[str] = None,
+        ignore_pre_existing: bool = False
+) -> List[Device]:
+    """
+    Add many device entries to the KeePass database.
+    the whole batch is validated before any entry is added, so a batch that fails leaves the database as it was.
+
+    :param kp: The connection to the KeePass database.
+    :param devices: The Device objects to add.
+    :param tags: Optional list of tags to assign to every entry.
+    :param ignore_pre_existing: if True, devices whose name is already in the database or earlier in the batch
+        are skipped instead of failing the batch.
+    :Returns: The devices that were added.
+    :Raises: ValueError if a device doesn't have a name.
+             LookupError if devices already exist in the database or appear twice in the batch.
+    """
+    index = get_device_index(kp)
+    devices_to_add = []
+    batch_device_names = set()
+    pre_existing_device_names = []
+    for device in devices:
+        if not device.name:
+            raise ValueError(f"device {device} doesn't have a name...")
+        if device.name in batch_device_names or index.get_by_title(device.name):
+            pre_existing_device_names.append(device.name)
+            continue
+        batch_device_names.add(device.name)
+        devices_to_add.append(device)
+
+    if pre_existing_device_names and not ignore_pre_existing:
+        raise LookupError(f"devices [{', '.join(pre_existing_device_names)}] already exist in db")
+
+    for device in devices_to_add:
+        _add_entry(kp, index, device, tags)
+    return devices_to_add
+
+
+def _add_entry(kp: pykeepass.PyKeePass, index: DeviceIndex, device: Device, tags: Optional[List[str]]) -> None:
     username = device.username
     password = device.password
     if not username:
@@ -272,7 +453,10 @@ def add_device_entry(kp: pykeepass.PyKeePass, device: Device, tags: List[str] =
     if not password:
         password = ""
 
-    new_entry = kp.add_entry(device_group, entry_title, username, password, tags=tags)
+    # the name was already checked against the index, the entry is created directly because
+    # kp.add_entry searches the whole group for it even when force_creation is set.
+    new_entry = pykeepass.Entry(title=device.name, username=username, password=password, tags=tags, kp=kp)
+    index.device_group.append(new_entry)
 
     custom_properties = {
         "host": device.host,
@@ -281,6 +465,7 @@ def add_device_entry(kp: pykeepass.PyKeePass, device: Device, tags: List[str] =
     }
     for key, val in custom_properties.items():
         new_entry.set_custom_property(key, str(val), True)
+    index.add(new_entry)
 
 
 def tag_device(kp: pykeepass.PyKeePass, device_tag: str, device_name: str):
@@ -292,10 +477,7 @@ def tag_device(kp: pykeepass.PyKeePass, device_tag: str, device_name: str):
     :param device_name: The name of the device entry.
     :Raises: LookupError if the device does not exist in the database.
     """
-    if not does_device_exist(kp, device_name):
-        raise LookupError(f"{device_name} doesn't exist in db")
-    device_group = kp.find_groups(name=DEVICE_GROUP_NAME)[0]
-    device_entries = kp.find_entries(group=device_group, title=device_name)
+    device_entries = get_device_entries(kp, device_name)
 
     for device_entry in device_entries:
         tags = device_entry.tags
@@ -316,10 +498,7 @@ def untag_device(kp: pykeepass.PyKeePass, device_tag: str, device_name: str):
     :raises: LookupError if the device does not exist in the database.
              ValueError if the device is not tagged with the specified tag.
     """
-    if not does_device_exist(kp, device_name):
-        raise LookupError(f"{device_name} doesn't exist in db")
-    device_group = kp.find_groups(name=DEVICE_GROUP_NAME)[0]
-    device_entries = kp.find_entries(group=device_group, title=device_name)
+    device_entries = get_device_entries(kp, device_name)
 
     for device_entry in device_entries:
         tags = device_entry.tags
@@ -0,0 +1,191 @@
+import base64
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Dict, Tuple, Optional
+
+
+class KeyStore:
+    """
+    The derived keys of unlocked keepass databases by the path of the database.
+    a key is forgotten lifetime seconds after it was added.
+    """
+
+    def __init__(self, lifetime: float):
+        """
+        :param lifetime: the amount of seconds a key is kept after it was added.
+        """
+        self._lifetime = lifetime
+        self._keys: Dict[str, Tuple[bytes, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, database_path: str) -> Optional[bytes]:
+        """
+        :return: the key of the database, or None if it wasn't added or it expired.
+        """
+        with self._lock:
+            key, expires_at = self._keys.get(database_path, (None, 0.0))
+            if key is not None and expires_at <= time.monotonic():
+                del self._keys[database_path]
+                return None
+            return key
+
+    def add(self, database_path: str, key: bytes) -> None:
+        with self._lock:
+            self._keys[database_path] = (key, time.monotonic() + self._lifetime)
+
+    def forget(self, database_path: Optional[str] = None) -> None:
+        """
+        forget the key of the database, or every key if no database is given.
+        """
+        with self._lock:
+            if database_path is None:
+                self._keys.clear()
+            else:
+                self._keys.pop(database_path, None)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class KeepassAgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A unix socket server that hands out the keys of a KeyStore, every request and response is a single line of json.
+    the socket is only accessible by the user that started the agent.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, key_store: KeyStore):
+        self.key_store = key_store
+        super().__init__(socket_path, KeepassAgentRequestHandler)
+
+
+class KeepassAgentRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        action = request.get("action")
+        key_store: KeyStore = self.server.key_store
+        if action == "get":
+            key = key_store.get(request["path"])
+            self.respond({"key": None if key is None else base64.b64encode(key).decode("ascii")})
+        elif action == "add":
+            key_store.add(request["path"], base64.b64decode(request["key"]))
+            self.respond({})
+        elif action == "lock":
+            key_store.forget(request.get("path"))
+            self.respond({})
+        elif action == "shutdown":
+            key_store.forget()
+            self.respond({})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            self.respond({"error": f"unknown action {action}"})
+
+    def respond(self, response: dict):
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+def serve_agent(socket_path: str, lifetime: float) -> None:
+    """
+    run the keepass agent in the foreground until it is asked to shut down.
+
+    :param socket_path: the path of the unix socket the agent listens on.
+    :param lifetime: the amount of seconds the agent keeps the key of a database after it was unlocked.
+    :raises: OSError if the platform doesn't support unix sockets.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("the keepass agent needs unix sockets, which this platform doesn't support")
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    key_store = KeyStore(lifetime)
+    old_umask = os.umask(0o177)
+    try:
+        server = KeepassAgentServer(socket_path, key_store)
+    finally:
+        os.umask(old_umask)
+
+    try:
+        with server:
+            server.serve_forever()
+    finally:
+        key_store.forget()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def is_agent_running(socket_path: str) -> bool:
+    """
+    :param socket_path: the path of the unix socket the agent listens on.
+    :return: True if an agent accepts connections on socket_path.
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def send_agent_request(socket_path: str, request: dict) -> dict:
+    """
+    send a single request to the agent and wait for its response.
+
+    :raises: ConnectionError if the agent closed the connection without responding.
+             RuntimeError if the agent didn't understand the request.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        with client.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode("utf-8") + b"\n")
+            stream.flush()
+            line = stream.readline()
+    if not line:
+        raise ConnectionError("the keepass agent closed the connection without responding")
+    response = json.loads(line)
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return response
+
+
+def get_database_key(socket_path: str, database_path: str) -> Optional[bytes]:
+    """
+    :return: the key the agent holds for the database, or None if the agent isn't running or doesn't have it.
+    """
+    if not is_agent_running(socket_path):
+        return None
+    key = send_agent_request(socket_path, {"action": "get", "path": os.path.realpath(database_path)})["key"]
+    return None if key is None else base64.b64decode(key)
+
+
+def add_database_key(socket_path: str, database_path: str, key: bytes) -> None:
+    """
+    hand the key of an unlocked database to the agent, if it is running.
+    """
+    if not is_agent_running(socket_path):
+        return
+    send_agent_request(socket_path, {
+        "action": "add",
+        "path": os.path.realpath(database_path),
+        "key": base64.b64encode(key).decode("ascii")
+    })
+
+
+def lock_agent(socket_path: str, database_path: Optional[str] = None) -> None:
+    """
+    make the agent forget the key of the database, or every key if no database is given.
+    """
+    path = None if database_path is None else os.path.realpath(database_path)
+    send_agent_request(socket_path, {"action": "lock", "path": path})
+
+
+def stop_agent(socket_path: str) -> None:
+    """
+    ask the agent listening on socket_path to forget its keys and exit.
+    """
+    send_agent_request(socket_path, {"action": "shutdown"})
@@ -1,26 +1,32 @@
 import json
 import os.path
 import sys
-from functools import reduce
+import time
 from pathlib import Path
-from typing import List, Optional, Iterable, Union, Set, Tuple
+from typing import List, Optional, Iterable, Set, Tuple, Iterator, NoReturn
 
 import netmiko
-import pykeepass.entry
 import rich
 import typer
 from rich.progress import Progress
 
 from networkcommander.__init__ import __version__
+from networkcommander.concurrency import AIMDLimiter
 from networkcommander.config import config, USER_CONFIG_FILE
-from networkcommander.deploy import deploy_commands
+from networkcommander.deploy import deploy_commands, ExecutionEngine, DeviceTimeoutError
 from networkcommander.device import device_from_string, Device
 from networkcommander.device_executer import PermissionLevel
+from networkcommander.health import HealthStore, CircuitBreakerMode, CircuitOpenError
 from networkcommander.init import is_initialized, init_program, delete_project_files
+from networkcommander.output_sink import FileSinkFactory, StdoutSinkFactory, flush_open_file_sinks
+from networkcommander.ping import PingMode, get_ping_executer
+from networkcommander.result_cache import ResultCache, CachedOutput
+from networkcommander.rollout import deploy_in_waves, RolloutHaltedError
+from networkcommander.journal import RunJournal
 from networkcommander.io_utils import print_objects, read_file, read_from_stdin, convert_to_yaml
-from networkcommander.keepass import KeepassDB, get_all_device_entries, remove_device, \
-    add_device_entry, get_all_entries, entry_to_device, \
-    tag_entry, untag_entry, is_entry_tagged, is_entry_tagged_by_tag_set
+from networkcommander.session_daemon import serve, stop_daemon, is_daemon_running
+from networkcommander.keepass_agent import serve_agent, stop_agent, lock_agent, is_agent_running
+from networkcommander.inventory import Inventory, open_inventory, get_inventory_path
 
 app = typer.Typer(pretty_exceptions_show_locals=False)
 
@@ -38,6 +44,20 @@ tag_command_group = typer.Typer(
 
 device_command_group.add_typer(tag_command_group, name="tag")
 
+daemon_command_group = typer.Typer(
+    pretty_exceptions_show_locals=False,
+    help="keep device sessions warm between runs"
+)
+
+app.add_typer(daemon_command_group, name="daemon")
+
+agent_command_group = typer.Typer(
+    pretty_exceptions_show_locals=False,
+    help="keep the keepass database unlocked between commands"
+)
+
+app.add_typer(agent_command_group, name="agent")
+
 
 @app.command()
 def version():
@@ -76,7 +96,7 @@ def initialization_check(keepass_password: Optional[str] = typer.Option(None)):
     config['keepass_password'] = keepass_password
     if not is_initialized(
             config['commander_directory'],
-            config['keepass_db_path'],
+            get_inventory_path(),
             USER_CONFIG_FILE
     ):
         raise EnvironmentError("program is not initialized, please run commander init!")
@@ -88,10 +108,8 @@ def add_tag(device_tag: str, device_names: List[str]):
     add a tag to devices
     """
     device_names_to_be_tagged = set(device_names)
-    with KeepassDB(config['keepass_db_path'], config['keepass_password']) as kp:
-        all_entries = get_all_entries(kp)
-        all_devices = entries_to_devices(all_entries)
-        all_device_names = extract_device_names(all_devices)
+    with open_inventory() as inventory:
+        all_device_names = inventory.get_device_names()
 
         # if someone entered a wrong device name, it can't be tagged so an error is raised
         fabricated_device_names = device_names_to_be_tagged - all_device_names
@@ -99,10 +117,7 @@ def add_tag(device_tag: str, device_names: List[str]):
             raise LookupError(f"devices [{', '.join(fabricated_device_names)}] doesn't exist")
 
         # if someone entered a device that was already tagged it can't be tagged again
-
-        every_tagged_entries = filter(is_entry_tagged(device_tag), all_entries)
-        every_tagged_devices = entries_to_devices(every_tagged_entries)
-        every_tagged_device_name = extract_device_names(every_tagged_devices)
+        every_tagged_device_name = extract_device_names(inventory.get_devices({device_tag}))
 
         # if there are any devices that need to be tagged and are already tagged they will be in
         # the intersection between the two groups
@@ -113,31 +128,17 @@ def add_tag(device_tag: str, device_names: List[str]):
             raise ValueError(
                 f"devices [{', '.join(device_names_already_tagged_that_need_to_be_tagged)}] are already tagged"
             )
-        entries_to_tag = filter(lambda entry: entry.title in device_names_to_be_tagged, all_entries)
-        for entry_to_tag in entries_to_tag:
-            tag_entry(entry_to_tag, device_tag)
+        inventory.tag_devices(device_tag, device_names_to_be_tagged)
         rich.print(f"added '{device_tag}' tag to {len(device_names_to_be_tagged)} devices")
 
 
-def entries_to_devices(entries: Iterable[pykeepass.entry.Entry]) -> Tuple[Device]:
-    return tuple((entry_to_device(entry) for entry in entries))
-
-
 @tag_command_group.command(name="list")
 def list_tags():
     """
     list every tag you put on devices
     """
-    with KeepassDB(config['keepass_db_path'], config['keepass_password']) as kp:
-        all_entries = get_all_entries(kp)
-    entries_tags: List[Union[List[str], None]] = [entry.tags for entry in all_entries]
-    entries_tags_without_none: Iterable[List[str]] = filter(None, entries_tags)
-    flatten_tag_list: Iterable[str] = reduce(
-        lambda aggregate, tags: aggregate + tags,
-        entries_tags_without_none,
-        []
-    )
-    unique_tags = set(flatten_tag_list)
+    with open_inventory(read_only=True) as inventory:
+        unique_tags = inventory.get_tags()
     print_objects(unique_tags, "tags")
 
 
@@ -147,16 +148,12 @@ def remove_tag(device_tag: str, device_names: List[str]):
     remove a tag from devices
     """
     device_names_to_be_untagged = set(device_names)
-    with KeepassDB(config['keepass_db_path'], config['keepass_password']) as kp:
-        all_entries = get_all_entries(kp)
-        all_devices = entries_to_devices(all_entries)
-        all_device_names = extract_device_names(all_devices)
+    with open_inventory() as inventory:
+        all_device_names = inventory.get_device_names()
         non_existent_devices = device_names_to_be_untagged - all_device_names
         if non_existent_devices:
             raise LookupError(f"devices {', '.join(non_existent_devices)} doesn't exist")
-        entries_to_untag = filter(lambda entry: entry.title in device_names_to_be_untagged, all_entries)
-        for entry_to_untag in entries_to_untag:
-            untag_entry(entry_to_untag, device_tag)
+        inventory.untag_devices(device_tag, device_names_to_be_untagged)
         rich.print(f"removed {device_tag} from {len(device_names)} devices")
 
 
@@ -168,13 +165,68 @@ def ping(
             "-t",
             help="ping the devices matching these tags",
             show_default=False
+        ),
+        engine: ExecutionEngine = typer.Option(
+            None,
+            "--engine",
+            "-e",
+            help="the engine that runs the device sessions (defaults to the 'engine' config value)",
+            show_default=False
+        ),
+        use_session_daemon: bool = typer.Option(
+            None,
+            "--daemon/--no-daemon",
+            help="run the commands through the warm sessions of the session daemon when it is running "
+                 "(defaults to the 'use_session_daemon' config value)",
+            show_default=False
+        ),
+        adaptive_concurrency: bool = typer.Option(
+            None,
+            "--adaptive/--static",
+            help="adapt the amount of parallel sessions to the latency and error rate of the devices "
+                 "(defaults to the 'adaptive_concurrency' config value)",
+            show_default=False
+        ),
+        probe: bool = typer.Option(
+            None,
+            "--probe/--no-probe",
+            help="check that every device accepts a tcp connection before logging in to it "
+                 "(defaults to the 'tcp_probe' config value)",
+            show_default=False
+        ),
+        retries: int = typer.Option(
+            None,
+            "--retries",
+            help="the amount of times to retry a device that couldn't be reached, with a jittered exponential "
+                 "backoff (defaults to the 'retries' config value)",
+            show_default=False
+        ),
+        circuit_breaker: CircuitBreakerMode = typer.Option(
+            None,
+            "--circuit-breaker",
+            help="what to do with devices that failed to connect 'circuit_breaker_threshold' runs in a row, "
+                 "off, defer - try them last, skip - skip them until the cooldown expires "
+                 "(defaults to the 'circuit_breaker' config value)",
+            show_default=False
+        ),
+        ping_mode: PingMode = typer.Option(
+            PingMode.LOGIN,
+            "--mode",
+            "-m",
+            help="login - log in like deploy does, auth - stop right after the ssh authentication, "
+                 "banner - only read the ssh banner"
         )
 ):
     """
     try to connect to the devices in your database.
     """
-    with KeepassDB(config['keepass_db_path'], config['keepass_password']) as kp:
-        devices = get_all_device_entries(kp, set(tags))
+    if use_session_daemon is not None:
+        config["use_session_daemon"] = use_session_daemon
+    limiter = create_limiter(adaptive_concurrency)
+    health_store = create_health_store(retries, circuit_breaker)
+
+    with open_inventory(read_only=True) as inventory:
+        devices = inventory.get_devices(set(tags))
 
     if not devices:
         if not tags:
@@ -190,22 +242,72 @@ def ping(
         task = progress.add_task("connecting to devices...", total=len(devices))
 
         # deploy no commands just to test connectivity
-        for _, device, exception in deploy_commands([], devices, PermissionLevel.USER):
-            if exception:
-                try:
-                    raise exception
-                except KeyboardInterrupt:
-                    print("keyboard Interrupt")
-                    sys.exit(1)
-                except netmiko.NetmikoAuthenticationException:
-                    print(f"wasn't able to authenticate to {str(device)}", file=sys.stderr)
-                except netmiko.NetmikoTimeoutException:
-                    print(f"wasn't able to connect to {str(device)}", file=sys.stderr)
-                except Exception as exception:
-                    print(f"device {str(device)} encountered an exception: {exception}", file=sys.stderr)
-            else:
-                rich.print(f"connected successfully to {str(device)}")
-            progress.advance(task)
+        results = deploy_commands(
+            [],
+            devices,
+            PermissionLevel.USER,
+            engine,
+            limiter,
+            probe,
+            get_ping_executer(ping_mode),
+            health_store=health_store
+        )
+        try:
+            for _, device, exception in results:
+                if exception:
+                    try:
+                        raise exception
+                    except KeyboardInterrupt:
+                        print("keyboard Interrupt")
+                        sys.exit(1)
+                    except netmiko.NetmikoAuthenticationException:
+                        print(f"wasn't able to authenticate to {str(device)}", file=sys.stderr)
+                    except netmiko.NetmikoTimeoutException:
+                        print(f"wasn't able to connect to {str(device)}", file=sys.stderr)
+                    except Exception as exception:
+                        print(f"device {str(device)} encountered an exception: {exception}", file=sys.stderr)
+                else:
+                    rich.print(f"connected successfully to {str(device)}")
+                progress.advance(task)
+        except KeyboardInterrupt:
+            progress.stop()
+            cancel_run(results, f"interrupted after {progress.tasks[task].completed:.0f} of {len(devices)} devices")
+
+    report_limiter(limiter)
+
+
+def create_limiter(adaptive_concurrency: Optional[bool]) -> Optional[AIMDLimiter]:
+    """
+    :param adaptive_concurrency: the value of the --adaptive/--static flag, None if it wasn't given.
+    :return: an AIMDLimiter if adaptive concurrency is on, otherwise None so the engine keeps its static limit.
+    """
+    if adaptive_concurrency is None:
+        adaptive_concurrency = config["adaptive_concurrency"]
+    if not adaptive_concurrency:
+        return None
+    return AIMDLimiter.from_config()
+
+
+def create_health_store(
+        retries: Optional[int], circuit_breaker: Optional[CircuitBreakerMode]
+) -> Optional[HealthStore]:
+    """
+    :param retries: the value of the --retries option, None if it wasn't given.
+    :param circuit_breaker: the value of the --circuit-breaker option, None if it wasn't given.
+    :return: the HealthStore the outcome of every session is recorded in, None if the circuit breaker is off.
+    """
+    if retries is not None:
+        config["retries"] = retries
+    if circuit_breaker is not None:
+        config["circuit_breaker"] = circuit_breaker.value
+    if CircuitBreakerMode(config["circuit_breaker"]) == CircuitBreakerMode.OFF:
+        return None
+    return HealthStore.from_config()
+
+
+def report_limiter(limiter: Optional[AIMDLimiter]) -> None:
+    if limiter:
+        rich.print(f"settled on {limiter.limit} concurrent sessions")
 
 
 @device_command_group.command()
@@ -235,27 +337,146 @@ def deploy(
             "-d",
             help="you can specify devices you wish would run these commands on."
         ),
+        engine: ExecutionEngine = typer.Option(
+            None,
+            "--engine",
+            "-e",
+            help="the engine that runs the device sessions (defaults to the 'engine' config value)",
+            show_default=False
+        ),
+        use_session_daemon: bool = typer.Option(
+            None,
+            "--daemon/--no-daemon",
+            help="run the commands through the warm sessions of the session daemon when it is running "
+                 "(defaults to the 'use_session_daemon' config value)",
+            show_default=False
+        ),
+        adaptive_concurrency: bool = typer.Option(
+            None,
+            "--adaptive/--static",
+            help="adapt the amount of parallel sessions to the latency and error rate of the devices "
+                 "(defaults to the 'adaptive_concurrency' config value)",
+            show_default=False
+        ),
+        probe: bool = typer.Option(
+            None,
+            "--probe/--no-probe",
+            help="check that every device accepts a tcp connection before logging in to it "
+                 "(defaults to the 'tcp_probe' config value)",
+            show_default=False
+        ),
+        retries: int = typer.Option(
+            None,
+            "--retries",
+            help="the amount of times to retry a device that couldn't be reached, with a jittered exponential "
+                 "backoff (defaults to the 'retries' config value)",
+            show_default=False
+        ),
+        circuit_breaker: CircuitBreakerMode = typer.Option(
+            None,
+            "--circuit-breaker",
+            help="what to do with devices that failed to connect 'circuit_breaker_threshold' runs in a row, "
+                 "off, defer - try them last, skip - skip them until the cooldown expires "
+                 "(defaults to the 'circuit_breaker' config value)",
+            show_default=False
+        ),
+        pipeline_commands: bool = typer.Option(
+            None,
+            "--pipeline/--no-pipeline",
+            help="send read only commands together without waiting for the prompt between them "
+                 "(defaults to the 'pipeline_commands' config value)",
+            show_default=False
+        ),
+        time_budget: float = typer.Option(
+            None,
+            "--device-budget",
+            help="the amount of seconds a single device can take before its session is aborted "
+                 "(defaults to the 'device_time_budget' config value, 0 means no limit)",
+            show_default=False
+        ),
+        deadline: float = typer.Option(
+            None,
+            "--deadline",
+            help="the amount of seconds the whole run can take, the devices that aren't done by then are "
+                 "reported as timed out (defaults to the 'run_deadline' config value, 0 means no limit)",
+            show_default=False
+        ),
+        wave_sizes: List[str] = typer.Option(
+            None,
+            "--wave",
+            "-w",
+            help="roll out in waves, the size of a wave is an amount of devices or a percentage of them (like 1%). "
+                 "repeat it for every wave, the devices that are left form the last wave "
+                 "(defaults to the 'rollout_waves' config value)",
+            show_default=False
+        ),
+        error_threshold: str = typer.Option(
+            None,
+            "--error-threshold",
+            help="stop the rollout after a wave with more failed devices than this, an amount or a percentage of "
+                 "the wave (defaults to the 'rollout_error_threshold' config value)",
+            show_default=False
+        ),
+        use_result_cache: bool = typer.Option(
+            None,
+            "--cache/--no-cache",
+            help="serve the output of read only commands from the result cache if it was collected in the last "
+                 "'result_cache_ttl' seconds, --no-cache always connects to the devices "
+                 "(defaults to the 'result_cache' config value)",
+            show_default=False
+        ),
+        stream: bool = typer.Option(
+            False,
+            "--stream",
+            help="print the output of every device line by line while it arrives, instead of once the device is done",
+            show_default=False
+        ),
+        resume_run_id: str = typer.Option(
+            None,
+            "--resume",
+            help="resume an interrupted run by its run id, only the devices that didn't succeed get the commands",
+            show_default=False
+        ),
 ):
     """
     deploy command to all the devices in your database that match the tags.
     """
+    if use_session_daemon is not None:
+        config["use_session_daemon"] = use_session_daemon
+    if pipeline_commands is not None:
+        config["pipeline_commands"] = pipeline_commands
+    if use_result_cache is not None:
+        config["result_cache"] = use_result_cache
+    limiter = create_limiter(adaptive_concurrency)
+    health_store = create_health_store(retries, circuit_breaker)
+
     create_folder_if_non_existent(output_folder)
 
     if not extra_device_names:
         extra_device_names = []
 
-    with KeepassDB(config['keepass_db_path'], config['keepass_password']) as kp:
-        all_entries = get_all_entries(kp)
-
-    if not tags:
-        devices = entries_to_devices(all_entries)
-    else:
-        tags = set(tags)
-        devices = get_devices_from_tags_and_names(all_entries, set(extra_device_names), tags)
+    with open_inventory(read_only=True) as inventory:
+        if not tags:
+            devices = inventory.get_devices()
+        else:
+            tags = set(tags)
+            devices = get_devices_from_tags_and_names(inventory, set(extra_device_names), tags)
 
     if not devices:
         raise ValueError("you don't have any devices in the database.")
 
+    if resume_run_id:
+        journal = RunJournal.resume(resume_run_id)
+        if journal.commands != list(commands) or journal.permission_level != permission_level:
+            raise ValueError(
+                f"run {resume_run_id} deployed {journal.commands} at the {journal.permission_level.value} "
+                "permission level, resume it with the same commands"
+            )
+        devices = journal.remaining_devices(devices)
+        if not devices:
+            rich.print(f"every device already succeeded in run {resume_run_id}")
+            return
+
     print_objects(devices, "devices")
     print_objects(commands, "commands")
 
@@ -264,12 +485,65 @@ def deploy(
         abort=True
     )
 
+    if not resume_run_id:
+        journal = RunJournal.create(commands, permission_level, devices)
+    rich.print(f"run id {journal.run_id}, if it is interrupted resume it with --resume {journal.run_id}")
+
     with Progress() as progress:
         task = progress.add_task("connecting to devices...", total=len(devices))
 
-        for result, device, exception in deploy_commands(commands, devices, permission_level):
-            handel_results(device, exception, output_folder, result)
-            progress.advance(task)
+        # the output is written while it arrives, so only a single command's output per session is held in memory.
+        output_sink_factory = None
+        if output_folder:
+            output_sink_factory = FileSinkFactory(output_folder)
+        elif stream:
+            output_sink_factory = StdoutSinkFactory()
+
+        result_cache = ResultCache.from_config() if config["result_cache"] else None
+        results = deploy_in_waves(
+            commands,
+            devices,
+            permission_level,
+            wave_sizes or None,
+            error_threshold,
+            deadline,
+            engine=engine,
+            limiter=limiter,
+            probe=probe,
+            output_sink_factory=output_sink_factory,
+            result_cache=result_cache,
+            health_store=health_store,
+            time_budget=time_budget
+        )
+        journaled_results = journal.journal_results(results)
+        try:
+            for result, device, exception in journaled_results:
+                handel_results(device, exception, output_sink_factory, result)
+                progress.advance(task)
+        except KeyboardInterrupt:
+            progress.stop()
+            cancel_run(
+                journaled_results,
+                f"interrupted after {progress.tasks[task].completed:.0f} of {len(devices)} devices, "
+                f"resume the rest with --resume {journal.run_id}"
+            )
+
+    report_limiter(limiter)
+
+
+def cancel_run(results: Iterator, message: str) -> NoReturn:
+    """
+    close the results, which aborts the live sessions and saves the journal, the health of the devices
+    and the output of the devices that finished. then exit right away, without waiting for the sessions
+    that are still connecting, a tcp connect can't be interrupted.
+    the output files of the sessions that didn't close them yet are flushed first, os._exit doesn't do it.
+    """
+    results.close()
+    flush_open_file_sinks()
+    rich.print(message)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(130)
 
 
 def handel_exception(device: Device, exception: Exception) -> None:
@@ -282,43 +556,48 @@ def handel_exception(device: Device, exception: Exception) -> None:
         print(f"wasn't able to authenticate to {str(device)}", file=sys.stderr)
     except netmiko.NetmikoTimeoutException:
         print(f"wasn't able to connect to {str(device)}", file=sys.stderr)
+    except RolloutHaltedError as exception:
+        print(f"didn't deploy to {str(device)}, {exception}", file=sys.stderr)
+    except DeviceTimeoutError as exception:
+        print(f"timed out on {str(device)}: {exception}", file=sys.stderr)
+    except CircuitOpenError as exception:
+        print(f"skipped {str(device)}, {exception}", file=sys.stderr)
     except Exception as exception:
         print(f"device {str(device)} encountered an exception: {exception}", file=sys.stderr)
 
 
-def handel_results(device, exception, output_folder, result):
+def handel_results(device, exception, output_sink_factory, result):
     if exception:
         handel_exception(device, exception)
     else:
-        rich.print(f"connected successfully to {str(device)}")
-        if output_folder:
-            write_to_folder(device.name, output_folder, result)
+        if isinstance(result, CachedOutput):
+            rich.print(f"served {str(device)} from the result cache")
         else:
+            rich.print(f"connected successfully to {str(device)}")
+        if isinstance(output_sink_factory, FileSinkFactory):
+            # a FileOutputSink only creates its file once the device sends some output.
+            output_path = output_sink_factory.get_path(device)
+            if output_path.is_file():
+                rich.print(f"saved output to '{str(output_path)}'")
+            else:
+                rich.print(f"{str(device)} had no output to save")
+        elif not output_sink_factory:
             rich.print(result)
 
 
-def write_to_folder(file_name, output_folder, result):
-    output_file_path = output_folder.joinpath(f"{file_name}.txt")
-    with open(output_file_path, "w", encoding="utf-8") as output_file:
-        output_file.write(result)
-        rich.print(f"saved output to '{str(output_file_path)}'")
-
-
 def get_devices_from_tags_and_names(
-        all_entries: Iterable[pykeepass.entry],
+        inventory: Inventory,
         extra_device_names: Set[str],
         tags: Set[str]
 ) -> Tuple[Device]:
     if not tags:
         raise ValueError("tags argument doesn't have any tags")
-    all_tagged_entries = tuple(filter(is_entry_tagged_by_tag_set(tags), all_entries))
-    all_tagged_devices = entries_to_devices(all_tagged_entries)
+    all_tagged_devices = tuple(inventory.get_devices(tags))
 
     if not extra_device_names:
         return all_tagged_devices
 
-    extra_explicit_entries = filter(lambda entry: entry.title in extra_device_names, all_entries)
-    extra_explicit_devices = entries_to_devices(extra_explicit_entries)
+    extra_explicit_devices = inventory.get_devices_by_names(extra_device_names)
 
     extra_explicit_not_tagged_devices = tuple(filter(
         lambda device: device not in all_tagged_devices, extra_explicit_devices
@@ -349,11 +628,8 @@ def list_devices(
     list all the devices under your command.
     """
     tags_set = set(tags_list)
-    with KeepassDB(config['keepass_db_path'], config['keepass_password']) as kp:
-        all_entries = get_all_entries(kp)
-
-    all_tagged_entries = tuple(filter(is_entry_tagged_by_tag_set(tags_set), all_entries))
-    all_tagged_devices = tuple((entry_to_device(entry) for entry in all_tagged_entries))
+    with open_inventory(read_only=True) as inventory:
+        all_tagged_devices = inventory.get_devices(tags_set)
 
     print_objects(all_tagged_devices, "devices")
 
@@ -377,6 +653,11 @@ def add_devices(
             help="if set then devices that are already in keepass won't be taken "
                  "into consideration. (i.e. won't be added to keepass and won't cause an error)",
             show_default=False
+        ),
+        bulk: bool = typer.Option(
+            False,
+            help="don't print every added device, for importing large inventories.",
+            show_default=False
         )
 ):
     """
@@ -414,43 +695,17 @@ def add_devices(
 
     new_devices = convert_devices(device_strings, password, optional_parameters)
 
-    with KeepassDB(config['keepass_db_path'], config['keepass_password']) as kp:
-        all_entries = get_all_entries(kp)
-        all_devices = entries_to_devices(all_entries)
-        all_device_names = extract_device_names(all_devices)
-        devices_to_add = new_devices
-        if not ignore_pre_existing:
-            pre_existing_device_names = {device.name in all_device_names for device in new_devices}
-            if any(pre_existing_device_names):
-                raise LookupError(
-                    "devices ["
-                    f"{', '.join(pre_existing_device_names)}"
-                    "] already exist in keepass"
-                )
-        else:
-            new_non_existing_devices = tuple(filter(
-                lambda device: device not in all_devices and device.name not in all_device_names,
-                new_devices
-            ))
-            new_non_existing_unique_devices = remove_device_duplicates(new_non_existing_devices)
-            devices_to_add = new_non_existing_unique_devices
-
-        for device in devices_to_add:
-            add_device_entry(kp, device)
-            typer.echo(f"added device {str(device)} to database")
-    typer.echo(f"added {len(devices_to_add)} to database")
-
-
-def remove_device_duplicates(devices: Iterable[Device]) -> List[Device]:
-    unique_devices = []
-    unique_device_names = set()
-    for new_device in devices:
-        is_unique_device = new_device not in unique_devices
-        is_unique_device_name = new_device.name not in unique_device_names
-        if is_unique_device and is_unique_device_name:
-            unique_devices.append(new_device)
-            unique_device_names.update(new_device.name)
-    return unique_devices
+    with open_inventory() as inventory:
+        # measured from the unlocked database to the saved one, so waiting for the master password isn't counted.
+        start_time = time.perf_counter()
+        added_devices = inventory.add_devices(new_devices, ignore_pre_existing=ignore_pre_existing)
+        if not bulk:
+            for device in added_devices:
+                typer.echo(f"added device {str(device)} to database")
+    elapsed_time = time.perf_counter() - start_time
+    typer.echo(f"added {len(added_devices)} to database")
+    if elapsed_time > 0:
+        typer.echo(f"imported {len(added_devices) / elapsed_time:.0f} devices per second")
 
 
 def convert_devices(devices: Iterable[str], password, optional_parameters) -> List[Device]:
@@ -479,27 +734,92 @@ def remove_devices(device_names: List[str]):
     remove a device from your database
     """
     device_names_to_be_removed = set(device_names)
-    with KeepassDB(config['keepass_db_path'], config['keepass_password']) as kp:
-        all_entries = get_all_entries(kp)
-        all_devices = entries_to_devices(all_entries)
-        all_device_names = extract_device_names(all_devices)
+    with open_inventory() as inventory:
+        device_entries = inventory.get_devices_by_names(device_names_to_be_removed)
 
-        non_existing_devices = device_names_to_be_removed - all_device_names
+        non_existing_devices = device_names_to_be_removed - extract_device_names(device_entries)
         if non_existing_devices:
             raise LookupError(f"devices {', '.join(non_existing_devices)} don't exist")
 
-        device_entries = tuple(filter(
-            lambda device: device.name in device_names_to_be_removed, all_devices
-        ))
         print_objects(device_entries, "devices")
         typer.confirm(f"are you sure you want to delete {len(device_entries)} devices?", abort=True)
 
-        for device_name in device_names:
-            remove_device(kp, device_name)
+        inventory.remove_devices(device_names_to_be_removed)
 
     typer.echo(f"deleted {len(device_entries)} devices")
 
 
+@daemon_command_group.command(name="start")
+def start_daemon():
+    """
+    run the session daemon in the foreground, it keeps device sessions logged in between runs.
+    """
+    socket_path = config["session_daemon_socket"]
+    if is_daemon_running(socket_path):
+        raise RuntimeError(f"the session daemon is already running on {socket_path}")
+    rich.print(f"session daemon listening on {socket_path}")
+    serve(socket_path, config["session_idle_timeout"])
+
+
+@daemon_command_group.command(name="stop")
+def stop_session_daemon():
+    """
+    disconnect every warm session and stop the session daemon.
+    """
+    socket_path = config["session_daemon_socket"]
+    if not is_daemon_running(socket_path):
+        raise RuntimeError(f"the session daemon is not running on {socket_path}")
+    stop_daemon(socket_path)
+    rich.print("stopped the session daemon")
+
+
+@agent_command_group.command(name="start")
+def start_agent(
+        lifetime: float = typer.Option(
+            None,
+            "--lifetime",
+            help="the amount of seconds the key of the database is kept after it was unlocked "
+                 "(defaults to the 'keepass_agent_lifetime' config value)",
+            show_default=False
+        )
+):
+    """
+    run the keepass agent in the foreground, the next command that unlocks the database hands its key to the agent
+    and the commands after it don't ask for the master password or derive the key again.
+    """
+    if lifetime is None:
+        lifetime = config["keepass_agent_lifetime"]
+    socket_path = config["keepass_agent_socket"]
+    if is_agent_running(socket_path):
+        raise RuntimeError(f"the keepass agent is already running on {socket_path}")
+    rich.print(f"keepass agent listening on {socket_path}")
+    serve_agent(socket_path, lifetime)
+
+
+@agent_command_group.command(name="lock")
+def lock_keepass_agent():
+    """
+    make the keepass agent forget the key of the database, the next command asks for the master password again.
+    """
+    socket_path = config["keepass_agent_socket"]
+    if not is_agent_running(socket_path):
+        raise RuntimeError(f"the keepass agent is not running on {socket_path}")
+    lock_agent(socket_path)
+    rich.print("locked the keepass agent")
+
+
+@agent_command_group.command(name="stop")
+def stop_keepass_agent():
+    """
+    forget the key of the database and stop the keepass agent.
+    """
+    socket_path = config["keepass_agent_socket"]
+    if not is_agent_running(socket_path):
+        raise RuntimeError(f"the keepass agent is not running on {socket_path}")
+    stop_agent(socket_path)
+    rich.print("stopped the keepass agent")
+
+
 @app.command()
 def init():
     """
@@ -508,7 +828,7 @@ def init():
     rich.print("Welcome to commander!")
     if is_initialized(
             config['commander_directory'],
-            config['keepass_db_path'],
+            get_inventory_path(),
             USER_CONFIG_FILE
     ):
         rich.print("commander is already initialized")
@@ -519,11 +839,11 @@ def init():
 
     if not is_initialized(
             config['commander_directory'],
-            config['keepass_db_path'],
+            get_inventory_path(),
             USER_CONFIG_FILE
     ):
         rich.print(f"creating a new database in {config['commander_directory']}")
-        init_program(config['commander_directory'], config['keepass_db_path'], USER_CONFIG_FILE, config)
+        init_program(config['commander_directory'], get_inventory_path(), USER_CONFIG_FILE, config)
 
     rich.print("finished the initialization process, have a great day")
 
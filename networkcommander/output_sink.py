@@ -0,0 +1,156 @@
+import sys
+import threading
+import weakref
+from pathlib import Path
+from typing import Callable, Optional, TextIO, Protocol
+
+from networkcommander.device import Device
+
+_STREAM_LOCK = threading.Lock()
+
+# the file sinks of this process whose file is open, so a run that exits without waiting
+# for its sessions can still flush what they wrote.
+_open_file_sinks: "weakref.WeakSet[FileOutputSink]" = weakref.WeakSet()
+_open_file_sinks_lock = threading.Lock()
+
+
+class OutputSink(Protocol):
+    """
+    Receives the output of a single device chunk by chunk, while the session is still running.
+    """
+
+    def write(self, chunk: str) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class FileOutputSink:
+    """
+    An output sink that writes the output of a single device to a file as it arrives.
+    the file is only created when the first chunk is written.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file: Optional[TextIO] = None
+
+    def write(self, chunk: str) -> None:
+        if self._file is None:
+            self._file = open(self.path, "w", encoding="utf-8")
+            with _open_file_sinks_lock:
+                _open_file_sinks.add(self)
+        self._file.write(chunk)
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            with _open_file_sinks_lock:
+                _open_file_sinks.discard(self)
+            self._file.close()
+            self._file = None
+
+
+def flush_open_file_sinks() -> None:
+    """
+    flush the file of every file sink that wasn't closed yet, the sessions writing to them may still be running.
+    """
+    with _open_file_sinks_lock:
+        output_sinks = list(_open_file_sinks)
+    for output_sink in output_sinks:
+        try:
+            output_sink.flush()
+        except (OSError, ValueError):
+            # the session closed its sink in the meantime.
+            pass
+
+
+class StreamOutputSink:
+    """
+    An output sink that writes the output of a single device to a shared stream (like stdout),
+    whole lines at a time with a prefix, so the output of many devices can be told apart.
+    """
+
+    def __init__(self, stream: TextIO, prefix: str):
+        self._stream = stream
+        self._prefix = prefix
+        self._partial_line = ""
+
+    def write(self, chunk: str) -> None:
+        *lines, self._partial_line = (self._partial_line + chunk).split("\n")
+        if lines:
+            self._write_lines(lines)
+
+    def close(self) -> None:
+        if self._partial_line:
+            self._write_lines([self._partial_line])
+            self._partial_line = ""
+
+    def _write_lines(self, lines):
+        text = "".join(f"{self._prefix}{line}\n" for line in lines)
+        with _STREAM_LOCK:
+            self._stream.write(text)
+            self._stream.flush()
+
+
+class CallbackOutputSink:
+    """
+    An output sink that hands every chunk to a callback.
+    """
+
+    def __init__(self, callback: Callable[[str], None]):
+        self._callback = callback
+
+    def write(self, chunk: str) -> None:
+        self._callback(chunk)
+
+    def close(self) -> None:
+        pass
+
+
+class TeeOutputSink:
+    """
+    An output sink that writes every chunk to another output sink, and keeps a copy of the whole output.
+    """
+
+    def __init__(self, output_sink: OutputSink):
+        self._output_sink = output_sink
+        self._chunks = []
+
+    def write(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+        self._output_sink.write(chunk)
+
+    def close(self) -> None:
+        self._output_sink.close()
+
+    def getvalue(self) -> str:
+        return "".join(self._chunks)
+
+
+class FileSinkFactory:
+    """
+    creates a FileOutputSink for every device, the output of a device is saved to {output_folder}/{device name}.txt.
+    """
+
+    def __init__(self, output_folder: Path):
+        self._output_folder = Path(output_folder)
+
+    def get_path(self, device: Device) -> Path:
+        return self._output_folder.joinpath(f"{device.name}.txt")
+
+    def __call__(self, device: Device) -> FileOutputSink:
+        return FileOutputSink(self.get_path(device))
+
+
+class StdoutSinkFactory:
+    """
+    creates a StreamOutputSink to stdout for every device, every line is prefixed with the device name.
+    """
+
+    def __call__(self, device: Device) -> StreamOutputSink:
+        return StreamOutputSink(sys.stdout, f"{device.name}: ")
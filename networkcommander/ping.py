@@ -0,0 +1,175 @@
+import os
+import socket
+from enum import Enum
+from typing import List, Optional, Callable, Union
+
+import netmiko
+import paramiko
+
+from networkcommander.config import config
+from networkcommander.device import is_enabled
+from networkcommander.device_executer import PermissionLevel, execute_commands
+from networkcommander.jump_host import open_jump_channel
+
+SSH_PORT = 22
+TELNET_PORT = 23
+
+
+class PingMode(str, Enum):
+    """
+    Enum defining how deep a ping checks a device.
+    LOGIN - a full netmiko login, including prompt detection and session preparation.
+    AUTH - stop right after the ssh authentication succeeded.
+    BANNER - only read the ssh banner the device sends when the tcp connection opens.
+    """
+    LOGIN = "login"
+    AUTH = "auth"
+    BANNER = "banner"
+
+
+def get_device_port(device_options: dict) -> int:
+    """
+    :param device_options: the netmiko connection arguments of the device.
+    :return: the port netmiko will connect to, the explicit port or the default of the protocol.
+    """
+    port = device_options.get("port")
+    if port:
+        return int(port)
+    if is_telnet(device_options):
+        return TELNET_PORT
+    return SSH_PORT
+
+
+def is_telnet(device_options: dict) -> bool:
+    return str(device_options["device_type"]).endswith("_telnet")
+
+
+def get_ping_executer(ping_mode: PingMode) -> Optional[Callable[[dict, List[str], PermissionLevel], str]]:
+    """
+    :param ping_mode: how deep the ping checks the devices.
+    :return: a function with the signature of execute_commands that pings a single device,
+        or None if a normal login should be used.
+    """
+    ping_mode = PingMode(ping_mode)
+    if ping_mode == PingMode.BANNER:
+        return ping_banner
+    if ping_mode == PingMode.AUTH:
+        return ping_authentication
+    return None
+
+
+def ping_banner(device_options: dict, commands: List[str], permission_level: PermissionLevel) -> str:
+    """
+    connect to the device and read its ssh identification string, without starting the ssh handshake.
+    telnet devices are only checked for an open port.
+
+    :return: the ssh banner of the device.
+    :raises: netmiko.NetmikoTimeoutException if the device doesn't answer with a banner.
+    """
+    host = device_options["host"]
+    port = get_device_port(device_options)
+    timeout = config["ping_timeout"]
+    try:
+        with open_connection(device_options, timeout) as connection:
+            if is_telnet(device_options):
+                return ""
+            connection.settimeout(timeout)
+            with connection.makefile("rb") as stream:
+                # the server may send other lines before its identification string (RFC 4253 section 4.2).
+                for _ in range(32):
+                    line = stream.readline(256)
+                    if not line:
+                        break
+                    if line.startswith(b"SSH-"):
+                        return line.decode("utf-8", errors="replace").strip()
+    except OSError as error:
+        raise netmiko.NetmikoTimeoutException(f"wasn't able to read the ssh banner of {host}:{port}: {error}")
+    raise netmiko.NetmikoTimeoutException(f"{host}:{port} didn't send an ssh banner")
+
+
+def ping_authentication(device_options: dict, commands: List[str], permission_level: PermissionLevel) -> str:
+    """
+    authenticate to the device over ssh and disconnect, without opening a shell.
+    devices that need a full login to be checked (telnet and key based authentication) are logged in to normally.
+
+    :return: the ssh banner of the device.
+    :raises: netmiko.NetmikoAuthenticationException if the credentials were rejected.
+             netmiko.NetmikoTimeoutException if the device couldn't be reached.
+    """
+    if is_telnet(device_options) or is_enabled(device_options.get("use_keys")):
+        return execute_commands(device_options, [], PermissionLevel.USER)
+
+    host = device_options["host"]
+    port = get_device_port(device_options)
+    timeout = config["ping_timeout"]
+    try:
+        connection = open_connection(device_options, timeout)
+    except OSError as error:
+        raise netmiko.NetmikoTimeoutException(f"wasn't able to connect to {host}:{port}: {error}")
+
+    transport = paramiko.Transport(connection)
+    try:
+        transport.banner_timeout = timeout
+        transport.auth_timeout = timeout
+        try:
+            transport.start_client(timeout=timeout)
+        except (paramiko.SSHException, OSError) as error:
+            raise netmiko.NetmikoTimeoutException(f"ssh handshake with {host}:{port} failed: {error}")
+        verify_host_key(transport, device_options)
+        authenticate(transport, device_options["username"], device_options["password"])
+        return transport.remote_version
+    finally:
+        transport.close()
+
+
+def open_connection(device_options: dict, timeout: float) -> Union[socket.socket, paramiko.Channel]:
+    """
+    :return: a tcp connection to the device, or a channel to it over its jump host.
+    """
+    jump_host = device_options.get("jump_host")
+    if jump_host:
+        return open_jump_channel(jump_host, device_options)
+    return socket.create_connection((device_options["host"], get_device_port(device_options)), timeout)
+
+
+def verify_host_key(transport: paramiko.Transport, device_options: dict) -> None:
+    """
+    reject unknown host keys the same way netmiko does when ssh_strict is set,
+    this has to happen before the password is sent.
+
+    :raises: paramiko.SSHException if the host key isn't known.
+    """
+    if not is_enabled(device_options.get("ssh_strict")):
+        return
+    host_keys = paramiko.HostKeys()
+    if is_enabled(device_options.get("system_host_keys")):
+        known_hosts = os.path.expanduser(os.path.join("~", ".ssh", "known_hosts"))
+        if os.path.isfile(known_hosts):
+            host_keys.load(known_hosts)
+    alt_key_file = device_options.get("alt_key_file")
+    if is_enabled(device_options.get("alt_host_keys")) and alt_key_file and os.path.isfile(alt_key_file):
+        host_keys.load(alt_key_file)
+
+    host = device_options["host"]
+    port = get_device_port(device_options)
+    host_key_name = host if port == SSH_PORT else f"[{host}]:{port}"
+    server_key = transport.get_remote_server_key()
+    if not host_keys.check(host_key_name, server_key):
+        raise paramiko.SSHException(f"the host key of {host_key_name} is unknown or changed")
+
+
+def authenticate(transport: paramiko.Transport, username: str, password: str) -> None:
+    """
+    authenticate with a password, or with keyboard-interactive if the device doesn't accept passwords.
+
+    :raises: netmiko.NetmikoAuthenticationException if the credentials were rejected.
+    """
+    try:
+        try:
+            transport.auth_password(username, password)
+        except paramiko.BadAuthenticationType as error:
+            if "keyboard-interactive" not in error.allowed_types:
+                raise
+            transport.auth_interactive(username, lambda title, instructions, prompts: [password] * len(prompts))
+    except paramiko.AuthenticationException as error:
+        raise netmiko.NetmikoAuthenticationException(f"authentication to {transport.getpeername()} failed: {error}")
@@ -0,0 +1,61 @@
+import asyncio
+from typing import Iterable, List, Tuple
+
+import netmiko
+
+from networkcommander.device import Device
+from networkcommander.ping import get_device_port
+
+
+def probe_devices(
+        devices: Iterable[Device],
+        timeout: float,
+        max_connections: int
+) -> Tuple[List[Device], List[Tuple[Device, Exception]]]:
+    """
+    try to open a tcp connection to every device at once, without logging in.
+    the devices behind a jump host aren't probed, they are counted as reachable.
+
+    :param devices: the devices to probe.
+    :param timeout: the amount of seconds to wait for a single connection.
+    :param max_connections: the amount of connection attempts that can be in flight at once.
+    :return: the reachable devices, and every unreachable device with the reason it is unreachable.
+    """
+    # a device behind a jump host can't be reached directly, its session finds out if it is reachable.
+    reachable = []
+    devices_to_probe = []
+    for device in devices:
+        (reachable if device.device_options.get("jump_host") else devices_to_probe).append(device)
+    devices = devices_to_probe
+    if not devices:
+        return reachable, []
+    errors = asyncio.run(_probe_all(devices, timeout, max_connections))
+
+    reachable += [device for device, error in zip(devices, errors) if error is None]
+    unreachable = [(device, error) for device, error in zip(devices, errors) if error is not None]
+    return reachable, unreachable
+
+
+async def _probe_all(devices: List[Device], timeout: float, max_connections: int) -> List[Exception]:
+    semaphore = asyncio.Semaphore(max_connections)
+    return await asyncio.gather(*(_probe(device, timeout, semaphore) for device in devices))
+
+
+async def _probe(device: Device, timeout: float, semaphore: asyncio.Semaphore):
+    """
+    :return: None if the device accepted the connection, otherwise a NetmikoTimeoutException describing the failure.
+    """
+    port = get_device_port(device.device_options)
+    async with semaphore:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(device.host, port), timeout)
+        except asyncio.TimeoutError:
+            return netmiko.NetmikoTimeoutException(f"tcp connection to {device.host}:{port} timed out")
+        except OSError as error:
+            return netmiko.NetmikoTimeoutException(f"tcp connection to {device.host}:{port} failed: {error}")
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+    return None
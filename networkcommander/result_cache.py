@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from networkcommander.config import config
+from networkcommander.device import Device
+from networkcommander.device_executer import PermissionLevel, READ_ONLY_COMMAND
+
+
+class CachedOutput(str):
+    """
+    the output of a device that was served from the ResultCache instead of a session.
+    """
+
+
+class ResultCache:
+    """
+    An on disk cache of the output of read only commands, one file per device, command and permission level.
+    entries expire after ttl seconds, and the least recently used entries are removed
+    once the cache grows bigger than max_size bytes.
+    """
+
+    def __init__(self, directory: Path, ttl: float, max_size: int):
+        """
+        :param directory: the folder the cache entries are saved in, it is created if it doesn't exist.
+        :param ttl: the amount of seconds an entry is served after it was saved.
+        :param max_size: the amount of bytes the cache can take on disk.
+        """
+        self._directory = Path(directory)
+        self._ttl = ttl
+        self._max_size = max_size
+
+    @classmethod
+    def from_config(cls) -> "ResultCache":
+        return cls(config["result_cache_directory"], config["result_cache_ttl"], config["result_cache_max_size"])
+
+    @staticmethod
+    def is_cacheable(commands: List[str], permission_level: PermissionLevel) -> bool:
+        """
+        only the output of read only commands is cached, running anything else has to reach the device.
+        """
+        if not commands or PermissionLevel(permission_level) == PermissionLevel.CONFIGURE_TERMINAL:
+            return False
+        return all(READ_ONLY_COMMAND.match(command) for command in commands)
+
+    def get_output(self, device: Device, commands: List[str], permission_level: PermissionLevel) -> Optional[str]:
+        """
+        :return: the output of all the commands on the device, or None if any of them isn't cached.
+        """
+        command_outputs = []
+        for command in commands:
+            command_output = self.get(device, command, permission_level)
+            if command_output is None:
+                return None
+            command_outputs.append(command_output)
+        return CachedOutput("".join(command_outputs))
+
+    def set_output(self, device: Device, commands: List[str], permission_level: PermissionLevel, output: str) -> bool:
+        """
+        save the output send_commands returned for every command on its own.
+
+        :return: False if the output couldn't be split between the commands, and nothing was saved.
+        """
+        command_outputs = split_command_outputs(output, commands)
+        if command_outputs is None:
+            return False
+        for command, command_output in zip(commands, command_outputs):
+            self.set(device, command, permission_level, command_output)
+        return True
+
+    def get(self, device: Device, command: str, permission_level: PermissionLevel) -> Optional[str]:
+        """
+        :return: the cached output of the command, or None if it isn't cached or expired.
+        """
+        path = self._get_path(device, command, permission_level)
+        try:
+            with open(path, encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["saved_at"] > self._ttl:
+            return None
+        # the modification time is the last use of the entry, the least recently used entries are evicted first.
+        os.utime(path)
+        return entry["output"]
+
+    def set(self, device: Device, command: str, permission_level: PermissionLevel, output: str) -> None:
+        self._directory.mkdir(parents=True, exist_ok=True)
+        entry = {"saved_at": time.time(), "output": output}
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as entry_file:
+            json.dump(entry, entry_file)
+        os.replace(temporary_path, self._get_path(device, command, permission_level))
+
+    def evict(self) -> None:
+        """
+        remove the entries that weren't used for ttl seconds, and then the least recently used ones
+        until the cache fits in max_size.
+        """
+        if not self._directory.is_dir():
+            return
+        entries = []
+        for path in self._directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        now = time.time()
+        total_size = sum(size for _, size, _ in entries)
+        for last_used, size, path in sorted(entries):
+            if total_size <= self._max_size and now - last_used <= self._ttl:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total_size -= size
+
+    def _get_path(self, device: Device, command: str, permission_level: PermissionLevel) -> Path:
+        key = json.dumps([device.name, device.host, command, PermissionLevel(permission_level).value])
+        return self._directory.joinpath(f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json")
+
+
+def split_command_outputs(output: str, commands: List[str]) -> Optional[List[str]]:
+    """
+    split the output of send_commands into the part of every command, '{prompt}{command}\n{output}\n'.
+
+    :return: the part of every command, or None if the output doesn't match the commands.
+    """
+    if not commands:
+        return []
+    first_command_index = output.find(f"{commands[0]}\n")
+    if first_command_index == -1:
+        return None
+    prompt = output[:first_command_index]
+
+    command_outputs = []
+    start_index = 0
+    for command, next_command in zip(commands, commands[1:]):
+        next_index = output.find(f"\n{prompt}{next_command}\n", start_index + len(prompt) + len(command))
+        if next_index == -1:
+            return None
+        command_outputs.append(output[start_index:next_index + 1])
+        start_index = next_index + 1
+    command_outputs.append(output[start_index:])
+    return command_outputs
@@ -0,0 +1,112 @@
+import math
+import time
+from typing import List, Iterable, Iterator, Optional
+
+from networkcommander.config import config
+from networkcommander.deploy import deploy_commands, DeployResult
+from networkcommander.device import Device
+from networkcommander.device_executer import PermissionLevel
+
+
+class RolloutHaltedError(Exception):
+    """
+    reported for every device that didn't get the commands because an earlier wave failed too often.
+    """
+
+
+def parse_amount(amount: str, total: int) -> int:
+    """
+    :param amount: an amount of devices like "10", or a percentage of the total like "1%".
+    :param total: the amount the percentages are taken from.
+    :return: the amount of devices, percentages are rounded up.
+    :raises: ValueError if the amount is negative or isn't a number.
+    """
+    amount = str(amount).strip()
+    if amount.endswith("%"):
+        percentage = float(amount[:-1])
+        if percentage < 0:
+            raise ValueError(f"a percentage can't be negative, got {amount}")
+        return math.ceil(total * percentage / 100)
+    count = int(amount)
+    if count < 0:
+        raise ValueError(f"an amount of devices can't be negative, got {amount}")
+    return count
+
+
+def split_into_waves(devices: List[Device], wave_sizes: Iterable[str]) -> List[List[Device]]:
+    """
+    :param devices: the devices to roll out to, in the order they should get the commands.
+    :param wave_sizes: the size of every wave, an amount of devices or a percentage of all the devices.
+        every wave has at least one device, and the devices that are left form the last wave.
+    :return: the waves, without empty waves.
+    """
+    waves = []
+    start_index = 0
+    for wave_size in wave_sizes:
+        if start_index >= len(devices):
+            break
+        end_index = start_index + max(parse_amount(wave_size, len(devices)), 1)
+        waves.append(devices[start_index:end_index])
+        start_index = end_index
+    if start_index < len(devices):
+        waves.append(devices[start_index:])
+    return waves
+
+
+def deploy_in_waves(
+        commands: List[str],
+        devices: Iterable[Device],
+        permission_level: PermissionLevel,
+        wave_sizes: Optional[List[str]] = None,
+        error_threshold: Optional[str] = None,
+        deadline: Optional[float] = None,
+        **deploy_options
+) -> Iterator[DeployResult]:
+    """
+    deploy the commands one wave of devices at a time, every wave is deployed with deploy_commands
+    so the sessions inside a wave still run in parallel.
+    once a wave has more failed devices than the error threshold the rollout stops,
+    and every device that is left is reported with a RolloutHaltedError.
+
+    :param commands: List of commands to execute.
+    :param devices: the devices to roll out to, in the order they should get the commands.
+    :param permission_level: PermissionLevel enum representing the desired permission level.
+    :param wave_sizes: the size of every wave, like ["1%", "10%"], defaults to config["rollout_waves"].
+    :param error_threshold: the amount of failed devices a wave can have, like "2" or "5%" of the wave,
+        defaults to config["rollout_error_threshold"].
+    :param deadline: the amount of seconds the whole rollout can take, defaults to config["run_deadline"].
+    :param deploy_options: passed to deploy_commands for every wave.
+    :return: a generator that yields each result and device as they finish.
+    """
+    if wave_sizes is None:
+        wave_sizes = config["rollout_waves"]
+    if error_threshold is None:
+        error_threshold = config["rollout_error_threshold"]
+    if deadline is None:
+        deadline = config["run_deadline"]
+    deadline_at = time.time() + deadline if deadline else None
+
+    waves = split_into_waves(list(devices), wave_sizes)
+    for wave_index, wave in enumerate(waves):
+        wave_deadline = None
+        if deadline_at is not None:
+            # a deadline of 0 means no deadline, so a passed deadline is kept just above it.
+            wave_deadline = max(deadline_at - time.time(), 0.001)
+
+        failed_devices = 0
+        results = deploy_commands(commands, wave, permission_level, deadline=wave_deadline, **deploy_options)
+        for result, device, exception in results:
+            if exception is not None:
+                failed_devices += 1
+            yield result, device, exception
+
+        allowed_failures = parse_amount(error_threshold, len(wave))
+        if failed_devices > allowed_failures:
+            halted_error = RolloutHaltedError(
+                f"wave {wave_index + 1} had {failed_devices} failed devices out of {len(wave)}, "
+                f"more than the threshold of {error_threshold}"
+            )
+            for remaining_wave in waves[wave_index + 1:]:
+                for device in remaining_wave:
+                    yield "", device, halted_error
+            return
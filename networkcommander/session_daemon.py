@@ -0,0 +1,337 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Dict, List, Tuple, Optional, Iterator
+
+import netmiko
+
+from networkcommander.device_executer import PermissionLevel, run_commands, open_session, get_session_key, \
+    session_scope, mark_session_connected
+from networkcommander.output_sink import OutputSink
+
+SessionKey = Tuple[Tuple[str, str], ...]
+
+
+class SessionPool:
+    """
+    A pool of authenticated netmiko sessions, one per set of connection arguments.
+    sessions that weren't used for idle_timeout seconds are disconnected by evict_idle_sessions.
+    the pool lock guards the bookkeeping of the pool, and the lock of every session makes sure
+    only one request uses the session at a time. a session that is dropped takes its lock with it.
+    """
+
+    def __init__(self, idle_timeout: float):
+        """
+        :param idle_timeout: the amount of seconds a session can stay unused before it is disconnected.
+        """
+        self._idle_timeout = idle_timeout
+        self._sessions: Dict[SessionKey, netmiko.BaseConnection] = {}
+        self._last_used: Dict[SessionKey, float] = {}
+        self._session_locks: Dict[SessionKey, threading.Lock] = {}
+        self._pool_lock = threading.Lock()
+
+    @staticmethod
+    def session_key(device_options: dict) -> SessionKey:
+        return get_session_key(device_options)
+
+    def run_commands(
+            self,
+            device_options: dict,
+            commands: List[str],
+            permission_level: PermissionLevel,
+            output_sink: Optional[OutputSink] = None
+    ) -> str:
+        """
+        run the commands over the pooled session of the device, the session is opened if it isn't warm.
+        a session that fails mid-run is dropped from the pool so the next request opens a fresh one.
+
+        :param device_options: Dictionary containing device connection parameters.
+        :param commands: List of commands to execute.
+        :param permission_level: PermissionLevel enum representing the desired permission level.
+        :param output_sink: if given the output is written to it while it arrives instead of being returned.
+        :return: Output generated by executing the commands.
+        """
+        key = self.session_key(device_options)
+        while True:
+            with self._pool_lock:
+                session_lock = self._session_locks.setdefault(key, threading.Lock())
+            with session_lock:
+                with self._pool_lock:
+                    if self._session_locks.get(key) is not session_lock:
+                        # the session was dropped while this request waited for it, start over with a new lock.
+                        continue
+                    device = self._sessions.get(key)
+                if device is not None and not device.is_alive():
+                    with self._pool_lock:
+                        del self._sessions[key]
+                    self._disconnect(device)
+                    device = None
+                try:
+                    if device is None:
+                        device = open_session(device_options)
+                        with self._pool_lock:
+                            self._sessions[key] = device
+                    mark_session_connected()
+                    output = run_commands(device, commands, permission_level, output_sink)
+                except Exception:
+                    self._drop_session(key)
+                    raise
+                with self._pool_lock:
+                    self._last_used[key] = time.monotonic()
+                return output
+
+    def evict_idle_sessions(self) -> None:
+        """
+        disconnect every session that wasn't used for idle_timeout seconds.
+        sessions that are running commands right now are skipped.
+        """
+        with self._pool_lock:
+            idle_sessions = [
+                (key, self._session_locks[key]) for key, last_used in self._last_used.items()
+                if self._is_idle(last_used)
+            ]
+        for key, session_lock in idle_sessions:
+            if not session_lock.acquire(blocking=False):
+                continue
+            try:
+                with self._pool_lock:
+                    # the session may have been used, or dropped, since it was found idle.
+                    is_idle = self._session_locks.get(key) is session_lock and self._is_idle(self._last_used[key])
+                if is_idle:
+                    self._drop_session(key)
+            finally:
+                session_lock.release()
+
+    def close(self) -> None:
+        """
+        disconnect every session in the pool.
+        """
+        with self._pool_lock:
+            keys = tuple(self._sessions.keys())
+        for key in keys:
+            self._drop_session(key)
+
+    def __len__(self):
+        with self._pool_lock:
+            return len(self._sessions)
+
+    def _is_idle(self, last_used: float) -> bool:
+        return time.monotonic() - last_used > self._idle_timeout
+
+    def _drop_session(self, key: SessionKey) -> None:
+        """
+        forget the session and its lock, and disconnect it.
+        the caller holds the lock of the session, the requests waiting for it notice it was dropped and start over.
+        """
+        with self._pool_lock:
+            device = self._sessions.pop(key, None)
+            self._last_used.pop(key, None)
+            self._session_locks.pop(key, None)
+        if device is not None:
+            self._disconnect(device)
+
+    @staticmethod
+    def _disconnect(device: netmiko.BaseConnection) -> None:
+        try:
+            device.disconnect()
+        except Exception:
+            # the session is thrown away anyway, a broken transport doesn't matter.
+            pass
+
+
+class SessionDaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A unix socket server that runs commands over the sessions of a SessionPool.
+    every request and response is a single line of json, streamed output arrives as
+    {"chunk": ...} lines before the final response. an error response tells whether the session logged in.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, session_pool: SessionPool):
+        self.session_pool = session_pool
+        super().__init__(socket_path, SessionDaemonRequestHandler)
+
+
+class SessionDaemonRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        if request.get("action") == "shutdown":
+            self.respond({"output": ""})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        output_sink = _SocketOutputSink(self) if request.get("stream") else None
+        with session_scope(id(self)) as scope:
+            try:
+                output = self.server.session_pool.run_commands(
+                    request["device_options"],
+                    request["commands"],
+                    PermissionLevel(request["permission_level"]),
+                    output_sink
+                )
+            except Exception as exception:
+                self.respond({
+                    "error": type(exception).__name__,
+                    "message": str(exception),
+                    "connected": scope.is_connected
+                })
+                return
+        self.respond({"output": output})
+
+    def respond(self, response: dict):
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class _SocketOutputSink:
+    """
+    forwards the streamed output of a session to the client as {"chunk": ...} lines, before the final response.
+    """
+
+    def __init__(self, request_handler: SessionDaemonRequestHandler):
+        self._request_handler = request_handler
+
+    def write(self, chunk: str) -> None:
+        if chunk:
+            self._request_handler.respond({"chunk": chunk})
+
+    def close(self) -> None:
+        pass
+
+
+def serve(socket_path: str, idle_timeout: float) -> None:
+    """
+    run the session daemon in the foreground until it is asked to shut down.
+
+    :param socket_path: the path of the unix socket the daemon listens on.
+    :param idle_timeout: the amount of seconds a session can stay unused before it is disconnected.
+    :raises: OSError if the platform doesn't support unix sockets.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("the session daemon needs unix sockets, which this platform doesn't support")
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    session_pool = SessionPool(idle_timeout)
+    stop_eviction = threading.Event()
+
+    def evict_periodically():
+        while not stop_eviction.wait(min(idle_timeout, 5)):
+            session_pool.evict_idle_sessions()
+
+    eviction_thread = threading.Thread(target=evict_periodically, daemon=True)
+    old_umask = os.umask(0o177)
+    try:
+        server = SessionDaemonServer(socket_path, session_pool)
+    finally:
+        os.umask(old_umask)
+
+    eviction_thread.start()
+    try:
+        with server:
+            server.serve_forever()
+    finally:
+        stop_eviction.set()
+        session_pool.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def is_daemon_running(socket_path: str) -> bool:
+    """
+    :param socket_path: the path of the unix socket the daemon listens on.
+    :return: True if a daemon accepts connections on socket_path.
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def send_request(socket_path: str, request: dict) -> dict:
+    """
+    send a single request to the daemon and wait for its final response.
+
+    :param socket_path: the path of the unix socket the daemon listens on.
+    :param request: the json serializable request.
+    :return: the final response of the daemon.
+    """
+    *_, response = stream_request(socket_path, request)
+    return response
+
+
+def stream_request(socket_path: str, request: dict) -> Iterator[dict]:
+    """
+    send a single request to the daemon and yield every line it responds with,
+    the streamed {"chunk": ...} lines first and the final response last.
+
+    :param socket_path: the path of the unix socket the daemon listens on.
+    :param request: the json serializable request.
+    :raises: ConnectionError if the daemon closed the connection before the final response.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        with client.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode("utf-8") + b"\n")
+            stream.flush()
+            for line in stream:
+                response = json.loads(line)
+                yield response
+                if "chunk" not in response:
+                    return
+    raise ConnectionError("the session daemon closed the connection without responding")
+
+
+def stop_daemon(socket_path: str) -> None:
+    """
+    ask the daemon listening on socket_path to disconnect its sessions and exit.
+    """
+    send_request(socket_path, {"action": "shutdown"})
+
+
+def daemon_executer(socket_path: str):
+    """
+    create a drop in replacement for device_executer.execute_commands that runs the commands through the daemon.
+
+    :param socket_path: the path of the unix socket the daemon listens on.
+    :return: a function with the signature of execute_commands.
+    """
+    def execute_commands(
+            device_options: dict,
+            commands: List[str],
+            permission_level: PermissionLevel,
+            output_sink: Optional[OutputSink] = None
+    ) -> str:
+        responses = stream_request(socket_path, {
+            "device_options": device_options,
+            "commands": commands,
+            "permission_level": PermissionLevel(permission_level).value,
+            "stream": output_sink is not None
+        })
+        for response in responses:
+            if "chunk" in response:
+                output_sink.write(response["chunk"])
+        if "error" in response:
+            # the client can only retry the request if the daemon never logged in for it.
+            if response.get("connected", True):
+                mark_session_connected()
+            raise exception_from_response(response["error"], response["message"])
+        return response["output"]
+
+    return execute_commands
+
+
+def exception_from_response(exception_name: str, message: str) -> Exception:
+    """
+    rebuild an exception raised inside the daemon, netmiko exceptions keep their type
+    so the callers can keep catching them.
+    """
+    exception_type: Optional[type] = getattr(netmiko, exception_name, None)
+    if isinstance(exception_type, type) and issubclass(exception_type, Exception):
+        return exception_type(message)
+    return RuntimeError(f"{exception_name}: {message}")
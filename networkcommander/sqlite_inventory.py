@@ -0,0 +1,340 @@
+import hashlib
+import json
+import os
+import sqlite3
+from typing import List, Optional, Set, Iterable, Dict, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from rich.prompt import Prompt
+
+from networkcommander.config import config
+from networkcommander.device import Device, DeviceType
+from networkcommander.keepass_agent import get_database_key, add_database_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    username TEXT NOT NULL,
+    password BLOB NOT NULL,
+    host TEXT NOT NULL,
+    device_type TEXT NOT NULL,
+    optional_parameters BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS devices_host ON devices (host);
+CREATE INDEX IF NOT EXISTS devices_device_type ON devices (device_type);
+CREATE TABLE IF NOT EXISTS device_tags (
+    device_id INTEGER NOT NULL REFERENCES devices (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    UNIQUE (device_id, tag)
+);
+CREATE INDEX IF NOT EXISTS device_tags_tag ON device_tags (tag);
+"""
+
+# the amount of values bound to a single query, sqlite limits the amount of variables of a statement.
+QUERY_CHUNK_SIZE = 500
+SCRYPT_PARAMETERS = {"n": 2 ** 15, "r": 8, "p": 1}
+KEY_CHECK_PLAINTEXT = b"networkcommander"
+NONCE_SIZE = 12
+
+
+def derive_key(password: str, salt: bytes) -> bytes:
+    """
+    :return: the key that encrypts the secret columns, derived from the master password with scrypt.
+    """
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, dklen=32, maxmem=2 ** 26, **SCRYPT_PARAMETERS)
+
+
+def encrypt_value(cipher: AESGCM, plaintext: bytes, associated_data: bytes) -> bytes:
+    """
+    :param associated_data: what the value belongs to, a value copied to another row or column doesn't decrypt.
+    :return: the nonce followed by the ciphertext and the authentication tag of the value.
+    """
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + cipher.encrypt(nonce, plaintext, associated_data)
+
+
+def decrypt_value(cipher: AESGCM, value: bytes, associated_data: bytes) -> bytes:
+    """
+    :raises: ValueError if the value wasn't encrypted with the key, or it was tampered with.
+    """
+    try:
+        return cipher.decrypt(value[:NONCE_SIZE], value[NONCE_SIZE:], associated_data)
+    except InvalidTag:
+        raise ValueError("the value wasn't encrypted with the key of the inventory, or it was changed") from None
+
+
+def chunks(values: List, size: int = QUERY_CHUNK_SIZE) -> Iterable[List]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def placeholders(values: List) -> str:
+    return ", ".join("?" * len(values))
+
+
+class SqliteInventory:
+    """
+    An inventory in a sqlite database, every device is a row of an indexed table so a query only reads
+    the rows it needs, instead of decrypting and parsing the whole inventory like a keepass database.
+    the password and the optional parameters (which hold the enable secret) of every device are encrypted
+    with AES-GCM, by a key derived from the master password.
+    the changes of a session are committed together when it exits, and rolled back if it failed.
+
+    Usage:
+        Use with a context manager (with SqliteInventory(...) as inventory).
+    """
+
+    def __init__(self, database_path: str, password: Optional[str], read_only: bool = False):
+        """
+        :param database_path: the path of the sqlite database, it is created if it doesn't exist.
+        :param password: the master password, it is prompted for if it is needed and it isn't given.
+        :param read_only: if True the database is never changed, and it has to exist.
+        """
+        self._database_path = database_path
+        self._password = password
+        self._read_only = read_only
+        self._connection: Optional[sqlite3.Connection] = None
+        self._cipher: Optional[AESGCM] = None
+
+    def __enter__(self) -> "SqliteInventory":
+        if self._read_only:
+            if not os.path.isfile(self._database_path):
+                raise FileNotFoundError(f"the inventory database {self._database_path} doesn't exist")
+            self._connection = sqlite3.connect(f"file:{self._database_path}?mode=ro", uri=True)
+        else:
+            # the database, and the journal sqlite creates next to it, are only readable by the owner.
+            old_umask = os.umask(0o177)
+            try:
+                self._connection = sqlite3.connect(self._database_path)
+                self._connection.executescript(SCHEMA)
+            finally:
+                os.umask(old_umask)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        try:
+            self._cipher = AESGCM(self._unlock())
+        except BaseException:
+            self._connection.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_val or self._read_only:
+                self._connection.rollback()
+            else:
+                self._connection.commit()
+        finally:
+            self._connection.close()
+
+    def _unlock(self) -> bytes:
+        """
+        :return: the key of the database, from the keepass agent if it holds it, otherwise derived from the
+            master password. a new database gets a new salt.
+        :raises: PermissionError if the master password is wrong.
+        """
+        meta = dict(self._connection.execute("SELECT key, value FROM meta"))
+        if "salt" not in meta:
+            if self._read_only:
+                raise ValueError(f"{self._database_path} isn't an inventory database")
+            salt = os.urandom(16)
+            key = derive_key(self._get_password(), salt)
+            self._connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ("salt", salt),
+                ("key_check", encrypt_value(AESGCM(key), KEY_CHECK_PLAINTEXT, b"key_check"))
+            ])
+            self._add_key_to_agent(key)
+            return key
+
+        if config["use_keepass_agent"]:
+            key = get_database_key(config["keepass_agent_socket"], self._database_path)
+            if key is not None and self._is_key_valid(key, meta["key_check"]):
+                return key
+
+        key = derive_key(self._get_password(), meta["salt"])
+        if not self._is_key_valid(key, meta["key_check"]):
+            raise PermissionError(f"wrong master password for {self._database_path}")
+        self._add_key_to_agent(key)
+        return key
+
+    @staticmethod
+    def _is_key_valid(key: bytes, key_check: bytes) -> bool:
+        try:
+            return decrypt_value(AESGCM(key), key_check, b"key_check") == KEY_CHECK_PLAINTEXT
+        except ValueError:
+            return False
+
+    def _add_key_to_agent(self, key: bytes) -> None:
+        if config["use_keepass_agent"]:
+            add_database_key(config["keepass_agent_socket"], self._database_path, key)
+
+    def _get_password(self) -> str:
+        if not self._password:
+            self._password = Prompt.ask("enter inventory database master password", password=True)
+        return self._password
+
+    def get_devices(self, tags: Optional[Set[str]] = None) -> List[Device]:
+        """
+        :param tags: only the devices that are tagged with every one of these tags, every device if empty.
+        :return: the devices in the order they were added.
+        """
+        if not tags:
+            rows = self._connection.execute("SELECT * FROM devices ORDER BY id")
+            device_tags = self._get_device_tags("SELECT device_id, tag FROM device_tags ORDER BY rowid")
+            return [self._row_to_device(row, device_tags) for row in rows]
+
+        tags = list(tags)
+        tagged_device_ids = (
+            "SELECT device_id FROM device_tags "
+            f"WHERE tag IN ({placeholders(tags)}) GROUP BY device_id HAVING COUNT(*) = ?"
+        )
+        parameters = tags + [len(tags)]
+        rows = self._connection.execute(
+            f"SELECT * FROM devices WHERE id IN ({tagged_device_ids}) ORDER BY id", parameters
+        )
+        device_tags = self._get_device_tags(
+            f"SELECT device_id, tag FROM device_tags WHERE device_id IN ({tagged_device_ids}) ORDER BY rowid",
+            parameters
+        )
+        return [self._row_to_device(row, device_tags) for row in rows]
+
+    def get_devices_by_names(self, device_names: Iterable[str]) -> List[Device]:
+        devices = []
+        for names in chunks(list(device_names)):
+            rows = self._connection.execute(
+                f"SELECT * FROM devices WHERE name IN ({placeholders(names)}) ORDER BY id", names
+            )
+            device_tags = self._get_device_tags(
+                "SELECT device_tags.device_id, device_tags.tag FROM device_tags "
+                f"JOIN devices ON devices.id = device_tags.device_id WHERE devices.name IN ({placeholders(names)}) "
+                "ORDER BY device_tags.rowid",
+                names
+            )
+            devices.extend(self._row_to_device(row, device_tags) for row in rows)
+        return devices
+
+    def get_device_names(self) -> Set[str]:
+        return {name for name, in self._connection.execute("SELECT name FROM devices")}
+
+    def get_tags(self) -> Set[str]:
+        return {tag for tag, in self._connection.execute("SELECT DISTINCT tag FROM device_tags")}
+
+    def add_devices(
+            self,
+            devices: Iterable[Device],
+            tags: List[str] = None,
+            ignore_pre_existing: bool = False
+    ) -> List[Device]:
+        """
+        the whole batch is validated before any device is added.
+
+        :raises: ValueError if a device doesn't have a name.
+                 LookupError if devices already exist in the database or appear twice in the batch.
+        """
+        devices = list(devices)
+        existing_device_names = set()
+        for names in chunks([device.name for device in devices]):
+            existing_device_names.update(
+                name for name, in self._connection.execute(
+                    f"SELECT name FROM devices WHERE name IN ({placeholders(names)})", names
+                )
+            )
+
+        devices_to_add = []
+        pre_existing_device_names = []
+        for device in devices:
+            if not device.name:
+                raise ValueError(f"device {device} doesn't have a name...")
+            if device.name in existing_device_names:
+                pre_existing_device_names.append(device.name)
+                continue
+            existing_device_names.add(device.name)
+            devices_to_add.append(device)
+
+        if pre_existing_device_names and not ignore_pre_existing:
+            raise LookupError(f"devices [{', '.join(pre_existing_device_names)}] already exist in db")
+
+        for device in devices_to_add:
+            optional_parameters = {key: str(value) for key, value in device.optional_parameters.items()}
+            device_id = self._connection.execute(
+                "INSERT INTO devices (name, username, password, host, device_type, optional_parameters) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    device.name,
+                    device.username or "",
+                    self._encrypt(device.name, "password", (device.password or "").encode("utf-8")),
+                    str(device.host),
+                    str(device.device_type),
+                    self._encrypt(device.name, "optional_parameters", json.dumps(optional_parameters).encode("utf-8"))
+                )
+            ).lastrowid
+            if tags:
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO device_tags (device_id, tag) VALUES (?, ?)",
+                    [(device_id, tag) for tag in tags]
+                )
+        return devices_to_add
+
+    def remove_devices(self, device_names: Iterable[str]) -> None:
+        for names in chunks(list(device_names)):
+            self._connection.execute(f"DELETE FROM devices WHERE name IN ({placeholders(names)})", names)
+
+    def tag_devices(self, device_tag: str, device_names: Iterable[str]) -> None:
+        for names in chunks(list(device_names)):
+            self._connection.execute(
+                "INSERT OR IGNORE INTO device_tags (device_id, tag) "
+                f"SELECT id, ? FROM devices WHERE name IN ({placeholders(names)})",
+                [device_tag] + names
+            )
+
+    def untag_devices(self, device_tag: str, device_names: Iterable[str]) -> None:
+        """
+        :raises: ValueError if a device is not tagged with the tag.
+        """
+        device_names = list(device_names)
+        tagged_device_names = set()
+        for names in chunks(device_names):
+            tagged_device_names.update(name for name, in self._connection.execute(
+                "SELECT devices.name FROM devices JOIN device_tags ON devices.id = device_tags.device_id "
+                f"WHERE device_tags.tag = ? AND devices.name IN ({placeholders(names)})",
+                [device_tag] + names
+            ))
+        for device_name in device_names:
+            if device_name not in tagged_device_names:
+                raise ValueError(f"device {device_name} is not tagged with {device_tag}")
+
+        for names in chunks(device_names):
+            self._connection.execute(
+                "DELETE FROM device_tags WHERE tag = ? AND device_id IN "
+                f"(SELECT id FROM devices WHERE name IN ({placeholders(names)}))",
+                [device_tag] + names
+            )
+
+    def _get_device_tags(self, query: str, parameters: Iterable = ()) -> Dict[int, Tuple[str, ...]]:
+        device_tags: Dict[int, Tuple[str, ...]] = {}
+        for device_id, tag in self._connection.execute(query, list(parameters)):
+            device_tags[device_id] = device_tags.get(device_id, ()) + (tag,)
+        return device_tags
+
+    def _row_to_device(self, row: tuple, device_tags: Dict[int, Tuple[str, ...]]) -> Device:
+        device_id, name, username, password, host, device_type, optional_parameters = row
+        return Device(
+            name,
+            username,
+            self._decrypt(name, "password", password).decode("utf-8"),
+            host,
+            DeviceType(device_type),
+            json.loads(self._decrypt(name, "optional_parameters", optional_parameters)),
+            device_tags.get(device_id, ())
+        )
+
+    def _encrypt(self, device_name: str, column: str, plaintext: bytes) -> bytes:
+        return encrypt_value(self._cipher, plaintext, f"{column}:{device_name}".encode("utf-8"))
+
+    def _decrypt(self, device_name: str, column: str, value: bytes) -> bytes:
+        return decrypt_value(self._cipher, value, f"{column}:{device_name}".encode("utf-8"))
@@ -0,0 +1,194 @@
+import asyncio
+import threading
+
+import asyncssh
+import netmiko
+import pytest
+
+from networkcommander.async_executer import AsyncSession, can_run_async
+from networkcommander.deploy import deploy_commands, ExecutionEngine, DeviceTimeoutError
+from networkcommander.device import Device
+from networkcommander.device_executer import PermissionLevel
+from networkcommander.output_sink import CallbackOutputSink
+
+REPLIES = {
+    "show clock": "*12:00:00.000 UTC Mon Jan 1 2024",
+    "show version": "\n".join(["Cisco IOS Software, Version 15.2"] * 50),
+    "terminal length 0": "",
+    "interface vlan 1": "",
+}
+
+
+class RouterServer(asyncssh.SSHServer):
+    """
+    a router that lets root in with the password 1234.
+    """
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return (username, password) == ("root", "1234")
+
+
+async def router_shell(process: asyncssh.SSHServerProcess) -> None:
+    """
+    a cisco like cli of the router 'r1', its enable secret is 'cisco'. 'show hang' never finishes.
+    """
+    prompt = "r1>"
+    process.stdout.write("#####\r\nauthorized access only #\r\n" + prompt)
+    while True:
+        try:
+            command = (await process.stdin.readline()).strip()
+        except asyncssh.BreakReceived:
+            continue
+        if process.stdin.at_eof():
+            break
+        if command == "enable":
+            process.stdout.write("Password: ")
+            if (await process.stdin.readline()).strip() == "cisco":
+                prompt = "r1#"
+        elif command == "disable":
+            prompt = "r1>"
+        elif command == "configure terminal" and prompt == "r1#":
+            prompt = "r1(config)#"
+        elif command == "interface vlan 1":
+            prompt = "r1(config-if)#"
+        elif command == "end":
+            prompt = "r1#"
+        elif command == "show hang":
+            await asyncio.sleep(60)
+        elif command in REPLIES:
+            process.stdout.write(REPLIES[command] + "\r\n" if REPLIES[command] else "")
+        elif command:
+            process.stdout.write("% Invalid input detected\r\n")
+        process.stdout.write(prompt)
+    process.exit(0)
+
+
+@pytest.fixture(scope="module")
+def router():
+    """
+    :return: the port of a router that runs on its own event loop in a background thread.
+    """
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncssh.create_server(
+        RouterServer,
+        "127.0.0.1",
+        0,
+        server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")],
+        process_factory=router_shell
+    ))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server.sockets[0].getsockname()[1]
+
+    async def stop():
+        server.close()
+        for task in asyncio.all_tasks() - {asyncio.current_task()}:
+            task.cancel()
+
+    asyncio.run_coroutine_threadsafe(stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def get_device_options(router: int, **device_options) -> dict:
+    return {
+        "host": "127.0.0.1",
+        "port": str(router),
+        "username": "root",
+        "password": "1234",
+        "secret": "cisco",
+        "device_type": "cisco_ios",
+        **device_options
+    }
+
+
+async def run_commands(device_options: dict, commands, permission_level, output_sink=None) -> str:
+    async with AsyncSession(device_options) as session:
+        return await session.run_commands(commands, permission_level, output_sink)
+
+
+def test_user_commands(router):
+    output = asyncio.run(run_commands(get_device_options(router), ["show clock", "show version"], PermissionLevel.USER))
+
+    assert output == f"r1>show clock\n{REPLIES['show clock']}\nr1>show version\n{REPLIES['show version']}\n"
+
+
+def test_enable_commands_use_the_secret(router):
+    output = asyncio.run(run_commands(get_device_options(router), ["show clock"], PermissionLevel.ENABLE))
+    assert output == f"r1#show clock\n{REPLIES['show clock']}\n"
+
+    with pytest.raises(ValueError):
+        asyncio.run(run_commands(get_device_options(router, secret="wrong"), ["show clock"], PermissionLevel.ENABLE))
+
+
+def test_configure_terminal_commands(router):
+    output = asyncio.run(run_commands(get_device_options(router), ["interface vlan 1"], PermissionLevel.CONFIGURE_TERMINAL))
+
+    assert output == "r1(config)#interface vlan 1\nr1(config-if)#"
+
+
+def test_output_goes_to_the_output_sink(router):
+    chunks = []
+    output = asyncio.run(run_commands(
+        get_device_options(router), ["show clock", "show version"], PermissionLevel.USER,
+        CallbackOutputSink(chunks.append)
+    ))
+
+    assert output == ""
+    assert chunks == [
+        f"r1>show clock\n{REPLIES['show clock']}\n",
+        f"r1>show version\n{REPLIES['show version']}\n",
+    ]
+
+
+def test_wrong_password(router):
+    with pytest.raises(netmiko.NetmikoAuthenticationException):
+        asyncio.run(run_commands(get_device_options(router, password="wrong"), ["show clock"], PermissionLevel.USER))
+
+
+def test_only_cisco_like_ssh_devices_run_async():
+    assert can_run_async({"device_type": "cisco_ios"})
+    assert can_run_async({"device_type": "arista_eos"})
+    assert not can_run_async({"device_type": "cisco_ios_telnet"})
+    assert not can_run_async({"device_type": "huawei"})
+    assert not can_run_async({"device_type": "cisco_ios", "jump_host": "root@bastion"})
+
+
+def test_asyncio_engine(router):
+    devices = [
+        Device(f"r{index}", "root", "1234", "127.0.0.1", "cisco_ios", {"port": str(router), "secret": "cisco"})
+        for index in range(3)
+    ] + [Device("huawei", "root", "1234", "127.0.0.1", "huawei", {"port": str(router)})]
+
+    results = {device.name: (result, exception) for result, device, exception in deploy_commands(
+        ["show clock"], devices, PermissionLevel.ENABLE, ExecutionEngine.ASYNCIO
+    )}
+
+    assert sorted(results) == ["huawei", "r0", "r1", "r2"]
+    for name in ("r0", "r1", "r2"):
+        assert results[name] == (f"r1#show clock\n{REPLIES['show clock']}\n", None)
+    assert isinstance(results["huawei"][1], ValueError)
+
+
+def test_asyncio_engine_cancels_sessions_that_run_out_of_time(router):
+    devices = [
+        Device(f"r{index}", "root", "1234", "127.0.0.1", "cisco_ios", {"port": str(router)}) for index in range(2)
+    ]
+
+    results = list(deploy_commands(
+        ["show hang"], devices, PermissionLevel.USER, ExecutionEngine.ASYNCIO, time_budget=1, probe=False
+    ))
+
+    assert len(results) == 2
+    assert all(isinstance(exception, DeviceTimeoutError) for _, _, exception in results)
+
+
+def test_asyncio_engine_cant_run_a_custom_executer():
+    with pytest.raises(ValueError):
+        deploy_commands(["show clock"], [], PermissionLevel.USER, ExecutionEngine.ASYNCIO, executer=lambda *args: "")
@@ -0,0 +1,65 @@
+import pytest
+
+from networkcommander.concurrency import AIMDLimiter, TagGroupLimiter
+
+
+def test_limit_grows_while_sessions_are_fast():
+    limiter = AIMDLimiter(initial_limit=4, min_limit=2, max_limit=10)
+    for started_at in range(20):
+        limiter.record(started_at, 1.0, False)
+    assert limiter.limit == 10
+
+
+def test_limit_backs_off_on_failures():
+    limiter = AIMDLimiter(initial_limit=8, min_limit=2, max_limit=10)
+    limiter.record(0, 1.0, True)
+    assert limiter.limit == 4
+    limiter.record(2, 1.0, True)
+    assert limiter.limit == 2
+    limiter.record(4, 1.0, True)
+    assert limiter.limit == 2
+
+
+def test_limit_backs_off_on_slow_sessions():
+    limiter = AIMDLimiter(initial_limit=8, min_limit=1, max_limit=10, latency_tolerance=2.0)
+    limiter.record(0, 1.0, False)
+    assert limiter.limit == 9
+    limiter.record(1, 2.5, False)
+    assert limiter.limit == 4
+
+
+def test_sessions_started_before_a_back_off_are_ignored():
+    limiter = AIMDLimiter(initial_limit=8, min_limit=1, max_limit=10)
+    limiter.record(10, 1.0, True)
+    assert limiter.limit == 4
+    # this session started before the first failure finished, it was running under the old limit
+    limiter.record(9, 3.0, True)
+    assert limiter.limit == 4
+
+
+@pytest.mark.parametrize(("min_limit", "max_limit"), [(0, 10), (5, 4)])
+def test_invalid_limits(min_limit: int, max_limit: int):
+    with pytest.raises(ValueError):
+        AIMDLimiter(1, min_limit, max_limit)
+
+
+def test_group_limits_concurrency():
+    group_limiter = TagGroupLimiter({"site:ams": {"max_sessions": 2}})
+    limited_tags = group_limiter.limited_tags(["site:ams", "router"])
+    assert limited_tags == {"site:ams"}
+
+    group_limiter.started(limited_tags, 0)
+    group_limiter.started(limited_tags, 0)
+    assert group_limiter.start_delay(limited_tags, 0) is None
+    group_limiter.finished(limited_tags)
+    assert group_limiter.start_delay(limited_tags, 0) == 0
+
+
+def test_group_limits_connection_rate():
+    group_limiter = TagGroupLimiter({"site:ams": {"connections_per_second": 4}})
+    limited_tags = group_limiter.limited_tags(["site:ams"])
+
+    group_limiter.started(limited_tags, 10)
+    assert group_limiter.start_delay(limited_tags, 10) == pytest.approx(0.25)
+    assert group_limiter.start_delay(limited_tags, 10.25) == 0
+    assert group_limiter.start_delay(frozenset(), 10) == 0
@@ -0,0 +1,486 @@
+import threading
+import time
+from collections import Counter
+from typing import List
+
+import netmiko
+import pytest
+
+from mocks import get_test_device
+from networkcommander import deploy
+from networkcommander.concurrency import AIMDLimiter, TagGroupLimiter, StaticLimiter
+from networkcommander.config import config
+from networkcommander.deploy import deploy_commands, ExecutionEngine, shard_devices, DeviceTimeoutError
+from networkcommander.device import Device
+from networkcommander.device_executer import PermissionLevel, Connection, mark_session_connected, abort_session
+from networkcommander.health import HealthStore, CircuitOpenError
+from networkcommander.output_sink import CallbackOutputSink
+from networkcommander.result_cache import ResultCache, CachedOutput
+
+
+def fake_execute_commands(device_options: dict, commands: List[str], permission_level: PermissionLevel) -> str:
+    if device_options["host"].startswith("10."):
+        raise ConnectionRefusedError(f"{device_options['host']} is unreachable")
+    return f"{device_options['host']}:{','.join(commands)}:{permission_level.value}"
+
+
+@pytest.fixture
+def fake_executer(monkeypatch):
+    monkeypatch.setattr(deploy, "execute_commands", fake_execute_commands)
+
+
+def test_thread_engine_yields_every_result(fake_executer):
+    devices = [get_test_device() for _ in range(20)] + [Device("down", "root", "1234", "10.0.0.1", "cisco_ios", {})]
+    commands = ["show version", "show clock"]
+
+    results = list(deploy_commands(commands, devices, PermissionLevel.USER, ExecutionEngine.THREAD))
+
+    assert sorted(device for _, device, _ in results) == sorted(devices)
+    for result, device, exception in results:
+        if device.host.startswith("10."):
+            assert result == ""
+            assert isinstance(exception, ConnectionError)
+        else:
+            assert result == f"{device.host}:show version,show clock:user"
+            assert exception is None
+
+
+def test_unknown_engine(fake_executer):
+    with pytest.raises(ValueError):
+        deploy_commands([], [get_test_device()], PermissionLevel.USER, "fork")
+
+
+def test_process_engine_reports_every_device(monkeypatch):
+    """
+    the worker processes import netmiko on their own, so this runs real sessions against a closed local port.
+    """
+    monkeypatch.setitem(config, "max_processes", 2)
+    devices = [Device(f"closed{index}", "root", "1234", "127.0.0.1", "cisco_ios", {"port": "1"}) for index in range(3)]
+
+    results = list(deploy_commands(["show version"], devices, PermissionLevel.USER, ExecutionEngine.PROCESS))
+
+    assert sorted(device for _, device, _ in results) == devices
+    assert all(result == "" and exception is not None for result, _, exception in results)
+
+
+def test_adaptive_limiter_grows(fake_executer):
+    devices = [Device(f"up{index}", "root", "1234", f"192.168.0.{index}", "cisco_ios", {}) for index in range(30)]
+    limiter = AIMDLimiter(initial_limit=2, min_limit=1, max_limit=8, latency_tolerance=1000)
+
+    results = list(deploy_commands(["show version"], devices, PermissionLevel.USER, ExecutionEngine.THREAD, limiter))
+
+    assert len(results) == len(devices)
+    assert limiter.limit == 8
+
+
+def test_concurrency_groups(monkeypatch):
+    running = Counter()
+    most_running = Counter()
+    lock = threading.Lock()
+
+    def slow_execute_commands(device_options, commands, permission_level):
+        site = device_options["host"].split(".")[0]
+        with lock:
+            running[site] += 1
+            most_running[site] = max(most_running[site], running[site])
+        time.sleep(0.02)
+        with lock:
+            running[site] -= 1
+        return ""
+
+    monkeypatch.setattr(deploy, "execute_commands", slow_execute_commands)
+    monkeypatch.setitem(config, "concurrency_groups", {"site:ams": {"max_sessions": 2}})
+    devices = [
+        Device(f"{site}{index}", "root", "1234", f"{site}.{index}", "cisco_ios", {}, (f"site:{site}",))
+        for site in ("ams", "fra") for index in range(10)
+    ]
+
+    results = list(deploy_commands([], devices, PermissionLevel.USER, ExecutionEngine.THREAD))
+
+    assert len(results) == len(devices)
+    assert most_running["ams"] == 2
+    assert most_running["fra"] > 2
+
+
+def test_shards_keep_groups_together():
+    group_limiter = TagGroupLimiter({"site:ams": {"max_sessions": 2}, "site:fra": {"max_sessions": 2}})
+    devices = [
+        Device("ams1", "root", "1234", "ams1", "cisco_ios", {}, ("site:ams",)),
+        Device("ams2", "root", "1234", "ams2", "cisco_ios", {}, ("site:ams",)),
+        Device("both", "root", "1234", "both", "cisco_ios", {}, ("site:ams", "site:fra")),
+        Device("fra1", "root", "1234", "fra1", "cisco_ios", {}, ("site:fra",)),
+        Device("free1", "root", "1234", "free1", "cisco_ios", {}),
+        Device("free2", "root", "1234", "free2", "cisco_ios", {}),
+    ]
+
+    shards = shard_devices(devices, 3, group_limiter)
+
+    assert sorted(len(shard) for shard in shards) == [1, 1, 4]
+    assert sorted(device.name for device in max(shards, key=len)) == ["ams1", "ams2", "both", "fra1"]
+
+
+def test_probe_reports_unreachable_devices(fake_executer, monkeypatch):
+    up = Device("up", "root", "1234", "192.168.0.1", "cisco_ios", {})
+    down = Device("down", "root", "1234", "192.168.0.2", "cisco_ios", {})
+    unreachable_error = ConnectionRefusedError("refused")
+    monkeypatch.setattr(deploy, "probe_devices", lambda devices, *_: ([up], [(down, unreachable_error)]))
+
+    results = list(deploy_commands([], [up, down], PermissionLevel.USER, ExecutionEngine.THREAD, probe=True))
+
+    assert results == [("", down, unreachable_error), ("192.168.0.1::user", up, None)]
+
+
+def test_output_sink_factory(monkeypatch):
+    def streaming_execute_commands(device_options, commands, permission_level, output_sink=None):
+        for command in commands:
+            output_sink.write(f"{device_options['host']}:{command}\n")
+        return ""
+
+    monkeypatch.setattr(deploy, "execute_commands", streaming_execute_commands)
+    written = {}
+
+    def output_sink_factory(device):
+        return CallbackOutputSink(lambda chunk: written.setdefault(device.name, []).append(chunk))
+
+    devices = [Device(f"r{index}", "root", "1234", f"192.168.0.{index}", "cisco_ios", {}) for index in range(3)]
+    results = list(deploy_commands(
+        ["show clock"], devices, PermissionLevel.USER, ExecutionEngine.THREAD, output_sink_factory=output_sink_factory
+    ))
+
+    assert all(result == "" and exception is None for result, _, exception in results)
+    assert written == {f"r{index}": [f"192.168.0.{index}:show clock\n"] for index in range(3)}
+
+
+def test_cached_devices_skip_the_session(monkeypatch, tmp_path):
+    executed_hosts = []
+
+    def recording_execute_commands(device_options, commands, permission_level):
+        executed_hosts.append(device_options["host"])
+        return "".join(f"r1#{command}\n{device_options['host']}\n" for command in commands)
+
+    monkeypatch.setattr(deploy, "execute_commands", recording_execute_commands)
+    result_cache = ResultCache(tmp_path, ttl=60, max_size=1024 * 1024)
+    devices = [Device(f"r{index}", "root", "1234", f"192.168.0.{index}", "cisco_ios", {}) for index in range(3)]
+    commands = ["show version", "show clock"]
+
+    first_results = list(deploy_commands(commands, devices[:2], PermissionLevel.USER, result_cache=result_cache))
+    second_results = list(deploy_commands(commands, devices, PermissionLevel.USER, result_cache=result_cache))
+
+    assert sorted(executed_hosts) == ["192.168.0.0", "192.168.0.1", "192.168.0.2"]
+    assert not any(isinstance(result, CachedOutput) for result, _, _ in first_results)
+    cached_devices = [device for result, device, _ in second_results if isinstance(result, CachedOutput)]
+    assert cached_devices == devices[:2]
+    assert sorted(result for result, _, _ in first_results) == sorted(
+        result for result, device, _ in second_results if device in devices[:2]
+    )
+
+
+def test_cached_runs_still_stream_to_the_output_sinks(monkeypatch, tmp_path):
+    streamed = []
+
+    def streaming_execute_commands(device_options, commands, permission_level, output_sink=None):
+        for command in commands:
+            output_sink.write(f"r1#{command}\n{device_options['host']}\n")
+            # the chunk reached the sink before the session finished.
+            streamed.append(written[device_options["host"]][-1])
+        return ""
+
+    monkeypatch.setattr(deploy, "execute_commands", streaming_execute_commands)
+    written = {}
+
+    def output_sink_factory(device):
+        return CallbackOutputSink(lambda chunk: written.setdefault(device.host, []).append(chunk))
+
+    result_cache = ResultCache(tmp_path, ttl=60, max_size=1024 * 1024)
+    device = Device("r1", "root", "1234", "192.168.0.1", "cisco_ios", {})
+    commands = ["show version", "show clock"]
+
+    [(output, _, exception)] = deploy_commands(
+        commands, [device], PermissionLevel.USER, output_sink_factory=output_sink_factory, result_cache=result_cache
+    )
+
+    assert (output, exception) == ("", None)
+    assert streamed == written["192.168.0.1"]
+    assert result_cache.get_output(device, commands, PermissionLevel.USER) == "".join(streamed)
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    attempts = Counter()
+
+    def flaky_execute_commands(device_options, commands, permission_level):
+        attempts[device_options["host"]] += 1
+        if device_options["host"] == "192.168.0.1" and attempts[device_options["host"]] < 3:
+            raise netmiko.NetmikoTimeoutException("timed out")
+        if device_options["host"] == "192.168.0.2":
+            raise netmiko.NetmikoAuthenticationException("wrong password")
+        return "ok"
+
+    monkeypatch.setattr(deploy, "execute_commands", flaky_execute_commands)
+    monkeypatch.setitem(config, "retries", 2)
+    monkeypatch.setitem(config, "retry_backoff", 0.01)
+    devices = [Device(f"r{index}", "root", "1234", f"192.168.0.{index}", "cisco_ios", {}) for index in range(1, 3)]
+
+    results = {device.name: (result, exception) for result, device, exception in deploy_commands(
+        ["show clock"], devices, PermissionLevel.USER
+    )}
+
+    assert results["r1"] == ("ok", None)
+    assert isinstance(results["r2"][1], netmiko.NetmikoAuthenticationException)
+    assert attempts == {"192.168.0.1": 3, "192.168.0.2": 1}
+
+
+def test_errors_after_login_are_not_retried(monkeypatch):
+    attempts = Counter()
+
+    def execute_commands_that_drop_after_login(device_options, commands, permission_level):
+        attempts[device_options["host"]] += 1
+        mark_session_connected()
+        raise ConnectionResetError("the session dropped")
+
+    monkeypatch.setattr(deploy, "execute_commands", execute_commands_that_drop_after_login)
+    monkeypatch.setitem(config, "retries", 2)
+    monkeypatch.setitem(config, "retry_backoff", 0.01)
+    device = Device("r1", "root", "1234", "192.168.0.1", "cisco_ios", {})
+
+    [(_, _, exception)] = deploy_commands(["conf t"], [device], PermissionLevel.CONFIGURE_TERMINAL)
+
+    assert isinstance(exception, ConnectionResetError)
+    assert attempts == {"192.168.0.1": 1}
+
+
+def test_aborted_sessions_are_not_retried(monkeypatch):
+    attempts = Counter()
+
+    def execute_commands_that_get_aborted(device_options, commands, permission_level):
+        attempts[device_options["host"]] += 1
+        abort_session(id(device))
+        raise netmiko.NetmikoTimeoutException("timed out")
+
+    monkeypatch.setattr(deploy, "execute_commands", execute_commands_that_get_aborted)
+    monkeypatch.setitem(config, "retries", 2)
+    monkeypatch.setitem(config, "retry_backoff", 0.01)
+    device = Device("r1", "root", "1234", "192.168.0.1", "cisco_ios", {})
+
+    [(_, _, exception)] = deploy_commands(["show clock"], [device], PermissionLevel.USER)
+
+    assert isinstance(exception, netmiko.NetmikoTimeoutException)
+    assert attempts == {"192.168.0.1": 1}
+
+
+@pytest.mark.parametrize("circuit_breaker, tried_hosts", [
+    ("skip", ["192.168.0.1"]),
+    ("defer", ["192.168.0.1", "10.0.0.1"]),
+])
+def test_circuit_breaker(fake_executer, monkeypatch, tmp_path, circuit_breaker, tried_hosts):
+    monkeypatch.setitem(config, "circuit_breaker", circuit_breaker)
+    health_store = HealthStore(tmp_path / "health.json", threshold=1, cooldown=60)
+    dead_device = Device("down", "root", "1234", "10.0.0.1", "cisco_ios", {})
+    health_store.record(dead_device, netmiko.NetmikoTimeoutException("timed out"))
+    devices = [dead_device, Device("r1", "root", "1234", "192.168.0.1", "cisco_ios", {})]
+
+    results = list(deploy_commands(["show clock"], devices, PermissionLevel.USER, health_store=health_store))
+
+    assert [device.host for _, device, exception in results if not isinstance(exception, CircuitOpenError)] \
+        == tried_hosts
+    assert HealthStore(tmp_path / "health.json", threshold=1, cooldown=60).is_open(dead_device)
+
+
+def test_connect_timeouts_are_bounded_by_the_time_left(monkeypatch):
+    connect_options = {}
+
+    def recording_execute_commands(device_options, commands, permission_level):
+        connect_options[device_options["host"]] = device_options
+        return "ok"
+
+    monkeypatch.setattr(deploy, "execute_commands", recording_execute_commands)
+    devices = [
+        Device("r1", "root", "1234", "192.168.0.1", "cisco_ios", {}),
+        Device("r2", "root", "1234", "192.168.0.2", "cisco_ios", {"conn_timeout": "0.2"}),
+    ]
+
+    list(deploy_commands(["show clock"], devices, PermissionLevel.USER, time_budget=5))
+    assert 4 < connect_options["192.168.0.1"]["conn_timeout"] <= 5
+    assert 4 < connect_options["192.168.0.1"]["auth_timeout"] <= 5
+    assert connect_options["192.168.0.2"]["conn_timeout"] == "0.2"
+
+    # a longer time limit never raises a timeout above the netmiko default.
+    list(deploy_commands(["show clock"], devices[:1], PermissionLevel.USER, time_budget=12))
+    assert 11 < connect_options["192.168.0.1"]["banner_timeout"] <= 12
+    assert "conn_timeout" not in connect_options["192.168.0.1"]
+
+    list(deploy_commands(["show clock"], devices[:1], PermissionLevel.USER, time_budget=0, deadline=0))
+    assert "conn_timeout" not in connect_options["192.168.0.1"]
+
+
+def slow_execute_commands(device_options, commands, permission_level):
+    if device_options["host"] == "192.168.0.1":
+        time.sleep(5)
+    return "ok"
+
+
+def test_device_time_budget(monkeypatch):
+    monkeypatch.setattr(deploy, "execute_commands", slow_execute_commands)
+    devices = [Device(f"r{index}", "root", "1234", f"192.168.0.{index}", "cisco_ios", {}) for index in range(3)]
+
+    started_at = time.monotonic()
+    results = {device.name: exception for _, device, exception in deploy_commands(
+        ["show clock"], devices, PermissionLevel.USER, ExecutionEngine.THREAD, time_budget=0.2
+    )}
+
+    assert time.monotonic() - started_at < 2
+    assert isinstance(results.pop("r1"), DeviceTimeoutError)
+    assert results == {"r0": None, "r2": None}
+
+
+def test_run_deadline_flushes_the_devices_that_are_left(monkeypatch):
+    monkeypatch.setattr(deploy, "execute_commands", slow_execute_commands)
+    devices = [Device(f"r{index}", "root", "1234", f"192.168.0.{index}", "cisco_ios", {}) for index in range(1, 4)]
+
+    started_at = time.monotonic()
+    results = list(deploy_commands(
+        ["show clock"], devices, PermissionLevel.USER, ExecutionEngine.THREAD, StaticLimiter(1), deadline=0.2
+    ))
+
+    assert time.monotonic() - started_at < 2
+    assert sorted(device.name for _, device, _ in results) == ["r1", "r2", "r3"]
+    assert all(isinstance(exception, DeviceTimeoutError) for _, _, exception in results)
+
+
+class CountingConnection:
+    """
+    a fake netmiko session that counts the logins.
+    """
+    logins = 0
+
+    def __init__(self, **device_options):
+        CountingConnection.logins += 1
+        self.login = CountingConnection.logins
+        self.host = device_options["host"]
+
+    def check_enable_mode(self):
+        return True
+
+    def is_alive(self):
+        return True
+
+    def disconnect(self):
+        pass
+
+
+def connection_executer(device_options, commands, permission_level):
+    with Connection(device_options) as device:
+        if device.host.startswith("10."):
+            raise ConnectionError(f"{device.host} is unreachable")
+        return f"login {device.login}:{','.join(commands)}"
+
+
+def test_aliases_share_a_session(monkeypatch):
+    monkeypatch.setattr(netmiko, "ConnectHandler", CountingConnection)
+    monkeypatch.setattr(CountingConnection, "logins", 0)
+    devices = [
+        Device("core", "root", "1234", "192.168.0.1", "cisco_ios", {"port": "22"}),
+        Device("edge", "root", "1234", "192.168.0.2", "cisco_ios", {"port": "22"}),
+        Device("core-mgmt", "root", "1234", "192.168.0.1", "cisco_ios", {"port": "22"}),
+    ]
+
+    results = {device.name: (result, exception) for result, device, exception in deploy_commands(
+        ["show clock"], devices, PermissionLevel.USER, ExecutionEngine.THREAD, executer=connection_executer
+    )}
+
+    assert sorted(results) == ["core", "core-mgmt", "edge"]
+    assert results["core"] == results["core-mgmt"]
+    assert results["core"][0].endswith(":show clock")
+    assert CountingConnection.logins == 2
+
+
+def test_aliases_with_a_time_budget_share_a_session(monkeypatch):
+    monkeypatch.setattr(netmiko, "ConnectHandler", CountingConnection)
+    monkeypatch.setattr(CountingConnection, "logins", 0)
+    devices = [Device(name, "root", "1234", "192.168.0.1", "cisco_ios", {}) for name in ("core", "core-mgmt")]
+
+    results = list(deploy_commands(
+        ["show clock"], devices, PermissionLevel.USER, executer=connection_executer, time_budget=5
+    ))
+
+    assert all(exception is None for _, _, exception in results)
+    assert CountingConnection.logins == 1
+
+
+def test_aliases_that_cant_connect_fail_together(monkeypatch):
+    monkeypatch.setattr(netmiko, "ConnectHandler", CountingConnection)
+    devices = [Device(name, "root", "1234", "10.0.0.1", "cisco_ios", {}) for name in ("core", "core-mgmt")]
+
+    results = list(deploy_commands(["show clock"], devices, PermissionLevel.USER, executer=connection_executer))
+
+    assert sorted(device.name for _, device, _ in results) == ["core", "core-mgmt"]
+    assert all(isinstance(exception, ConnectionError) for _, _, exception in results)
+
+
+def test_share_sessions_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(netmiko, "ConnectHandler", CountingConnection)
+    monkeypatch.setattr(CountingConnection, "logins", 0)
+    monkeypatch.setitem(config, "share_sessions", False)
+    devices = [Device(name, "root", "1234", "192.168.0.1", "cisco_ios", {}) for name in ("core", "core-mgmt")]
+
+    list(deploy_commands(["show clock"], devices, PermissionLevel.USER, executer=connection_executer))
+
+    assert CountingConnection.logins == 2
+
+
+class HangingConnection(CountingConnection):
+    """
+    a fake netmiko session whose commands never finish, until its transport is closed.
+    """
+
+    def __init__(self, **device_options):
+        super().__init__(**device_options)
+        self.remote_conn = threading.Event()
+        self.remote_conn.close = self.remote_conn.set
+
+
+def hanging_executer(device_options, commands, permission_level):
+    with Connection(device_options) as device:
+        if device.host == "192.168.0.1":
+            return "done"
+        device.remote_conn.wait(10)
+        raise EOFError("the transport was closed")
+
+
+def test_closing_the_results_aborts_the_live_sessions(monkeypatch):
+    connections = []
+
+    def connect(**device_options):
+        connections.append(HangingConnection(**device_options))
+        return connections[-1]
+
+    monkeypatch.setattr(netmiko, "ConnectHandler", connect)
+    devices = [Device(f"r{index}", "root", "1234", f"192.168.0.{index}", "cisco_ios", {}) for index in range(1, 5)]
+    results = deploy_commands(["show clock"], devices, PermissionLevel.USER, ExecutionEngine.THREAD, executer=hanging_executer)
+
+    assert next(results)[1].name == "r1"
+    while len(connections) < 4:
+        time.sleep(0.01)
+    started_at = time.monotonic()
+    results.close()
+
+    assert time.monotonic() - started_at < 1
+    assert all(connection.remote_conn.is_set() for connection in connections[1:])
+
+
+def test_adaptive_limiter_ignores_errors_after_login(monkeypatch):
+    monkeypatch.setattr(netmiko, "ConnectHandler", CountingConnection)
+
+    def executer_that_fails_after_login(device_options, commands, permission_level):
+        with Connection(device_options):
+            raise netmiko.ReadTimeout("the prompt never came back")
+
+    devices = [Device(f"r{index}", "root", "1234", f"192.168.0.{index}", "cisco_ios", {}) for index in range(30)]
+    limiter = AIMDLimiter(initial_limit=2, min_limit=1, max_limit=8, latency_tolerance=1000)
+
+    results = list(deploy_commands(
+        ["show clock"], devices, PermissionLevel.USER, ExecutionEngine.THREAD, limiter,
+        executer=executer_that_fails_after_login
+    ))
+
+    assert all(isinstance(exception, netmiko.ReadTimeout) for _, _, exception in results)
+    assert limiter.limit == 8
@@ -2,6 +2,7 @@ from typing import Any, Dict, Tuple, Optional
 
 import pytest
 
+from networkcommander.config import config
 from networkcommander.device import Device, deconstruct_connection_string, deconstruct_socket_id, \
     deconstruct_device_descriptor
 
@@ -189,3 +190,34 @@ def test_deconstruct_connection_string(connection: str, connection_params: Tuple
 ])
 def test_deconstruct_device_descriptor(descriptor: str, output: Tuple[str, Optional[str]]):
     assert deconstruct_device_descriptor(descriptor) == output
+
+
+@pytest.fixture
+def tuning_profiles(monkeypatch):
+    monkeypatch.setitem(config, "tuning_profiles", {
+        "fast": {"fast_cli": True, "global_delay_factor": 0.05},
+        "safe": {"fast_cli": False, "global_delay_factor": 2}
+    })
+    monkeypatch.setitem(config, "device_type_profiles", {"cisco_ios": "fast", "hp_procurve": "safe"})
+
+
+@pytest.mark.parametrize(("device_type", "optional_parameters", "expected_options"), [
+    ("cisco_ios", {}, {"fast_cli": True, "global_delay_factor": 0.05}),
+    ("hp_procurve", {}, {"fast_cli": False, "global_delay_factor": 2}),
+    ("cisco_ios", {"tuning_profile": "safe"}, {"fast_cli": False, "global_delay_factor": 2}),
+    ("cisco_ios", {"global_delay_factor": 1}, {"fast_cli": True, "global_delay_factor": 1}),
+    ("juniper_junos", {}, {}),
+])
+def test_tuning_profiles(tuning_profiles, device_type: str, optional_parameters: Dict[str, Any],
+                         expected_options: Dict[str, Any]):
+    device_options = Device("r1", "root", "1234", "10.0.0.1", device_type, optional_parameters).device_options
+
+    assert "tuning_profile" not in device_options
+    assert {key: device_options[key] for key in device_options if key not in (
+        "username", "password", "host", "device_type"
+    )} == expected_options
+
+
+def test_unknown_tuning_profile(tuning_profiles):
+    with pytest.raises(ValueError):
+        Device("r1", "root", "1234", "10.0.0.1", "cisco_ios", {"tuning_profile": "turbo"}).device_options
@@ -0,0 +1,290 @@
+import re
+from typing import List
+
+import netmiko
+import pytest
+
+from networkcommander.device_executer import (
+    stream_commands, send_commands, stream_command, change_permission, PermissionLevel, get_permission_level,
+    remember_permission_level, send_config_commands, send_commands_pipelined, can_pipeline, session_scope,
+    abort_session, Connection, SessionAbortedError, permission_level_from_prompt
+)
+from networkcommander.output_sink import CallbackOutputSink
+
+
+class FakeDevice:
+    """
+    a fake netmiko session of a router whose prompt is 'r1#', every command answers with
+    its reply split into small reads. 'disable' and 'enable' switch the prompt between 'r1>' and 'r1#'.
+    """
+    base_prompt = "r1"
+
+    def __init__(self, replies: dict, read_size: int = 7):
+        self._replies = replies
+        self._read_size = read_size
+        self._unread = ""
+        self.prompt = "r1#"
+        self.find_prompt_calls = 0
+
+    def find_prompt(self) -> str:
+        self.find_prompt_calls += 1
+        return self.prompt
+
+    def normalize_cmd(self, command: str) -> str:
+        return command + "\n"
+
+    def write_channel(self, command_string: str) -> None:
+        command = command_string.strip()
+        self._unread = f"{command}\n{self._replies[command]}\n{self.prompt}"
+
+    def command_echo_read(self, cmd: str, read_timeout: float) -> str:
+        return self.read_channel()
+
+    def read_channel(self) -> str:
+        data, self._unread = self._unread[:self._read_size], self._unread[self._read_size:]
+        return data
+
+    def send_command(self, command: str, expect_string: str) -> str:
+        if command in ("enable", "disable"):
+            self.prompt = "r1#" if command == "enable" else "r1>"
+            assert re.search(expect_string, self.prompt)
+            return ""
+        assert re.search(expect_string, self.prompt)
+        return self._replies[command]
+
+
+class PipelineDevice(FakeDevice):
+    """
+    a fake session that answers commands typed ahead of the prompt, or drops them like some platforms do.
+    """
+
+    def __init__(self, replies: dict, drops_typeahead: bool = False):
+        super().__init__(replies)
+        self._drops_typeahead = drops_typeahead
+        self.writes = 0
+
+    def normalize_linefeeds(self, data: str) -> str:
+        return data.replace("\r\n", "\n")
+
+    def write_channel(self, command_string: str) -> None:
+        self.writes += 1
+        commands = command_string.splitlines()
+        if self._drops_typeahead:
+            commands = commands[:1]
+        self._unread = "".join(
+            f"{command}\r\n{self.prompt}" if command.startswith("!")
+            else f"{command}\r\n{self._replies[command]}\r\n{self.prompt}"
+            for command in commands
+        )
+
+
+REPLIES = {
+    "show version": "\n".join(["Cisco IOS Software, Version 15.2"] * 50),
+    "show clock": "*12:00:00.000 UTC Mon Jan 1 2024",
+}
+
+
+def stream(device: FakeDevice, commands: List[str]) -> List[str]:
+    chunks = []
+    stream_commands(device, commands, CallbackOutputSink(chunks.append))
+    return chunks
+
+
+def test_streamed_output_matches_send_commands():
+    commands = ["show version", "show clock"]
+    chunks = stream(FakeDevice(REPLIES), commands)
+
+    assert "".join(chunks) == send_commands(FakeDevice(REPLIES), commands)
+    # the output was written while it was read, and not all at once
+    assert len(chunks) > 10
+    assert max(map(len, chunks)) < 100
+
+
+def test_stream_times_out_without_a_prompt(monkeypatch):
+    device = FakeDevice(REPLIES)
+    monkeypatch.setattr(device, "write_channel", lambda command_string: None)
+    monkeypatch.setattr(device, "command_echo_read", lambda cmd, read_timeout: "show clock\n")
+    with pytest.raises(netmiko.ReadTimeout):
+        stream_command(device, "show clock", "r1#", CallbackOutputSink(lambda chunk: None), read_timeout=0.1)
+
+
+def test_prompt_is_detected_once():
+    device = FakeDevice(REPLIES)
+    output = send_commands(device, ["show clock"] * 50)
+
+    assert device.find_prompt_calls == 1
+    assert output.count("r1#show clock\n") == 50
+
+
+def test_prompt_is_detected_again_after_a_mode_change():
+    device = FakeDevice(REPLIES)
+    output = send_commands(device, ["show clock", "disable", "show clock", "enable", "show clock"])
+
+    assert device.find_prompt_calls == 3
+    assert output.split("\n")[2:6] == ["r1#disable", "", "r1>show clock", REPLIES["show clock"]]
+    assert "".join(stream(FakeDevice(REPLIES), ["disable", "show clock"])) == send_commands(
+        FakeDevice(REPLIES), ["disable", "show clock"]
+    )
+
+
+class ModeDevice:
+    """
+    a fake netmiko session that records every probe and mode transition it was asked to do.
+    """
+
+    prompts = {
+        PermissionLevel.USER: "r1>",
+        PermissionLevel.ENABLE: "r1#",
+        PermissionLevel.CONFIGURE_TERMINAL: "r1(config)#",
+    }
+
+    def __init__(self, permission_level: PermissionLevel, prompts: dict = None):
+        self.permission_level = permission_level
+        self.calls = []
+        if prompts is not None:
+            self.prompts = prompts
+
+    def check_enable_mode(self) -> bool:
+        self.calls.append("check_enable_mode")
+        return self.permission_level != PermissionLevel.USER
+
+    def check_config_mode(self) -> bool:
+        self.calls.append("check_config_mode")
+        return self.permission_level == PermissionLevel.CONFIGURE_TERMINAL
+
+    def enable(self):
+        self.calls.append("enable")
+        self.permission_level = PermissionLevel.ENABLE
+
+    def config_mode(self):
+        self.calls.append("config_mode")
+        self.permission_level = PermissionLevel.CONFIGURE_TERMINAL
+
+    def exit_config_mode(self):
+        self.calls.append("exit_config_mode")
+        self.permission_level = PermissionLevel.ENABLE
+
+    def exit_enable_mode(self):
+        self.calls.append("exit_enable_mode")
+        self.permission_level = PermissionLevel.USER
+
+    def find_prompt(self) -> str:
+        self.calls.append("find_prompt")
+        return self.prompts[self.permission_level]
+
+    def send_config_set(self, commands, enter_config_mode, exit_config_mode):
+        return "\n".join(commands)
+
+
+@pytest.mark.parametrize("current_level, permission_level, transitions", [
+    (PermissionLevel.USER, PermissionLevel.CONFIGURE_TERMINAL, ["enable", "config_mode"]),
+    (PermissionLevel.CONFIGURE_TERMINAL, PermissionLevel.USER, ["exit_config_mode", "exit_enable_mode"]),
+    (PermissionLevel.CONFIGURE_TERMINAL, PermissionLevel.ENABLE, ["exit_config_mode"]),
+    (PermissionLevel.ENABLE, PermissionLevel.ENABLE, []),
+])
+def test_change_permission_uses_the_known_level(current_level, permission_level, transitions):
+    device = ModeDevice(current_level)
+    remember_permission_level(device, current_level)
+    change_permission(device, permission_level)
+
+    assert device.calls == transitions
+    assert device.permission_level == permission_level
+    assert get_permission_level(device) == permission_level
+
+
+def test_change_permission_reads_an_unknown_level_from_the_prompt_once():
+    device = ModeDevice(PermissionLevel.CONFIGURE_TERMINAL)
+    change_permission(device, PermissionLevel.ENABLE)
+    change_permission(device, PermissionLevel.USER)
+    change_permission(device, PermissionLevel.ENABLE)
+
+    assert device.calls == ["find_prompt", "exit_config_mode", "exit_enable_mode", "enable"]
+
+
+def test_change_permission_probes_only_an_ambiguous_prompt():
+    device = ModeDevice(PermissionLevel.ENABLE, {PermissionLevel.ENABLE: "admin@fw$"})
+    change_permission(device, PermissionLevel.ENABLE)
+    change_permission(device, PermissionLevel.ENABLE)
+
+    assert device.calls == ["find_prompt", "check_enable_mode", "check_config_mode"]
+
+
+@pytest.mark.parametrize("prompt, permission_level", [
+    ("r1>", PermissionLevel.USER),
+    ("r1#", PermissionLevel.ENABLE),
+    ("r1(config-if)#", PermissionLevel.CONFIGURE_TERMINAL),
+    ("<huawei>", None),
+    ("admin@fw$", None),
+])
+def test_permission_level_from_prompt(prompt, permission_level):
+    assert permission_level_from_prompt(prompt) == permission_level
+
+
+def test_the_login_prompt_is_reused_by_the_commands():
+    device = FakeDevice(REPLIES)
+    assert get_permission_level(device) == PermissionLevel.ENABLE
+    send_commands(device, ["show clock"])
+
+    assert device.find_prompt_calls == 1
+
+
+def test_mode_changing_config_commands_forget_the_level():
+    device = ModeDevice(PermissionLevel.CONFIGURE_TERMINAL)
+    remember_permission_level(device, PermissionLevel.CONFIGURE_TERMINAL)
+    send_config_commands(device, ["interface vlan 1", "end"])
+    device.permission_level = PermissionLevel.ENABLE
+
+    assert get_permission_level(device) == PermissionLevel.ENABLE
+
+
+@pytest.mark.parametrize("drops_typeahead", [False, True])
+def test_pipelined_output_matches_send_commands(drops_typeahead):
+    commands = ["show version", "show clock", "show version"]
+    device = PipelineDevice(REPLIES, drops_typeahead)
+
+    assert send_commands_pipelined(device, commands) == send_commands(FakeDevice(REPLIES), commands)
+    assert device.writes == 1
+
+
+def test_only_read_only_commands_are_pipelined():
+    assert can_pipeline(["show version", "sh clock", "dir flash:"], "cisco_ios")
+    assert not can_pipeline(["show version", "clear counters"], "cisco_ios")
+    assert not can_pipeline(["show version"], "cisco_ios")
+
+
+def test_only_devices_that_accept_comments_pipeline():
+    assert can_pipeline(["show version", "show clock"], "arista_eos")
+    assert can_pipeline(["show version", "show clock"], "cisco_ios_telnet")
+    assert not can_pipeline(["display version", "display clock"], "huawei")
+    assert not can_pipeline(["display version", "display clock"], "hp_comware")
+
+
+class FakeTransport:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_abort_session_closes_the_transport(monkeypatch):
+    class FakeConnection:
+        def __init__(self, **device_options):
+            self.remote_conn = FakeTransport()
+
+        def check_enable_mode(self):
+            return True
+
+        def disconnect(self):
+            pass
+
+    monkeypatch.setattr(netmiko, "ConnectHandler", FakeConnection)
+    device_options = {"host": "192.168.0.1"}
+    with session_scope("r1"):
+        with Connection(device_options) as device:
+            abort_session("r1")
+            assert device.remote_conn.closed
+
+        with pytest.raises(SessionAbortedError):
+            with Connection(device_options):
+                pass
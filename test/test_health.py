@@ -0,0 +1,51 @@
+import netmiko
+
+from networkcommander.device import Device
+from networkcommander.deploy import DeviceTimeoutError
+from networkcommander.health import HealthStore, backoff_delay, is_transient
+
+DEVICE = Device("r1", "root", "1234", "192.168.0.1", "cisco_ios", {})
+
+
+def test_circuit_opens_after_consecutive_failures(tmp_path):
+    health_store = HealthStore(tmp_path / "health.json", threshold=2, cooldown=60)
+    health_store.record(DEVICE, netmiko.NetmikoTimeoutException("timed out"))
+    assert not health_store.is_open(DEVICE)
+    health_store.record(DEVICE, netmiko.NetmikoTimeoutException("timed out"))
+    assert health_store.is_open(DEVICE)
+
+    health_store.record(DEVICE)
+    assert not health_store.is_open(DEVICE)
+    assert health_store.get(DEVICE).consecutive_failures == 0
+
+
+def test_only_transient_errors_are_failures(tmp_path):
+    health_store = HealthStore(tmp_path / "health.json", threshold=1, cooldown=60)
+    health_store.record(DEVICE, netmiko.NetmikoAuthenticationException("wrong password"))
+    assert not health_store.is_open(DEVICE)
+    health_store.record(DEVICE, ConnectionResetError())
+    assert health_store.is_open(DEVICE)
+
+
+def test_timeouts_after_the_connect_phase_are_not_transient():
+    assert is_transient(netmiko.NetmikoTimeoutException("tcp connection timed out"))
+    assert is_transient(ConnectionRefusedError())
+    assert not is_transient(TimeoutError())
+    assert not is_transient(DeviceTimeoutError("r1 didn't finish within its time budget of 5 seconds"))
+    assert not is_transient(netmiko.ReadTimeout("the prompt never came back"))
+    assert not is_transient(EOFError())
+
+
+def test_health_outlives_the_run(tmp_path):
+    health_store = HealthStore(tmp_path / "health.json", threshold=1, cooldown=60)
+    health_store.record(DEVICE, netmiko.NetmikoTimeoutException("timed out"))
+    health_store.save()
+
+    loaded_health_store = HealthStore(tmp_path / "health.json", threshold=1, cooldown=60)
+    assert loaded_health_store.is_open(DEVICE)
+    assert loaded_health_store.get(DEVICE).last_error == "timed out"
+    assert loaded_health_store.partition([DEVICE]) == ([], [DEVICE])
+
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= backoff_delay(attempt, 1, 5) <= min(5, 2 ** attempt) for attempt in range(10))
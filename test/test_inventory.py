@@ -0,0 +1,160 @@
+import contextlib
+import sqlite3
+import stat
+
+import pytest
+
+from networkcommander.config import config
+from networkcommander.device import Device, DeviceType
+from networkcommander.inventory import KeepassInventory, open_inventory, create_inventory, get_inventory_path
+from networkcommander.sqlite_inventory import SqliteInventory
+
+MASTER_PASSWORD = "123"
+
+
+def get_device(name: str, host: str = "10.0.0.1") -> Device:
+    return Device(name, "root", f"{name}-password", host, DeviceType.CISCO_IOS, {"port": "22", "secret": "enable"})
+
+
+@pytest.fixture(autouse=True)
+def no_agent(monkeypatch):
+    monkeypatch.setitem(config, "use_keepass_agent", False)
+
+
+@pytest.fixture(params=["keepass", "sqlite"])
+def inventory_path(request, tmp_path, monkeypatch):
+    monkeypatch.setitem(config, "inventory_backend", request.param)
+    monkeypatch.setitem(config, "keepass_db_path", str(tmp_path / "db.kdbx"))
+    monkeypatch.setitem(config, "sqlite_db_path", str(tmp_path / "inventory.sqlite"))
+    monkeypatch.setitem(config, "keepass_password", MASTER_PASSWORD)
+    inventory_path = get_inventory_path()
+    create_inventory(inventory_path, MASTER_PASSWORD)
+    return inventory_path
+
+
+def test_devices_round_trip(inventory_path):
+    devices = [get_device("r1"), get_device("r2", "10.0.0.2"), get_device("r3", "10.0.0.3")]
+    with open_inventory() as inventory:
+        assert inventory.add_devices(devices, tags=["core"]) == devices
+        inventory.tag_devices("edge", ["r2"])
+
+    with open_inventory(read_only=True) as inventory:
+        assert inventory.get_devices() == devices
+        assert inventory.get_devices({"core", "edge"}) == [devices[1]]
+        assert inventory.get_devices({"core", "missing"}) == []
+        assert inventory.get_devices_by_names(["r3", "missing"]) == [devices[2]]
+        assert inventory.get_device_names() == {"r1", "r2", "r3"}
+        assert inventory.get_tags() == {"core", "edge"}
+        assert inventory.get_devices_by_names(["r2"])[0].tags == ("core", "edge")
+
+
+def test_batch_with_an_existing_device_adds_nothing(inventory_path):
+    with open_inventory() as inventory:
+        inventory.add_devices([get_device("r1")])
+
+    with open_inventory() as inventory:
+        with pytest.raises(LookupError):
+            inventory.add_devices([get_device("r2"), get_device("r1")])
+        assert inventory.get_device_names() == {"r1"}
+        assert inventory.add_devices([get_device("r2"), get_device("r1")], ignore_pre_existing=True) == [
+            get_device("r2")
+        ]
+
+
+def test_untag_and_remove_devices(inventory_path):
+    with open_inventory() as inventory:
+        inventory.add_devices([get_device("r1"), get_device("r2")], tags=["core"])
+        inventory.untag_devices("core", ["r1"])
+        with pytest.raises(ValueError):
+            inventory.untag_devices("core", ["r1"])
+        inventory.remove_devices(["r2"])
+
+    with open_inventory(read_only=True) as inventory:
+        assert inventory.get_devices() == [get_device("r1")]
+        assert inventory.get_tags() == set()
+
+
+def test_read_only_inventory_is_not_saved(inventory_path):
+    # a read only sqlite connection refuses the write, a read only keepass database is just never saved.
+    with contextlib.suppress(sqlite3.OperationalError):
+        with open_inventory(read_only=True) as inventory:
+            inventory.add_devices([get_device("r1")])
+
+    with open_inventory(read_only=True) as inventory:
+        assert inventory.get_devices() == []
+
+
+def test_failed_session_is_not_saved(inventory_path):
+    with pytest.raises(RuntimeError):
+        with open_inventory() as inventory:
+            inventory.add_devices([get_device("r1")])
+            raise RuntimeError("failed in the middle")
+
+    with open_inventory(read_only=True) as inventory:
+        assert inventory.get_devices() == []
+
+
+def test_keepass_backend_is_the_default():
+    assert config["inventory_backend"] == "keepass"
+    assert isinstance(open_inventory(), KeepassInventory)
+
+
+def test_sqlite_secrets_are_encrypted(tmp_path):
+    database_path = str(tmp_path / "inventory.sqlite")
+    with SqliteInventory(database_path, MASTER_PASSWORD) as inventory:
+        inventory.add_devices([get_device("r1")])
+
+    with sqlite3.connect(database_path) as connection:
+        name, host, password, optional_parameters = connection.execute(
+            "SELECT name, host, password, optional_parameters FROM devices"
+        ).fetchone()
+    assert (name, host) == ("r1", "10.0.0.1")
+    assert b"r1-password" not in password
+    assert b"enable" not in optional_parameters
+
+    with pytest.raises(PermissionError):
+        with SqliteInventory(database_path, "wrong", read_only=True):
+            pass
+
+
+def test_sqlite_database_is_only_readable_by_its_owner(tmp_path):
+    database_path = tmp_path / "inventory.sqlite"
+    with SqliteInventory(str(database_path), MASTER_PASSWORD):
+        pass
+
+    assert stat.S_IMODE(database_path.stat().st_mode) == 0o600
+
+
+def test_sqlite_secret_moved_to_another_row_does_not_decrypt(tmp_path):
+    database_path = str(tmp_path / "inventory.sqlite")
+    with SqliteInventory(database_path, MASTER_PASSWORD) as inventory:
+        inventory.add_devices([get_device("r1"), get_device("r2")])
+
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("UPDATE devices SET password = (SELECT password FROM devices WHERE name = 'r1')")
+
+    with SqliteInventory(database_path, MASTER_PASSWORD, read_only=True) as inventory:
+        assert inventory.get_devices_by_names(["r1"]) == [get_device("r1")]
+        with pytest.raises(ValueError):
+            inventory.get_devices_by_names(["r2"])
+
+
+def test_sqlite_queries_use_the_indexes(tmp_path):
+    database_path = str(tmp_path / "inventory.sqlite")
+    with SqliteInventory(database_path, MASTER_PASSWORD):
+        pass
+
+    with sqlite3.connect(database_path) as connection:
+        plans = {
+            column: " ".join(
+                str(row[-1]) for row in connection.execute(
+                    f"EXPLAIN QUERY PLAN SELECT * FROM devices WHERE {column} = ?", ("value",)
+                )
+            )
+            for column in ("name", "host", "device_type")
+        }
+        tag_plan = " ".join(str(row[-1]) for row in connection.execute(
+            "EXPLAIN QUERY PLAN SELECT device_id FROM device_tags WHERE tag = ?", ("core",)
+        ))
+    assert all("USING INDEX" in plan for plan in plans.values()), plans
+    assert "USING" in tag_plan and "INDEX" in tag_plan, tag_plan
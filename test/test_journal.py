@@ -0,0 +1,61 @@
+import pytest
+
+from networkcommander.config import config
+from networkcommander.device import Device
+from networkcommander.device_executer import PermissionLevel
+from networkcommander.journal import RunJournal
+
+DEVICES = [Device(f"r{index}", "root", "1234", f"192.168.0.{index}", "cisco_ios", {}) for index in range(4)]
+
+
+@pytest.fixture(autouse=True)
+def journal_directory(monkeypatch, tmp_path):
+    monkeypatch.setitem(config, "journal_directory", str(tmp_path))
+
+
+def interrupted_run(journal: RunJournal):
+    yield "ok", DEVICES[0], None
+    yield "", DEVICES[1], ConnectionError("unreachable")
+    raise KeyboardInterrupt()
+
+
+def test_resume_skips_the_devices_that_succeeded():
+    journal = RunJournal.create(["show clock"], PermissionLevel.USER, DEVICES)
+    with pytest.raises(KeyboardInterrupt):
+        for _ in journal.journal_results(interrupted_run(journal)):
+            pass
+
+    resumed_journal = RunJournal.resume(journal.run_id)
+    assert resumed_journal.commands == ["show clock"]
+    assert resumed_journal.permission_level == PermissionLevel.USER
+    assert resumed_journal.remaining_devices(DEVICES) == DEVICES[1:]
+
+    list(resumed_journal.journal_results([("ok", DEVICES[1], None), ("", DEVICES[0], ConnectionError("down"))]))
+    assert RunJournal.resume(journal.run_id).remaining_devices(DEVICES) == [DEVICES[0], DEVICES[2], DEVICES[3]]
+
+
+def test_resume_after_a_torn_write():
+    journal = RunJournal.create(["show clock"], PermissionLevel.USER, DEVICES)
+    list(journal.journal_results([("ok", DEVICES[0], None)]))
+    with open(journal.path, "a", encoding="utf-8") as journal_file:
+        journal_file.write('{"device": "r1", "ho')
+
+    resumed_journal = RunJournal.resume(journal.run_id)
+    list(resumed_journal.journal_results([("ok", DEVICES[2], None)]))
+    assert RunJournal.resume(journal.run_id).remaining_devices(DEVICES) == [DEVICES[1], DEVICES[3]]
+
+
+def test_resume_only_deploys_to_the_devices_of_the_run():
+    journal = RunJournal.create(["show clock"], PermissionLevel.USER, DEVICES[:3])
+    list(journal.journal_results([("ok", DEVICES[0], None)]))
+    other_device = Device("other", "root", "1234", "192.168.1.1", "cisco_ios", {})
+
+    resumed_journal = RunJournal.resume(journal.run_id)
+    assert resumed_journal.remaining_devices(DEVICES + [other_device]) == DEVICES[1:3]
+    with pytest.raises(LookupError):
+        resumed_journal.remaining_devices(DEVICES[1:])
+
+
+def test_resume_an_unknown_run():
+    with pytest.raises(FileNotFoundError):
+        RunJournal.resume("20240101-000000-000000")
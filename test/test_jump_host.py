@@ -0,0 +1,207 @@
+import concurrent.futures
+import socket
+import threading
+
+import netmiko
+import paramiko
+import pytest
+
+from networkcommander.config import config
+from networkcommander.device import Device
+from networkcommander.device_executer import open_session, PermissionLevel
+from networkcommander.jump_host import parse_jump_host, JumpHostPool
+from networkcommander import jump_host
+from networkcommander.ping import ping_banner
+from networkcommander.probe import probe_devices
+
+
+class Bastion(paramiko.ServerInterface):
+    """
+    a jump host that lets root in with the password 1234, and forwards every direct-tcpip channel.
+    """
+
+    def __init__(self, logins: list):
+        self._logins = logins
+        # the destination of every direct-tcpip channel by its id.
+        self.destinations = {}
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if (username, password) == ("root", "1234"):
+            self._logins.append(username)
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        self.destinations[chanid] = destination
+        return paramiko.OPEN_SUCCEEDED
+
+
+def forward(channel: paramiko.Channel, destination) -> None:
+    """
+    copy the bytes between the channel and a tcp connection to the destination, until either side closes.
+    """
+    try:
+        connection = socket.create_connection(destination, 5)
+    except OSError:
+        channel.close()
+        return
+
+    def pump(read, write):
+        try:
+            while True:
+                data = read(4096)
+                if not data:
+                    break
+                write(data)
+        except (OSError, EOFError):
+            pass
+        channel.close()
+        connection.close()
+
+    threading.Thread(target=pump, args=(channel.recv, connection.sendall), daemon=True).start()
+    threading.Thread(target=pump, args=(connection.recv, channel.sendall), daemon=True).start()
+
+
+@pytest.fixture
+def bastion():
+    """
+    a local ssh server acting as the jump host.
+    :return: the ssh string of the jump host, and the list of logins it accepted.
+    """
+    host_key = paramiko.RSAKey.generate(2048)
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    logins = []
+    transports = []
+
+    def serve_transport(transport: paramiko.Transport, server_interface: Bastion):
+        while transport.is_active():
+            channel = transport.accept(1)
+            if channel is not None:
+                forward(channel, server_interface.destinations.pop(channel.get_id()))
+
+    def serve():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(connection)
+            transport.add_server_key(host_key)
+            server_interface = Bastion(logins)
+            transport.start_server(server=server_interface)
+            transports.append(transport)
+            threading.Thread(target=serve_transport, args=(transport, server_interface), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"root@127.0.0.1:{server.getsockname()[1]}", logins
+    server.close()
+    for transport in transports:
+        transport.close()
+
+
+@pytest.fixture
+def jump_hosts(monkeypatch):
+    pool = JumpHostPool()
+    monkeypatch.setattr(jump_host, "jump_hosts", pool)
+    monkeypatch.setitem(config, "jump_host_password", "1234")
+    monkeypatch.setitem(config, "optional_parameters", {"ssh_strict": False, "system_host_keys": False})
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def router():
+    """
+    a device that is only reached through the jump host, it greets every connection with an ssh banner.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+
+    def greet():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            with connection:
+                connection.sendall(b"SSH-2.0-Router\r\n")
+
+    threading.Thread(target=greet, daemon=True).start()
+    yield server.getsockname()[1]
+    server.close()
+
+
+def test_parse_jump_host():
+    assert parse_jump_host("admin@bastion.lab:2222") == ("admin", "bastion.lab", 2222)
+    assert parse_jump_host("admin@bastion.lab") == ("admin", "bastion.lab", 22)
+    with pytest.raises(ValueError):
+        parse_jump_host("bastion.lab")
+
+
+def test_sessions_share_one_transport_to_the_jump_host(bastion, jump_hosts, router):
+    ssh_string, logins = bastion
+    device_options = {"host": "127.0.0.1", "port": str(router), "device_type": "cisco_ios", "jump_host": ssh_string}
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executer:
+        banners = list(executer.map(
+            lambda _: ping_banner(device_options, [], PermissionLevel.USER), range(8)
+        ))
+
+    assert banners == ["SSH-2.0-Router"] * 8
+    assert logins == ["root"]
+
+
+def test_wrong_jump_host_password(bastion, jump_hosts, router, monkeypatch):
+    ssh_string, _ = bastion
+    monkeypatch.setitem(config, "jump_host_password", "4321")
+    monkeypatch.setitem(config, "jump_host_key_file", "")
+    device_options = {"host": "127.0.0.1", "port": str(router), "device_type": "cisco_ios", "jump_host": ssh_string}
+
+    with pytest.raises(netmiko.NetmikoAuthenticationException):
+        ping_banner(device_options, [], PermissionLevel.USER)
+
+
+def test_open_session_passes_the_channel_to_netmiko(bastion, jump_hosts, router, monkeypatch):
+    ssh_string, _ = bastion
+    connections = []
+
+    class FakeConnection:
+        def __init__(self, **device_options):
+            connections.append(device_options)
+
+        def check_enable_mode(self):
+            return True
+
+    monkeypatch.setattr(netmiko, "ConnectHandler", FakeConnection)
+
+    open_session({"host": "127.0.0.1", "port": str(router), "device_type": "cisco_ios", "jump_host": ssh_string})
+
+    assert "jump_host" not in connections[0]
+    assert isinstance(connections[0]["sock"], paramiko.Channel)
+    assert connections[0]["sock"].recv(64) == b"SSH-2.0-Router\r\n"
+
+
+def test_jump_host_of_a_tag(monkeypatch):
+    monkeypatch.setitem(config, "jump_hosts", {"oob": "admin@bastion:22"})
+    tagged_device = Device("r1", "root", "1234", "10.0.0.1", "cisco_ios", {}, ("oob",))
+    own_jump_host_device = Device("r2", "root", "1234", "10.0.0.2", "cisco_ios", {"jump_host": "admin@other"}, ("oob",))
+
+    assert tagged_device.device_options["jump_host"] == "admin@bastion:22"
+    assert own_jump_host_device.device_options["jump_host"] == "admin@other"
+    assert "jump_host" not in Device("r3", "root", "1234", "10.0.0.3", "cisco_ios", {}).device_options
+
+
+def test_devices_behind_a_jump_host_are_not_probed(monkeypatch):
+    monkeypatch.setitem(config, "jump_hosts", {"oob": "admin@bastion:22"})
+    device = Device("r1", "root", "1234", "127.0.0.1", "cisco_ios", {"port": "1"}, ("oob",))
+
+    assert probe_devices([device], 1, 10) == ([device], [])
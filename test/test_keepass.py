@@ -1,5 +1,7 @@
+import gc
 import os.path
 import shutil
+import weakref
 
 import mimesis
 import pykeepass
@@ -7,7 +9,8 @@ import pytest
 
 from networkcommander.init import create_new_keepass_db
 from networkcommander.keepass import KeepassDB, add_device_entry, get_all_device_entries, get_device_tags, \
-    does_device_exist
+    does_device_exist, remove_device, get_devices_by_host, get_device_index, add_device_entries, entry_to_device, \
+    get_device
 from mocks import get_test_device, get_tag_list, POSSIBLE_TAGS
 
 KEEPASS_PASSWORD = "123"
@@ -135,3 +138,94 @@ class TestKeepass:
 
         entry = generic.random.choice(kp.entries)
         assert does_device_exist(kp, entry.title)
+
+    def test_read_only_db_is_not_saved(self, populated_db, tmp_path):
+        test_db = str(tmp_path / "read_only.kdbx")
+        shutil.copyfile(populated_db, test_db)
+        with open(test_db, "rb") as db_file:
+            content = db_file.read()
+
+        with KeepassDB(test_db, KEEPASS_PASSWORD, read_only=True) as kp:
+            add_device_entry(kp, get_test_device())
+
+        with open(test_db, "rb") as db_file:
+            assert db_file.read() == content
+
+    def test_read_only_db_has_to_exist(self, tmp_path):
+        missing_db = str(tmp_path / "missing_db.kdbx")
+        with pytest.raises(FileNotFoundError):
+            with KeepassDB(missing_db, KEEPASS_PASSWORD, read_only=True):
+                pass
+        assert not os.path.isfile(missing_db)
+
+    def test_db_is_only_saved_when_it_changed(self, populated_db, tmp_path):
+        test_db = str(tmp_path / "dirty.kdbx")
+        shutil.copyfile(populated_db, test_db)
+        with open(test_db, "rb") as db_file:
+            content = db_file.read()
+
+        with KeepassDB(test_db, KEEPASS_PASSWORD) as kp:
+            get_all_device_entries(kp)
+        with open(test_db, "rb") as db_file:
+            assert db_file.read() == content
+
+        device = get_test_device()
+        with KeepassDB(test_db, KEEPASS_PASSWORD) as kp:
+            add_device_entry(kp, device)
+        with KeepassDB(test_db, KEEPASS_PASSWORD, read_only=True) as kp:
+            assert does_device_exist(kp, device.name)
+
+    def test_device_index_follows_added_and_removed_devices(self, populated_db, tmp_path):
+        test_db = str(tmp_path / "index.kdbx")
+        shutil.copyfile(populated_db, test_db)
+        kp = pykeepass.PyKeePass(test_db, KEEPASS_PASSWORD)
+        device = get_test_device()
+
+        assert not does_device_exist(kp, device.name)
+        add_device_entry(kp, device)
+        assert does_device_exist(kp, device.name)
+        assert device in get_devices_by_host(kp, device.host)
+        assert get_device_index(kp) is get_device_index(kp)
+
+        remove_device(kp, device.name)
+        assert not does_device_exist(kp, device.name)
+        assert device not in get_devices_by_host(kp, device.host)
+        assert not kp.find_entries(title=device.name)
+
+    def test_device_index_is_dropped_with_the_connection(self, populated_db, tmp_path):
+        test_db = str(tmp_path / "index_lifetime.kdbx")
+        shutil.copyfile(populated_db, test_db)
+        with KeepassDB(test_db, KEEPASS_PASSWORD, read_only=True) as kp:
+            get_device_index(kp)
+        connection = weakref.ref(kp)
+        del kp
+        gc.collect()
+
+        assert connection() is None
+
+    def test_device_index_matches_the_database(self, populated_db):
+        kp = pykeepass.PyKeePass(populated_db, KEEPASS_PASSWORD)
+        index = get_device_index(kp)
+        for entry in kp.find_entries(group=kp.find_groups(name="device", first=True)):
+            assert entry in index.get_by_title(entry.title)
+            assert entry in index.get_by_host(entry.get_custom_property("host"))
+
+    def test_add_device_entries(self, populated_db, tmp_path):
+        test_db = str(tmp_path / "bulk.kdbx")
+        shutil.copyfile(populated_db, test_db)
+        kp = pykeepass.PyKeePass(test_db, KEEPASS_PASSWORD)
+        existing_device = entry_to_device(kp.find_groups(name="device", first=True).entries[0])
+        new_devices = [get_test_device() for _ in range(50)]
+        new_devices = list({device.name: device for device in new_devices}.values())
+        entry_count = len(kp.entries)
+
+        # a batch with a device that is already in the db doesn't add anything.
+        with pytest.raises(LookupError):
+            add_device_entries(kp, new_devices + [existing_device])
+        assert len(kp.entries) == entry_count
+
+        added_devices = add_device_entries(kp, new_devices + [existing_device, new_devices[0]], ignore_pre_existing=True)
+        assert added_devices == new_devices
+        assert len(kp.entries) == entry_count + len(new_devices)
+        for device in new_devices:
+            assert get_device(kp, device.name) == device
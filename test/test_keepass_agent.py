@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+import pytest
+
+from networkcommander.config import config
+from networkcommander.keepass import KeepassDB
+from networkcommander.keepass_agent import KeyStore, serve_agent, is_agent_running, lock_agent, stop_agent, \
+    get_database_key
+
+KEEPASS_PASSWORD = "123"
+
+
+def test_keys_expire():
+    key_store = KeyStore(lifetime=0.05)
+    key_store.add("db.kdbx", b"key")
+    assert key_store.get("db.kdbx") == b"key"
+    time.sleep(0.1)
+    assert key_store.get("db.kdbx") is None
+    assert len(key_store) == 0
+
+
+@pytest.fixture
+def agent(monkeypatch, tmp_path):
+    socket_path = str(tmp_path / "agent.sock")
+    monkeypatch.setitem(config, "keepass_agent_socket", socket_path)
+    monkeypatch.setitem(config, "use_keepass_agent", True)
+    threading.Thread(target=serve_agent, args=(socket_path, 300), daemon=True).start()
+    for _ in range(100):
+        if is_agent_running(socket_path):
+            break
+        time.sleep(0.01)
+    yield socket_path
+    if is_agent_running(socket_path):
+        stop_agent(socket_path)
+
+
+def refuse_to_prompt():
+    raise AssertionError("the master password was prompted for")
+
+
+def test_database_is_unlocked_once(agent, tmp_path, monkeypatch):
+    database_path = str(tmp_path / "db.kdbx")
+    with KeepassDB(database_path, KEEPASS_PASSWORD) as kp:
+        kp.add_group(kp.root_group, "device")
+    # the first unlock with the master password hands the key to the agent.
+    with KeepassDB(database_path, KEEPASS_PASSWORD) as kp:
+        kp.add_group(kp.root_group, "tags")
+
+    monkeypatch.setattr(KeepassDB, "prompt_for_password", staticmethod(refuse_to_prompt))
+    # the database was saved since the agent got its key, and the key still unlocks it.
+    for _ in range(2):
+        with KeepassDB(database_path, None) as kp:
+            assert kp.find_groups(name="device")
+
+    lock_agent(agent)
+    assert get_database_key(agent, database_path) is None
+    with pytest.raises(AssertionError):
+        with KeepassDB(database_path, None):
+            pass
+
+
+def test_stopped_agent_removes_its_socket(agent):
+    stop_agent(agent)
+    for _ in range(100):
+        if not os.path.exists(agent):
+            break
+        time.sleep(0.01)
+    assert not is_agent_running(agent)
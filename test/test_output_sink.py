@@ -0,0 +1,60 @@
+import io
+
+from networkcommander.device import Device
+from networkcommander.output_sink import StreamOutputSink, FileSinkFactory, CallbackOutputSink, TeeOutputSink, \
+    flush_open_file_sinks
+
+
+def test_stream_sink_writes_whole_prefixed_lines():
+    stream = io.StringIO()
+    output_sink = StreamOutputSink(stream, "r1: ")
+
+    output_sink.write("first li")
+    assert stream.getvalue() == ""
+    output_sink.write("ne\nsecond line\nthi")
+    assert stream.getvalue() == "r1: first line\nr1: second line\n"
+    output_sink.close()
+    assert stream.getvalue() == "r1: first line\nr1: second line\nr1: thi\n"
+
+
+def test_file_sink_factory(tmp_path):
+    device = Device("r1", "root", "1234", "1.1.1.1", "cisco_ios", {})
+    output_sink_factory = FileSinkFactory(tmp_path)
+
+    output_sink = output_sink_factory(device)
+    output_sink.write("show version\n")
+    output_sink.write("Cisco IOS")
+    output_sink.close()
+
+    assert output_sink_factory.get_path(device) == tmp_path / "r1.txt"
+    assert (tmp_path / "r1.txt").read_text(encoding="utf-8") == "show version\nCisco IOS"
+
+
+def test_callback_sink():
+    chunks = []
+    output_sink = CallbackOutputSink(chunks.append)
+    output_sink.write("a")
+    output_sink.write("b")
+    output_sink.close()
+    assert chunks == ["a", "b"]
+
+
+def test_tee_sink_keeps_a_copy():
+    chunks = []
+    output_sink = TeeOutputSink(CallbackOutputSink(chunks.append))
+    output_sink.write("a")
+    output_sink.write("b")
+    output_sink.close()
+    assert chunks == ["a", "b"]
+    assert output_sink.getvalue() == "ab"
+
+
+def test_open_file_sinks_are_flushed(tmp_path):
+    device = Device("r1", "root", "1234", "1.1.1.1", "cisco_ios", {})
+    output_sink = FileSinkFactory(tmp_path)(device)
+    output_sink.write("show version\n")
+
+    flush_open_file_sinks()
+
+    assert (tmp_path / "r1.txt").read_text(encoding="utf-8") == "show version\n"
+    output_sink.close()
@@ -0,0 +1,71 @@
+import socket
+import threading
+
+import netmiko
+import pytest
+
+from networkcommander.device_executer import PermissionLevel
+from networkcommander.ping import get_device_port, ping_banner, is_enabled, PingMode, get_ping_executer, \
+    ping_authentication
+
+
+@pytest.fixture
+def ssh_banner_server():
+    """
+    a server that greets every connection like an ssh server would, and then closes it.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+
+    def greet():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            with connection:
+                connection.sendall(b"welcome to the lab\r\nSSH-2.0-OpenSSH_9.6\r\n")
+
+    threading.Thread(target=greet, daemon=True).start()
+    yield server.getsockname()[1]
+    server.close()
+
+
+def test_ping_banner(ssh_banner_server):
+    device_options = {"host": "127.0.0.1", "port": str(ssh_banner_server), "device_type": "cisco_ios"}
+    assert ping_banner(device_options, [], PermissionLevel.USER) == "SSH-2.0-OpenSSH_9.6"
+
+
+def test_ping_closed_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as closed:
+        closed.bind(("127.0.0.1", 0))
+        port = closed.getsockname()[1]
+    device_options = {
+        "host": "127.0.0.1", "port": str(port), "device_type": "cisco_ios", "username": "root", "password": "1"
+    }
+    with pytest.raises(netmiko.NetmikoTimeoutException):
+        ping_banner(device_options, [], PermissionLevel.USER)
+    with pytest.raises(netmiko.NetmikoTimeoutException):
+        ping_authentication(device_options, [], PermissionLevel.USER)
+
+
+@pytest.mark.parametrize(("device_options", "port"), [
+    ({"device_type": "cisco_ios"}, 22),
+    ({"device_type": "cisco_ios_telnet"}, 23),
+    ({"device_type": "cisco_ios", "port": "2222"}, 2222),
+])
+def test_get_device_port(device_options: dict, port: int):
+    assert get_device_port(device_options) == port
+
+
+@pytest.mark.parametrize(("value", "enabled"), [
+    (True, True), (False, False), ("True", True), ("False", False), ("", False), (None, False)
+])
+def test_is_enabled(value, enabled: bool):
+    assert is_enabled(value) == enabled
+
+
+def test_login_mode_uses_the_default_executer():
+    assert get_ping_executer(PingMode.LOGIN) is None
+    assert get_ping_executer(PingMode.BANNER) is ping_banner
@@ -0,0 +1,33 @@
+import socket
+
+import netmiko
+import pytest
+
+from networkcommander.device import Device
+from networkcommander.probe import probe_devices
+
+
+@pytest.fixture
+def listening_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        yield server.getsockname()[1]
+
+
+@pytest.fixture
+def closed_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe_socket:
+        probe_socket.bind(("127.0.0.1", 0))
+        return probe_socket.getsockname()[1]
+
+
+def test_probe_devices(listening_port, closed_port):
+    up = Device("up", "root", "1234", "127.0.0.1", "cisco_ios", {"port": str(listening_port)})
+    down = Device("down", "root", "1234", "127.0.0.1", "cisco_ios", {"port": str(closed_port)})
+
+    reachable, unreachable = probe_devices([up, down], timeout=2, max_connections=10)
+
+    assert reachable == [up]
+    assert [device for device, _ in unreachable] == [down]
+    assert isinstance(unreachable[0][1], netmiko.NetmikoTimeoutException)
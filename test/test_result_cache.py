@@ -0,0 +1,59 @@
+import os
+import time
+
+from networkcommander.device import Device
+from networkcommander.device_executer import PermissionLevel
+from networkcommander.result_cache import ResultCache, CachedOutput, split_command_outputs
+
+DEVICE = Device("r1", "root", "1234", "192.168.0.1", "cisco_ios", {})
+OUTPUT = "r1#show version\nCisco IOS Software\nVersion 15.2\nr1#show clock\n*12:00:00.000 UTC\n"
+
+
+def test_output_is_served_per_command(tmp_path):
+    result_cache = ResultCache(tmp_path, ttl=60, max_size=1024 * 1024)
+    assert result_cache.set_output(DEVICE, ["show version", "show clock"], PermissionLevel.USER, OUTPUT)
+
+    output = result_cache.get_output(DEVICE, ["show version", "show clock"], PermissionLevel.USER)
+    assert output == OUTPUT
+    assert isinstance(output, CachedOutput)
+    assert result_cache.get_output(DEVICE, ["show clock"], PermissionLevel.USER) == "r1#show clock\n*12:00:00.000 UTC\n"
+    assert result_cache.get_output(DEVICE, ["show clock", "show ip route"], PermissionLevel.USER) is None
+    assert result_cache.get_output(DEVICE, ["show clock"], PermissionLevel.ENABLE) is None
+    other_host = Device("r1", "root", "1234", "192.168.0.2", "cisco_ios", {})
+    assert result_cache.get_output(other_host, ["show clock"], PermissionLevel.USER) is None
+
+
+def test_expired_output_is_not_served(tmp_path):
+    result_cache = ResultCache(tmp_path, ttl=0, max_size=1024 * 1024)
+    result_cache.set_output(DEVICE, ["show version", "show clock"], PermissionLevel.USER, OUTPUT)
+    time.sleep(0.01)
+    assert result_cache.get_output(DEVICE, ["show clock"], PermissionLevel.USER) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    result_cache = ResultCache(tmp_path, ttl=60, max_size=200)
+    paths = []
+    for index in range(3):
+        result_cache.set(DEVICE, f"show interface {index}", PermissionLevel.USER, "x" * 40)
+        path, = set(tmp_path.iterdir()) - set(paths)
+        paths.append(path)
+        os.utime(path, (time.time() - 10 + index, time.time() - 10 + index))
+    result_cache.get(DEVICE, "show interface 0", PermissionLevel.USER)
+    result_cache.evict()
+
+    assert result_cache.get(DEVICE, "show interface 0", PermissionLevel.USER) is not None
+    assert result_cache.get(DEVICE, "show interface 1", PermissionLevel.USER) is None
+    assert result_cache.get(DEVICE, "show interface 2", PermissionLevel.USER) is not None
+
+
+def test_only_read_only_commands_are_cacheable():
+    assert ResultCache.is_cacheable(["show version", "show clock"], PermissionLevel.ENABLE)
+    assert not ResultCache.is_cacheable(["show version", "clear counters"], PermissionLevel.ENABLE)
+    assert not ResultCache.is_cacheable(["show version"], PermissionLevel.CONFIGURE_TERMINAL)
+
+
+def test_split_command_outputs():
+    assert split_command_outputs(OUTPUT, ["show version", "show clock"]) == [
+        "r1#show version\nCisco IOS Software\nVersion 15.2\n", "r1#show clock\n*12:00:00.000 UTC\n"
+    ]
+    assert split_command_outputs(OUTPUT, ["show version", "show ip route"]) is None
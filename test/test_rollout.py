@@ -0,0 +1,51 @@
+from typing import List
+
+import pytest
+
+from networkcommander import deploy
+from networkcommander.device import Device
+from networkcommander.device_executer import PermissionLevel
+from networkcommander.rollout import deploy_in_waves, split_into_waves, parse_amount, RolloutHaltedError
+
+DEVICES = [Device(f"r{index}", "root", "1234", f"192.168.0.{index}", "cisco_ios", {}) for index in range(200)]
+
+
+def fake_execute_commands(device_options: dict, commands: List[str], permission_level: PermissionLevel) -> str:
+    if device_options["host"] in ("192.168.0.5", "192.168.0.6"):
+        raise ConnectionError(f"{device_options['host']} rejected the configuration")
+    return "ok"
+
+
+@pytest.fixture
+def fake_executer(monkeypatch):
+    monkeypatch.setattr(deploy, "execute_commands", fake_execute_commands)
+
+
+def test_parse_amount():
+    assert parse_amount("1%", 200) == 2
+    assert parse_amount("1%", 50) == 1
+    assert parse_amount("7", 200) == 7
+    with pytest.raises(ValueError):
+        parse_amount("-1", 200)
+
+
+def test_split_into_waves():
+    waves = split_into_waves(DEVICES, ["1%", "10%"])
+    assert [len(wave) for wave in waves] == [2, 20, 178]
+    assert sum(waves, []) == DEVICES
+    assert split_into_waves(DEVICES[:3], ["0", "5", "10"]) == [DEVICES[:1], DEVICES[1:3]]
+
+
+def test_rollout_stops_after_a_failed_wave(fake_executer):
+    results = list(deploy_in_waves(["hostname r1"], DEVICES, PermissionLevel.USER, ["1%", "10%"], "1"))
+
+    assert len(results) == len(DEVICES)
+    deployed_devices = [device for _, device, exception in results if not isinstance(exception, RolloutHaltedError)]
+    assert sorted(deployed_devices, key=DEVICES.index) == DEVICES[:22]
+
+
+def test_rollout_continues_below_the_threshold(fake_executer):
+    results = list(deploy_in_waves(["hostname r1"], DEVICES, PermissionLevel.USER, ["1%", "10%"], "10%"))
+
+    assert not any(isinstance(exception, RolloutHaltedError) for _, _, exception in results)
+    assert sum(exception is not None for _, _, exception in results) == 2
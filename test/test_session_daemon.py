@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+
+import netmiko
+import pytest
+
+from networkcommander import session_daemon
+from networkcommander.device_executer import PermissionLevel
+from networkcommander.output_sink import CallbackOutputSink
+from networkcommander.session_daemon import SessionPool, daemon_executer, is_daemon_running, stop_daemon, serve
+
+
+class FakeConnection:
+    connections = 0
+
+    def __init__(self, **device_options):
+        if device_options["host"] == "unreachable":
+            raise netmiko.NetmikoTimeoutException(f"{device_options['host']} timed out")
+        FakeConnection.connections += 1
+        self.alive = True
+
+    def check_enable_mode(self):
+        return True
+
+    def is_alive(self):
+        return self.alive
+
+    def disconnect(self):
+        self.alive = False
+
+
+def fake_run_commands(device, commands, permission_level, output_sink=None):
+    output = f"{permission_level.value}:{','.join(commands)}"
+    if output_sink is None:
+        return output
+    for command in commands:
+        output_sink.write(f"{command}\n")
+    return ""
+
+
+@pytest.fixture
+def fake_netmiko(monkeypatch):
+    FakeConnection.connections = 0
+    monkeypatch.setattr(session_daemon.netmiko, "ConnectHandler", FakeConnection)
+    monkeypatch.setattr(session_daemon, "run_commands", fake_run_commands)
+
+
+DEVICE_OPTIONS = {"host": "1.1.1.1", "username": "root", "password": "1234", "device_type": "cisco_ios"}
+
+
+def test_pool_reuses_sessions(fake_netmiko):
+    session_pool = SessionPool(idle_timeout=300)
+    for _ in range(3):
+        assert session_pool.run_commands(DEVICE_OPTIONS, ["show clock"], PermissionLevel.USER) == "user:show clock"
+    assert FakeConnection.connections == 1
+    assert len(session_pool) == 1
+
+
+def test_pool_reuses_sessions_with_other_connect_timeouts(fake_netmiko):
+    session_pool = SessionPool(idle_timeout=300)
+    for conn_timeout in (4.5, 3.2):
+        device_options = {**DEVICE_OPTIONS, "conn_timeout": conn_timeout}
+        session_pool.run_commands(device_options, ["show clock"], PermissionLevel.USER)
+    assert FakeConnection.connections == 1
+
+
+def test_pool_evicts_idle_sessions(fake_netmiko):
+    session_pool = SessionPool(idle_timeout=0)
+    session_pool.run_commands(DEVICE_OPTIONS, [], PermissionLevel.USER)
+    time.sleep(0.01)
+    session_pool.evict_idle_sessions()
+    assert len(session_pool) == 0
+
+    session_pool.run_commands(DEVICE_OPTIONS, [], PermissionLevel.USER)
+    assert FakeConnection.connections == 2
+
+
+def test_dropped_sessions_take_their_lock_with_them(fake_netmiko):
+    session_pool = SessionPool(idle_timeout=0)
+    with pytest.raises(netmiko.NetmikoTimeoutException):
+        session_pool.run_commands({**DEVICE_OPTIONS, "host": "unreachable"}, [], PermissionLevel.USER)
+    session_pool.run_commands(DEVICE_OPTIONS, [], PermissionLevel.USER)
+    time.sleep(0.01)
+    session_pool.evict_idle_sessions()
+
+    assert session_pool._session_locks == {}
+
+
+def test_a_session_is_used_by_one_request_at_a_time(fake_netmiko, monkeypatch):
+    running = []
+    most_running = []
+    lock = threading.Lock()
+
+    def counting_run_commands(device, commands, permission_level, output_sink=None):
+        with lock:
+            running.append(device)
+            most_running.append(running.count(device))
+        time.sleep(0.001)
+        with lock:
+            running.remove(device)
+        return ""
+
+    monkeypatch.setattr(session_daemon, "run_commands", counting_run_commands)
+    session_pool = SessionPool(idle_timeout=0)
+    stop_eviction = threading.Event()
+
+    def evict_constantly():
+        while not stop_eviction.is_set():
+            session_pool.evict_idle_sessions()
+
+    eviction_thread = threading.Thread(target=evict_constantly)
+    eviction_thread.start()
+    threads = [
+        threading.Thread(target=lambda: [
+            session_pool.run_commands(DEVICE_OPTIONS, [], PermissionLevel.USER) for _ in range(20)
+        ])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop_eviction.set()
+    eviction_thread.join()
+
+    assert len(most_running) == 160
+    assert max(most_running) == 1
+
+
+def test_daemon_round_trip(fake_netmiko, tmp_path):
+    socket_path = str(tmp_path / "sessions.sock")
+    server_thread = threading.Thread(target=serve, args=(socket_path, 300), daemon=True)
+    server_thread.start()
+    for _ in range(100):
+        if is_daemon_running(socket_path):
+            break
+        time.sleep(0.01)
+
+    execute_commands = daemon_executer(socket_path)
+    assert execute_commands(DEVICE_OPTIONS, ["show version"], PermissionLevel.ENABLE) == "enable:show version"
+    chunks = []
+    output_sink = CallbackOutputSink(chunks.append)
+    assert execute_commands(DEVICE_OPTIONS, ["show version", "show clock"], PermissionLevel.USER, output_sink) == ""
+    assert chunks == ["show version\n", "show clock\n"]
+    with pytest.raises(netmiko.NetmikoTimeoutException):
+        execute_commands({**DEVICE_OPTIONS, "host": "unreachable"}, [], PermissionLevel.USER)
+
+    stop_daemon(socket_path)
+    server_thread.join(timeout=5)
+    assert not server_thread.is_alive()
+    assert not os.path.exists(socket_path)